@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Harden multiple blocks in parallel
+
+The blocks and their dependencies are taken from the OpenLane configs:
+every "dir::../../lef/<block>.lef" in EXTRA_LEFS means that <block>
+has to be hardened first. Independent blocks are started as soon as
+enough cores (ROUTING_CORES) and memory (Peak_Memory_Usage_MB of the
+last signoff run) are available, longest job first.
+
+A block is a directory with a config.json, variants of a design such
+as leosoc_banked share the DESIGN_NAME and thus the LEF and signoff.
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+OPENLANE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(OPENLANE_DIR)
+SIGNOFF_DIR = os.path.join(PROJECT_DIR, 'signoff')
+LEF_DIR = os.path.join(PROJECT_DIR, 'lef')
+GENERATE_TRNGS = os.path.join(PROJECT_DIR, 'verilog/rtl/trng_configs/generate_trngs.py')
+
+# Used if a block has never been hardened
+DEFAULT_RUNTIME = 3600      # s
+DEFAULT_MEMORY = 4096       # MB
+DEFAULT_ROUTING_CORES = 1
+
+def load_trng_configs():
+    """Import the config table of generate_trngs.py"""
+    spec = importlib.util.spec_from_file_location('generate_trngs', GENERATE_TRNGS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return [module.trng_name(config) for config in module.configs]
+
+def parse_runtime(runtime):
+    """Convert an OpenLane runtime like 1h17m57s0ms to seconds"""
+    match = re.fullmatch(r'(\d+)h(\d+)m(\d+)s(\d+)ms', runtime.strip())
+    if not match:
+        return None
+    hours, minutes, seconds, milliseconds = (int(group) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000
+
+def load_metrics(block):
+    """Return (runtime, peak memory) of the last signoff run"""
+    runtime = DEFAULT_RUNTIME
+    memory = DEFAULT_MEMORY
+
+    path = os.path.join(SIGNOFF_DIR, block, 'metrics.csv')
+    if not os.path.isfile(path):
+        return runtime, memory
+
+    with open(path, newline='') as reader:
+        rows = list(csv.DictReader(reader))
+
+    if rows:
+        row = rows[-1]
+        runtime = parse_runtime(row.get('total_runtime', '')) or runtime
+        try:
+            if float(row['Peak_Memory_Usage_MB']) > 0:
+                memory = float(row['Peak_Memory_Usage_MB'])
+        except (KeyError, ValueError):
+            pass
+
+    return runtime, memory
+
+class Block:
+
+    def __init__(self, name):
+        self.name = name
+        self.directory = os.path.join(OPENLANE_DIR, name)
+
+        with open(os.path.join(self.directory, 'config.json')) as reader:
+            self.config = json.load(reader)
+
+        self.design = self.config.get('DESIGN_NAME', name)
+        self.cores = int(self.config.get('ROUTING_CORES', DEFAULT_ROUTING_CORES))
+        self.runtime, self.memory = load_metrics(self.design)
+
+        # Hardened blocks used as macros
+        self.dependencies = []
+        for lef in self.config.get('EXTRA_LEFS', []):
+            match = re.fullmatch(r'dir::\.\./\.\./lef/(.+)\.lef', lef)
+            if match and os.path.isfile(os.path.join(OPENLANE_DIR, match.group(1), 'config.json')):
+                self.dependencies.append(match.group(1))
+
+        self.dependents = []
+        self.priority = 0
+
+    def inputs(self):
+        """All files the result of the hardening depends on"""
+        files = []
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if os.path.isfile(path):
+                files.append(path)
+
+        for key in ['VERILOG_FILES', 'VERILOG_FILES_BLACKBOX']:
+            for path in self.config.get(key, []):
+                if path.startswith('dir::'):
+                    files.append(os.path.normpath(os.path.join(self.directory, path[len('dir::'):])))
+        return files
+
+    def output(self):
+        return os.path.join(LEF_DIR, f'{self.design}.lef')
+
+def build_graph(targets):
+    """Collect all blocks needed for the targets"""
+    blocks = {}
+    pending = list(targets)
+
+    while pending:
+        name = pending.pop()
+        if name in blocks:
+            continue
+        if not os.path.isfile(os.path.join(OPENLANE_DIR, name, 'config.json')):
+            sys.exit(f'Error: no OpenLane config for {name}')
+        blocks[name] = Block(name)
+        pending.extend(blocks[name].dependencies)
+
+    for block in blocks.values():
+        for dependency in block.dependencies:
+            blocks[dependency].dependents.append(block.name)
+
+    # Priority is the runtime of the longest path to the end of the graph
+    def priority(name, visiting=()):
+        if name in visiting:
+            sys.exit(f'Error: dependency cycle at {name}')
+        block = blocks[name]
+        if not block.priority:
+            block.priority = block.runtime + max([priority(dependent, visiting + (name,))
+                                                  for dependent in block.dependents], default=0)
+        return block.priority
+
+    for name in blocks:
+        priority(name)
+
+    return blocks
+
+def is_up_to_date(block, rebuilt):
+    """A block is up to date if its LEF is newer than all of its inputs"""
+    if any(dependency in rebuilt for dependency in block.dependencies):
+        return False
+
+    output = block.output()
+    if not os.path.isfile(output):
+        return False
+
+    inputs = block.inputs() + [os.path.join(LEF_DIR, f'{dependency}.lef') for dependency in block.dependencies]
+    newest = max((os.path.getmtime(path) for path in inputs if os.path.isfile(path)), default=0)
+
+    return os.path.getmtime(output) >= newest
+
+def available_memory():
+    """Available memory in MB"""
+    try:
+        with open('/proc/meminfo') as reader:
+            for line in reader:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('inf')
+
+def run_block(block, log_dir):
+    start = time.time()
+    with open(os.path.join(log_dir, f'{block.name}.log'), 'w') as log:
+        process = subprocess.run(['make', block.name], cwd=OPENLANE_DIR,
+                                 stdout=log, stderr=subprocess.STDOUT)
+    return start, time.time(), process.returncode
+
+def main():
+    parser = argparse.ArgumentParser(description='Harden blocks in parallel, respecting their dependencies.')
+    parser.add_argument('targets', nargs='*', default=['user_project_wrapper'],
+                        help='blocks to harden, including their dependencies (default: user_project_wrapper)')
+    parser.add_argument('-j', '--cores', type=int, default=os.cpu_count(),
+                        help='number of cores to use (default: all)')
+    parser.add_argument('-m', '--memory', type=float, default=available_memory(),
+                        help='memory in MB to use (default: available memory)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='harden all blocks, even if they are up to date')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='only print the blocks that would be hardened')
+    parser.add_argument('--log-dir', default=os.path.join(OPENLANE_DIR, 'logs'),
+                        help='directory for the logs of the jobs')
+    args = parser.parse_args()
+
+    blocks = build_graph(args.targets)
+
+    # Check that the TRNG table and the OpenLane configs agree
+    for name in load_trng_configs():
+        if not os.path.isdir(os.path.join(OPENLANE_DIR, name)):
+            print(f'Warning: {name} is in generate_trngs.py but has no OpenLane config')
+
+    # Determine which blocks need to be hardened, dependencies first
+    stale = set()
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dependency in blocks[name].dependencies:
+            visit(dependency)
+        order.append(name)
+
+    for name in sorted(blocks):
+        visit(name)
+
+    for name in order:
+        if args.force or not is_up_to_date(blocks[name], stale):
+            stale.add(name)
+
+    jobs = sorted(stale, key=lambda name: (-blocks[name].priority, name))
+
+    for name in jobs:
+        block = blocks[name]
+        print(f'{name}: {block.cores} cores, {block.memory:.0f} MB, ~{block.runtime/60:.0f} min')
+    print(f'{len(jobs)} of {len(blocks)} blocks need to be hardened')
+
+    if args.dry_run or not jobs:
+        return
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    timing_log = open(os.path.join(args.log_dir, 'timing.csv'), 'w', newline='')
+    timing = csv.writer(timing_log)
+    timing.writerow(['block', 'start', 'end', 'duration_s', 'cores', 'memory_mb', 'returncode'])
+
+    done = set()
+    failed = set()
+    running = {}
+    free_cores = args.cores
+    free_memory = args.memory
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        while jobs or running:
+
+            # Start all ready jobs that fit, longest first
+            for name in list(jobs):
+                block = blocks[name]
+
+                if any(dependency in failed for dependency in block.dependencies):
+                    print(f'Skipping {name}, a dependency failed')
+                    jobs.remove(name)
+                    failed.add(name)
+                    continue
+
+                if any(dependency in stale and dependency not in done for dependency in block.dependencies):
+                    continue
+
+                # A job that is larger than the machine still runs, but alone
+                fits = block.cores <= free_cores and block.memory <= free_memory
+                if fits or not running:
+                    print(f'Starting {name}')
+                    jobs.remove(name)
+                    running[executor.submit(run_block, block, args.log_dir)] = name
+                    free_cores -= block.cores
+                    free_memory -= block.memory
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                name = running.pop(future)
+                block = blocks[name]
+                free_cores += block.cores
+                free_memory += block.memory
+
+                start, end, returncode = future.result()
+                timing.writerow([name, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+                                 time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end)),
+                                 f'{end - start:.0f}', block.cores, f'{block.memory:.0f}', returncode])
+                timing_log.flush()
+
+                if returncode == 0:
+                    print(f'Finished {name} in {(end - start)/60:.1f} min')
+                    done.add(name)
+                else:
+                    print(f'Failed {name}, see {os.path.join(args.log_dir, name + ".log")}')
+                    failed.add(name)
+
+    timing_log.close()
+
+    if failed:
+        sys.exit(f'Failed: {" ".join(sorted(failed))}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Query the metrics of all OpenLane runs
+
+All metrics.csv in signoff/<block>/ and openlane/<block>/runs/<tag>/reports/
+are loaded into a single NumPy structured array, one row per run. The
+array is cached in .cache/metrics/ and only the CSV files that changed
+since the last call are parsed again.
+
+Examples:
+
+    metrics.py query -c design_name wns total_runtime -w 'design_name=trng_*'
+    metrics.py query -c total_runtime Peak_Memory_Usage_MB -g design_name -a max
+    metrics.py diff -c wns total_runtime -w 'design_name=trng_*'
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import glob
+import fnmatch
+import hashlib
+import argparse
+
+import numpy as np
+
+PROJECT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+CACHE_DIR = os.path.join(PROJECT_DIR, '.cache/metrics')
+
+SOURCES = [
+    'openlane/*/runs/*/reports/metrics.csv',
+    'signoff/*/metrics.csv'
+]
+
+# Columns added to every run
+EXTRA_COLUMNS = ['block', 'source']
+
+# OpenLane reports runtimes as 1h17m57s0ms, store them in seconds
+RUNTIME_COLUMNS = ['total_runtime', 'routed_runtime']
+
+def parse_runtime(value):
+    match = re.fullmatch(r'(\d+)h(\d+)m(\d+)s(\d+)ms', value.strip())
+    if not match:
+        return float('nan')
+    hours, minutes, seconds, milliseconds = (int(group) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000
+
+# float() also accepts run tags like 23_10_17_08_46
+NUMBER = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(inf|nan)', re.IGNORECASE)
+
+def is_number(value):
+    return NUMBER.fullmatch(value.strip()) is not None
+
+def parse_csv(path):
+    """Parse one metrics.csv into a structured array"""
+    relative = os.path.relpath(path, PROJECT_DIR)
+    block = relative.split(os.sep)[1]
+
+    with open(path, newline='') as reader:
+        rows = list(csv.DictReader(reader))
+
+    columns = EXTRA_COLUMNS + [column for column in (rows[0] if rows else []) if column not in EXTRA_COLUMNS]
+    for row in rows:
+        row['block'] = block
+        row['source'] = relative
+        for column in RUNTIME_COLUMNS:
+            if column in row:
+                row[column] = str(parse_runtime(row[column]))
+
+    # A column is numeric if all of its values are
+    dtype = []
+    for column in columns:
+        values = [row.get(column, '') for row in rows]
+        if column not in EXTRA_COLUMNS and all(is_number(value) for value in values):
+            dtype.append((column, 'f8'))
+        else:
+            dtype.append((column, f'U{max([len(value) for value in values], default=0) or 1}'))
+
+    array = np.zeros(len(rows), dtype=dtype)
+    for index, row in enumerate(rows):
+        array[index] = tuple(float(row[name]) if kind == 'f8' else row.get(name, '') for name, kind in dtype)
+    return array
+
+def merge_dtypes(arrays):
+    """Union of all columns, numeric only if numeric everywhere"""
+    fields = {}
+    for array in arrays:
+        for name in array.dtype.names:
+            kind = array.dtype[name]
+            if name not in fields:
+                fields[name] = kind
+            elif fields[name].kind != kind.kind or kind.kind == 'U':
+                length = max(fields[name].itemsize, kind.itemsize) // 4 if 'U' in (fields[name].kind, kind.kind) else 0
+                fields[name] = np.dtype(f'U{max(length, 32)}')
+    return np.dtype(list(fields.items()))
+
+def combine(arrays):
+    """Concatenate arrays with different columns"""
+    if not arrays:
+        return np.zeros(0, dtype=[(name, 'U1') for name in EXTRA_COLUMNS])
+
+    dtype = merge_dtypes(arrays)
+    result = np.zeros(sum(len(array) for array in arrays), dtype=dtype)
+    for name in dtype.names:
+        if dtype[name].kind == 'f':
+            result[name] = np.nan
+
+    offset = 0
+    for array in arrays:
+        part = result[offset:offset + len(array)]
+        for name in array.dtype.names:
+            part[name] = array[name]
+        offset += len(array)
+
+    # signoff/ holds a copy of the last run, keep only one of them
+    runs = {}
+    keep = np.ones(len(result), dtype=bool)
+    if 'config' in dtype.names:
+        for index, row in enumerate(result[['block', 'config']]):
+            key = (row['block'], row['config'])
+            if key in runs:
+                keep[index] = False
+            runs[key] = index
+
+    return result[keep]
+
+class MetricsStore:
+
+    def __init__(self, cache_dir=CACHE_DIR, sources=SOURCES):
+        self.cache_dir = cache_dir
+        self.sources = sources
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.table_path = os.path.join(cache_dir, 'metrics.npy')
+
+    def files(self):
+        paths = []
+        for pattern in self.sources:
+            paths.extend(sorted(glob.glob(os.path.join(PROJECT_DIR, pattern))))
+        return paths
+
+    def load(self, verbose=False):
+        """Return the metrics of all runs, parsing only changed files"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        index = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as reader:
+                index = json.load(reader)
+
+        files = self.files()
+        stamps = {}
+        for path in files:
+            stat = os.stat(path)
+            stamps[path] = [stat.st_mtime_ns, stat.st_size]
+
+        # Fast path: nothing changed
+        if os.path.isfile(self.table_path) and index.keys() == stamps.keys() and \
+           all(index[path]['stamp'] == stamp for path, stamp in stamps.items()):
+            return np.load(self.table_path, mmap_mode='r')
+
+        arrays = []
+        parsed = 0
+        new_index = {}
+        for path in files:
+            entry = index.get(path)
+            cache_file = os.path.join(self.cache_dir, hashlib.sha1(path.encode()).hexdigest() + '.npy')
+
+            if entry and entry['stamp'] == stamps[path] and os.path.isfile(cache_file):
+                array = np.load(cache_file)
+            else:
+                array = parse_csv(path)
+                np.save(cache_file, array)
+                parsed += 1
+
+            new_index[path] = {'stamp': stamps[path], 'cache': cache_file}
+            arrays.append(array)
+
+        # Remove the cache of deleted files
+        for path, entry in index.items():
+            if path not in new_index and os.path.isfile(entry['cache']):
+                os.remove(entry['cache'])
+
+        table = combine(arrays)
+        np.save(self.table_path, table)
+        with open(self.index_path, 'w') as writer:
+            json.dump(new_index, writer)
+
+        if verbose:
+            print(f'Parsed {parsed} of {len(files)} metrics files', file=sys.stderr)
+
+        return table
+
+def parse_filter(expression, table):
+    """Return a boolean mask for expressions like wns<0 or design_name=trng_*"""
+    match = re.fullmatch(r'\s*(.+?)\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*', expression)
+    if not match:
+        sys.exit(f'Error: invalid filter {expression}')
+    column, operator, value = match.groups()
+
+    if column not in table.dtype.names:
+        sys.exit(f'Error: unknown column {column}')
+    data = table[column]
+
+    if data.dtype.kind == 'f':
+        value = float(value)
+        return {
+            '<': data < value, '<=': data <= value,
+            '>': data > value, '>=': data >= value,
+            '=': data == value, '!=': data != value
+        }[operator]
+
+    if operator not in ['=', '!=']:
+        sys.exit(f'Error: {column} is not numeric')
+    mask = np.array([fnmatch.fnmatchcase(str(entry), value) for entry in data], dtype=bool)
+    return mask if operator == '=' else ~mask
+
+def run_order(table):
+    """Sort key of the runs, the run tag is a timestamp"""
+    if 'config' in table.dtype.names:
+        return np.argsort(table['config'], kind='stable')
+    return np.arange(len(table))
+
+def format_value(value):
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return '-'
+        return f'{value:.6g}'
+    return str(value)
+
+def print_table(header, rows):
+    rows = [[format_value(value) for value in row] for row in rows]
+    widths = [max([len(str(name))] + [len(row[i]) for row in rows]) for i, name in enumerate(header)]
+    print('  '.join(f'{name:<{width}}' for name, width in zip(header, widths)))
+    for row in rows:
+        print('  '.join(f'{value:<{width}}' for value, width in zip(row, widths)))
+
+def check_columns(table, columns):
+    for column in columns:
+        if column not in table.dtype.names:
+            sys.exit(f'Error: unknown column {column}')
+
+def query(table, args):
+    columns = args.columns or ['block', 'config', 'flow_status', 'total_runtime', 'wns', 'tns']
+    check_columns(table, columns)
+
+    if args.group_by:
+        check_columns(table, [args.group_by])
+        reduce = {'min': np.nanmin, 'max': np.nanmax, 'mean': np.nanmean, 'sum': np.nansum}
+        rows = []
+        for key in np.unique(table[args.group_by]):
+            group = table[table[args.group_by] == key][run_order(table[table[args.group_by] == key])]
+            row = [key, len(group)]
+            for column in columns:
+                if column == args.group_by:
+                    continue
+                data = group[column]
+                if args.aggregate == 'last' or data.dtype.kind != 'f':
+                    row.append(data[-1])
+                elif np.all(np.isnan(data)):
+                    row.append(float('nan'))
+                else:
+                    row.append(reduce[args.aggregate](data))
+            rows.append(row)
+        header = [args.group_by, 'runs'] + [f'{args.aggregate}({column})' for column in columns if column != args.group_by]
+        print_table(header, rows)
+        return
+
+    table = table[run_order(table)]
+    if args.sort:
+        check_columns(table, [args.sort])
+        table = table[np.argsort(table[args.sort], kind='stable')]
+    if args.limit:
+        table = table[-args.limit:]
+    print_table(columns, [[row[column] for column in columns] for row in table])
+
+def diff(table, args):
+    """Compare the last two runs of each block"""
+    columns = args.columns or ['total_runtime', 'wns', 'tns']
+    check_columns(table, columns)
+
+    header = ['block', 'old', 'new']
+    for column in columns:
+        header += [f'{column}', 'delta']
+
+    rows = []
+    for block in np.unique(table['block']):
+        runs = table[table['block'] == block]
+        runs = runs[run_order(runs)]
+        if len(runs) < 2:
+            continue
+        old, new = runs[-2], runs[-1]
+        row = [block, old['config'] if 'config' in table.dtype.names else '-',
+               new['config'] if 'config' in table.dtype.names else '-']
+        for column in columns:
+            if table.dtype[column].kind == 'f':
+                row += [f'{format_value(old[column])} -> {format_value(new[column])}', new[column] - old[column]]
+            else:
+                row += [f'{old[column]} -> {new[column]}', '']
+        rows.append(row)
+
+    print_table(header, rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the metrics of all OpenLane runs.')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def common(subparser):
+        subparser.add_argument('-c', '--columns', nargs='+', help='columns to show')
+        subparser.add_argument('-w', '--where', action='append', default=[],
+                               help='filter like wns<0 or design_name=trng_* (can be repeated)')
+
+    query_parser = subparsers.add_parser('query', help='show runs')
+    common(query_parser)
+    query_parser.add_argument('-g', '--group-by', help='group runs by this column')
+    query_parser.add_argument('-a', '--aggregate', default='last', choices=['last', 'min', 'max', 'mean', 'sum'],
+                              help='aggregation for grouped numeric columns')
+    query_parser.add_argument('-s', '--sort', help='sort by this column')
+    query_parser.add_argument('-n', '--limit', type=int, help='only show the last N runs')
+
+    diff_parser = subparsers.add_parser('diff', help='compare the last two runs of each block')
+    common(diff_parser)
+
+    subparsers.add_parser('columns', help='list all columns')
+
+    args = parser.parse_args()
+
+    table = MetricsStore(args.cache_dir).load(verbose=True)
+
+    if args.command == 'columns':
+        for name in table.dtype.names:
+            print(f'{name:<40}{"numeric" if table.dtype[name].kind == "f" else "text"}')
+        return
+
+    for expression in args.where:
+        table = table[parse_filter(expression, table)]
+
+    if args.command == 'query':
+        query(table, args)
+    else:
+        diff(table, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Summarise the parasitics of SPEF files
+
+The SPEF file is memory mapped and scanned net by net. For every
+*D_NET only the total capacitance, the sum of the resistances and the
+fan-out are kept, in NumPy arrays. The RC elements themselves are never
+stored, so files larger than the memory can be processed. Net names
+are kept as *NAME_MAP references until they are printed, the map is
+only read then.
+
+Examples:
+
+    spef.py top spef/multicorner/user_proj_example.max.spef -n 20 --by res
+    spef.py compare user_proj_example
+    spef.py benchmark spef/multicorner/user_proj_example.nom.spef
+"""
+
+import os
+import re
+import sys
+import mmap
+import time
+import array
+import argparse
+
+import numpy as np
+
+PROJECT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SPEF_DIR = os.path.join(PROJECT_DIR, 'spef/multicorner')
+
+CORNERS = ['min', 'nom', 'max']
+
+# Scale to pF and Ohm
+CAP_UNITS = {b'FF': 1e-3, b'PF': 1.0, b'NF': 1e3, b'UF': 1e6}
+RES_UNITS = {b'OHM': 1.0, b'KOHM': 1e3, b'MOHM': 1e6}
+
+D_NET = re.compile(rb'^\*D_NET (\S+) (\S+)', re.MULTILINE)
+NAME = re.compile(rb'^\*(\d+) (\S+)', re.MULTILINE)
+CONN = re.compile(rb'^\*([PI]) \S+ ([IOB])', re.MULTILINE)
+RES_VALUE = re.compile(rb' (\S+)[ \t]*$', re.MULTILINE)
+
+class Spef:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.data, 'madvise'):
+            self.data.madvise(mmap.MADV_SEQUENTIAL)
+
+        self.cap_scale = self.unit(b'*C_UNIT', CAP_UNITS)
+        self.res_scale = self.unit(b'*R_UNIT', RES_UNITS)
+
+        self.name_map = None
+        self.refs = []
+        self.cap = self.res = self.fanout = None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def unit(self, keyword, units):
+        start = self.data.find(keyword)
+        if start < 0:
+            return 1.0
+        value, unit = self.data[start:self.data.find(b'\n', start)].split()[1:3]
+        return float(value) * units.get(unit.upper(), 1.0)
+
+    def scan(self):
+        """Fill the per-net arrays"""
+        data = self.data
+        cap = array.array('d')
+        res = array.array('d')
+        fanout = array.array('l')
+        refs = []
+
+        position = data.find(b'\n*D_NET ')
+        while position >= 0:
+            match = D_NET.match(data, position + 1)
+            end = data.find(b'\n*END', match.end())
+            if end < 0:
+                end = len(data)
+
+            cap_start = data.find(b'\n*CAP', match.end(), end)
+            res_start = data.find(b'\n*RES', match.end(), end)
+
+            # Loads are input pins of cells and output ports of the design
+            conn_end = cap_start if cap_start >= 0 else end
+            loads = 0
+            for kind, direction in CONN.findall(data, match.end(), conn_end):
+                if (kind == b'I') == (direction == b'I'):
+                    loads += 1
+
+            # The resistance is the last field of every line
+            resistance = 0.0
+            if res_start >= 0:
+                values = RES_VALUE.findall(data, res_start + 5, end)
+                if values:
+                    resistance = np.fromstring(b' '.join(values), sep=' ').sum()
+
+            refs.append(match.group(1))
+            cap.append(float(match.group(2)))
+            res.append(resistance)
+            fanout.append(loads)
+
+            position = data.find(b'\n*D_NET ', end)
+
+        self.refs = refs
+        self.cap = np.frombuffer(cap, dtype=np.float64) * self.cap_scale
+        self.res = np.frombuffer(res, dtype=np.float64) * self.res_scale
+        self.fanout = np.frombuffer(fanout, dtype=np.int_)
+        return self
+
+    def names(self):
+        """Resolve the *NAME_MAP, read on first use"""
+        if self.name_map is None:
+            self.name_map = {}
+            start = self.data.find(b'*NAME_MAP')
+            if start >= 0:
+                end = self.data.find(b'\n*', self.data.find(b'\n\n', start))
+                for match in NAME.finditer(self.data, start, end if end >= 0 else len(self.data)):
+                    self.name_map[match.group(1)] = match.group(2)
+        return self.name_map
+
+    def name(self, index):
+        ref = self.refs[index]
+        if ref.startswith(b'*'):
+            ref = self.names().get(ref[1:], ref)
+        return ref.decode()
+
+def naive_scan(path):
+    """Reference parser that reads every line into Python objects"""
+    nets = {}
+    current = None
+    section = None
+    with open(path) as reader:
+        for line in reader:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == '*D_NET':
+                current = {'cap': float(fields[2]), 'conn': [], 'caps': [], 'res': []}
+                nets[fields[1]] = current
+                section = None
+            elif fields[0] in ['*CONN', '*CAP', '*RES']:
+                section = fields[0]
+            elif fields[0] == '*END':
+                current = None
+            elif current is not None and section == '*CONN':
+                current['conn'].append(fields)
+            elif current is not None and section == '*CAP':
+                current['caps'].append(fields)
+            elif current is not None and section == '*RES':
+                current['res'].append(fields)
+
+    return {ref: (net['cap'], sum(float(fields[3]) for fields in net['res']),
+                  sum((fields[0] == '*I') == (fields[2] == 'I') for fields in net['conn']))
+            for ref, net in nets.items()}
+
+def print_nets(spef, indices):
+    print(f'{"cap/pF":>10}{"res/Ohm":>12}{"fanout":>8}  net')
+    for index in indices:
+        print(f'{spef.cap[index]:10.5f}{spef.res[index]:12.2f}{spef.fanout[index]:8d}  {spef.name(index)}')
+
+def top(args):
+    spef = Spef(args.spef).scan()
+    values = {'cap': spef.cap, 'res': spef.res, 'fanout': spef.fanout}[args.by]
+    count = min(args.count, len(values))
+    indices = np.argpartition(-values, count - 1)[:count] if count else []
+    print(f'{len(values)} nets, total {spef.cap.sum():.4f} pF')
+    print_nets(spef, sorted(indices, key=lambda index: -values[index]))
+    spef.close()
+
+def compare(args):
+    """Compare the corners of one design net by net"""
+    corners = {}
+    for corner in CORNERS:
+        path = os.path.join(args.spef_dir, f'{args.design}.{corner}.spef')
+        if not os.path.isfile(path):
+            sys.exit(f'Error: {path} not found')
+        corners[corner] = Spef(path).scan()
+
+    # OpenRCX writes the same NAME_MAP for all corners, match the nets by name otherwise
+    reference = corners['nom']
+    columns = {}
+    for corner, spef in corners.items():
+        if spef.refs == reference.refs:
+            columns[corner] = spef.cap
+        else:
+            position = {spef.name(index): index for index in range(len(spef.refs))}
+            order = np.array([position.get(reference.name(index), -1) for index in range(len(reference.refs))])
+            columns[corner] = np.where(order >= 0, spef.cap[order], np.nan)
+
+    print(f'{"corner":<8}{"nets":>8}{"total cap/pF":>14}{"total res/Ohm":>15}')
+    for corner, spef in corners.items():
+        print(f'{corner:<8}{len(spef.refs):>8}{spef.cap.sum():>14.4f}{spef.res.sum():>15.1f}')
+
+    spread = columns['max'] - columns['min']
+    count = min(args.count, len(spread))
+    indices = np.argsort(-np.nan_to_num(columns['max']), kind='stable')[:count]
+
+    print(f'\n{"min/pF":>10}{"nom/pF":>10}{"max/pF":>10}{"spread":>9}  net')
+    for index in indices:
+        relative = spread[index] / columns['nom'][index] * 100 if columns['nom'][index] else 0
+        print(f'{columns["min"][index]:10.5f}{columns["nom"][index]:10.5f}{columns["max"][index]:10.5f}'
+              f'{relative:8.1f}%  {reference.name(index)}')
+
+    for spef in corners.values():
+        spef.close()
+
+def benchmark(args):
+    size = os.path.getsize(args.spef) / 1e6
+
+    start = time.perf_counter()
+    spef = Spef(args.spef).scan()
+    mapped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nets = naive_scan(args.spef)
+    naive = time.perf_counter() - start
+
+    # Both parsers have to agree
+    for index, ref in enumerate(spef.refs):
+        cap, res, fanout = nets[ref.decode()]
+        if not (np.isclose(cap * spef.cap_scale, spef.cap[index]) and
+                np.isclose(res * spef.res_scale, spef.res[index]) and fanout == spef.fanout[index]):
+            sys.exit(f'Error: mismatch at net {spef.name(index)}')
+
+    print(f'{size:.1f} MB, {len(spef.refs)} nets')
+    print(f'mmap:  {mapped:.3f} s, {size / mapped:.1f} MB/s')
+    print(f'naive: {naive:.3f} s, {size / naive:.1f} MB/s')
+    spef.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise the parasitics of SPEF files.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    top_parser = subparsers.add_parser('top', help='nets with the largest parasitics')
+    top_parser.add_argument('spef', help='SPEF file')
+    top_parser.add_argument('-n', '--count', type=int, default=20, help='number of nets')
+    top_parser.add_argument('--by', choices=['cap', 'res', 'fanout'], default='cap', help='sort key')
+
+    compare_parser = subparsers.add_parser('compare', help='compare the min, nom and max corner')
+    compare_parser.add_argument('design', help='design name, e.g. user_proj_example')
+    compare_parser.add_argument('-n', '--count', type=int, default=20, help='number of nets')
+    compare_parser.add_argument('--spef-dir', default=SPEF_DIR, help='directory of the multicorner SPEF files')
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='compare against a line by line parser')
+    benchmark_parser.add_argument('spef', help='SPEF file')
+
+    args = parser.parse_args()
+    {'top': top, 'compare': compare, 'benchmark': benchmark}[args.command](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Index the timing paths of the multi-corner STA reports
+
+The multi_corner_sta.{max,min}.rpt files of all signoff runs are parsed
+line by line into one NumPy structured array with startpoint, endpoint,
+clock, RC corner, PVT corner, arrival and slack of every reported path.
+The index of every report is cached in .cache/sta/ under the SHA-256
+of its content, a report is only hashed again if its mtime or size
+changed.
+
+Examples:
+
+    sta.py worst -n 20
+    sta.py worst -t hold -b user_project_wrapper
+    sta.py histogram --by clock
+    sta.py summary
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import hashlib
+import argparse
+
+import numpy as np
+
+PROJECT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+CACHE_DIR = os.path.join(PROJECT_DIR, '.cache/sta')
+
+SOURCES = [
+    'signoff/*/openlane-signoff/*-sta-rcx_*/multi_corner_sta.*.rpt',
+    'openlane/*/runs/*/reports/signoff/*-sta-rcx_*/multi_corner_sta.*.rpt'
+]
+
+# Only these reports contain the setup and hold paths,
+# checks.rpt repeats some of them
+PATH_REPORTS = ['max', 'min']
+
+# Used if the OpenLane config of a block has no CLOCK_PERIOD
+DEFAULT_CLOCK_PERIOD = 24.0 # ns
+
+PATH_DTYPE = [
+    ('block', 'U64'),
+    ('run', 'U32'),
+    ('rc', 'U8'),
+    ('corner', 'U16'),
+    ('check', 'U8'),
+    ('clock', 'U32'),
+    ('startpoint', 'U128'),
+    ('endpoint', 'U128'),
+    ('arrival', 'f8'),
+    ('slack', 'f8')
+]
+
+def report_info(path):
+    """Block, run and RC corner from the location of a report"""
+    parts = os.path.relpath(path, PROJECT_DIR).split(os.sep)
+    block = parts[1]
+    run = parts[3] if parts[0] == 'openlane' else 'signoff'
+    match = re.search(r'sta-rcx_(\w+)', parts[-2])
+    return block, run, match.group(1) if match else ''
+
+def parse_paths(path):
+    """Yield (corner, check, clock, startpoint, endpoint, arrival, slack) for every path
+
+    The report is streamed, only the current path is kept in memory.
+    """
+    with open(path, 'rb') as reader:
+        current = None
+
+        for line in reader:
+            if line.startswith(b'Startpoint: '):
+                current = {'startpoint': line[12:].split(b' (', 1)[0].strip().decode()}
+            elif current is None:
+                continue
+            elif line.startswith(b'Endpoint: '):
+                current['endpoint'] = line[10:].split(b' (', 1)[0].strip().decode()
+            elif line.startswith(b'Path Group: '):
+                current['clock'] = line[12:].strip().decode()
+            elif line.startswith(b'Path Type: '):
+                current['check'] = 'setup' if line[11:].strip() == b'max' else 'hold'
+            elif line.startswith(b'Corner: '):
+                current['corner'] = line[8:].strip().decode()
+            elif line.endswith(b'data arrival time\n') and 'arrival' not in current:
+                current['arrival'] = float(line.split()[0])
+            elif b'slack (' in line:
+                yield (current.get('corner', ''), current.get('check', ''), current.get('clock', ''),
+                       current['startpoint'], current.get('endpoint', ''),
+                       current.get('arrival', float('nan')), float(line.split()[0]))
+                current = None
+
+def index_report(path):
+    block, run, rc = report_info(path)
+    rows = [(block, run, rc) + row for row in parse_paths(path)]
+    return np.array(rows, dtype=PATH_DTYPE)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as reader:
+        for chunk in iter(lambda: reader.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def clock_period(block):
+    try:
+        with open(os.path.join(PROJECT_DIR, 'openlane', block, 'config.json')) as reader:
+            return float(json.load(reader).get('CLOCK_PERIOD', DEFAULT_CLOCK_PERIOD))
+    except (OSError, ValueError):
+        return DEFAULT_CLOCK_PERIOD
+
+class PathIndex:
+
+    def __init__(self, cache_dir=CACHE_DIR, sources=SOURCES):
+        self.cache_dir = cache_dir
+        self.sources = sources
+        self.stamps_path = os.path.join(cache_dir, 'stamps.json')
+
+    def reports(self):
+        paths = []
+        for pattern in self.sources:
+            for path in sorted(glob.glob(os.path.join(PROJECT_DIR, pattern))):
+                if path.split('.')[-2] in PATH_REPORTS:
+                    paths.append(path)
+        return paths
+
+    def load(self, verbose=False):
+        """Return the paths of all reports"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        stamps = {}
+        if os.path.isfile(self.stamps_path):
+            with open(self.stamps_path) as reader:
+                stamps = json.load(reader)
+
+        arrays = []
+        hashed = parsed = 0
+        new_stamps = {}
+        for path in self.reports():
+            stat = os.stat(path)
+            stamp = [stat.st_mtime_ns, stat.st_size]
+
+            # Only hash the report again if it was touched
+            entry = stamps.get(path)
+            if entry and entry['stamp'] == stamp:
+                digest = entry['hash']
+            else:
+                digest = file_hash(path)
+                hashed += 1
+
+            cache_file = os.path.join(self.cache_dir, f'{digest}.npy')
+            if os.path.isfile(cache_file):
+                array = np.load(cache_file)
+            else:
+                array = index_report(path)
+                np.save(cache_file, array)
+                parsed += 1
+
+            # The same report may have been copied to another run
+            block, run, rc = report_info(path)
+            array['block'], array['run'], array['rc'] = block, run, rc
+
+            new_stamps[path] = {'stamp': stamp, 'hash': digest}
+            arrays.append(array)
+
+        with open(self.stamps_path, 'w') as writer:
+            json.dump(new_stamps, writer)
+
+        if verbose and (hashed or parsed):
+            print(f'Hashed {hashed} and parsed {parsed} of {len(new_stamps)} reports', file=sys.stderr)
+
+        if not arrays:
+            return np.zeros(0, dtype=PATH_DTYPE)
+        return np.concatenate(arrays)
+
+def worst(paths, count):
+    """The count paths with the lowest slack"""
+    if len(paths) > count:
+        paths = paths[np.argpartition(paths['slack'], count)[:count]]
+    return paths[np.argsort(paths['slack'], kind='stable')]
+
+def histograms(paths, keys, bin_width):
+    """Slack histograms for each group, all with the same bins"""
+    period = max(clock_period(block) for block in np.unique(paths['block']))
+    low = min(np.floor(paths['slack'].min() / bin_width) * bin_width, 0.0)
+    high = max(paths['slack'].max(), period)
+    edges = np.arange(low, high + bin_width, bin_width)
+
+    groups = np.unique(paths[keys])
+    result = {}
+    for group in groups:
+        mask = np.ones(len(paths), dtype=bool)
+        for key in keys:
+            mask &= paths[key] == group[key]
+        result[tuple(group)] = np.histogram(paths['slack'][mask], bins=edges)[0]
+    return edges, result
+
+def print_histograms(edges, result, width=50):
+    peak = max((counts.max() for counts in result.values()), default=1) or 1
+    for group, counts in result.items():
+        print(f'{" ".join(group)}: {counts.sum()} paths')
+        for low, high, count in zip(edges[:-1], edges[1:], counts):
+            if count:
+                print(f'  {low:7.2f} .. {high:7.2f} ns {count:6d} {"#" * max(1, round(count / peak * width))}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the timing paths of the multi-corner STA reports.')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def common(subparser):
+        subparser.add_argument('-b', '--block', action='append', help='only this block (can be repeated)')
+        subparser.add_argument('-r', '--run', help='only this run (default: signoff)', default='signoff')
+        subparser.add_argument('-t', '--check', choices=['setup', 'hold'], help='only setup or hold paths')
+
+    worst_parser = subparsers.add_parser('worst', help='worst paths across all corners and blocks')
+    common(worst_parser)
+    worst_parser.add_argument('-n', '--count', type=int, default=10, help='number of paths')
+
+    histogram_parser = subparsers.add_parser('histogram', help='slack histograms')
+    common(histogram_parser)
+    histogram_parser.add_argument('--by', choices=['corner', 'clock'], default='corner',
+                                  help='one histogram per RC/PVT corner or per clock')
+    histogram_parser.add_argument('-w', '--bin-width', type=float, default=1.0, help='bin width in ns')
+
+    summary_parser = subparsers.add_parser('summary', help='WNS and TNS per block and corner')
+    common(summary_parser)
+
+    args = parser.parse_args()
+
+    paths = PathIndex(args.cache_dir).load(verbose=True)
+
+    mask = paths['run'] == args.run
+    if args.block:
+        mask &= np.isin(paths['block'], args.block)
+    if args.check:
+        mask &= paths['check'] == args.check
+    paths = paths[mask]
+
+    if not len(paths):
+        sys.exit('Error: no timing paths found')
+
+    if args.command == 'worst':
+        print(f'{"slack":>8} {"arrival":>8}  {"block":<24}{"corner":<14}{"check":<7}{"clock":<10}startpoint -> endpoint')
+        for path in worst(paths, args.count):
+            print(f'{path["slack"]:8.2f} {path["arrival"]:8.2f}  {path["block"]:<24}'
+                  f'{path["rc"] + "/" + path["corner"]:<14}{path["check"]:<7}{path["clock"]:<10}'
+                  f'{path["startpoint"]} -> {path["endpoint"]}')
+
+    elif args.command == 'histogram':
+        keys = ['check', 'rc', 'corner'] if args.by == 'corner' else ['check', 'clock']
+        print_histograms(*histograms(paths, keys, args.bin_width))
+
+    else:
+        keys = ['block', 'check', 'rc', 'corner']
+        print(f'{"block":<24}{"check":<7}{"corner":<14}{"paths":>6}{"wns":>9}{"tns":>9}')
+        for group in np.unique(paths[keys]):
+            mask = np.ones(len(paths), dtype=bool)
+            for key in keys:
+                mask &= paths[key] == group[key]
+            slack = paths['slack'][mask]
+            print(f'{group["block"]:<24}{group["check"]:<7}{group["rc"] + "/" + group["corner"]:<14}'
+                  f'{len(slack):>6}{min(slack.min(), 0):>9.2f}{slack[slack < 0].sum():>9.2f}')
+
+if __name__ == '__main__':
+    main()
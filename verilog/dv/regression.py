@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Run all cocotb testbenches in parallel
+
+Every tb_*.py below verilog/ with a test_runner() is a test module. A
+module can define REGRESSION, a dict of variant name -> environment,
+e.g. to run tb_toplevel.py at RTL and at gate level; every variant is
+one job. The jobs run as separate processes, each with its own build
+and test directory (SIM_BUILD) in regression_build/<job>/.
+
+Variants at gate level (GL or GL_BLOCKS in their environment) need
+PDK_ROOT and the netlists of a hardening run and are only run with --gl.
+
+The wall time of every job is stored in regression.sqlite. The jobs
+with the longest recorded time are started first, so that the
+regression takes about as long as its longest job. The cocotb results
+of all jobs are merged into one JUnit XML file.
+
+Examples:
+
+    regression.py                   all jobs
+    regression.py --list            show the jobs and their expected time
+    regression.py 'tb_toplevel:*'   only the toplevel variants
+    regression.py -j 4 -x           four at once, stop at the first failure
+    regression.py --gl              also the gate-level variants
+"""
+
+import os
+import ast
+import sys
+import time
+import signal
+import sqlite3
+import fnmatch
+import argparse
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DV_DIR = Path(__file__).resolve().parent
+VERILOG_DIR = DV_DIR.parent
+BUILD_DIR = DV_DIR / 'regression_build'
+DATABASE = DV_DIR / 'regression.sqlite'
+
+# Used if a job has never run
+DEFAULT_RUNTIME = 3600 # s
+
+# Runs of a job that are averaged for its expected time
+HISTORY = 5
+
+class Job:
+
+    def __init__(self, module, variant, env):
+        self.module = module    # Path of the test module
+        self.variant = variant  # None if the module has no variants
+        self.env = env
+        self.name = module.stem if variant is None else f'{module.stem}:{variant}'
+        self.gate_level = 'GL' in env or 'GL_BLOCKS' in env
+        self.directory = BUILD_DIR / self.name.replace(':', '-')
+        self.expected = None    # s, from the history
+
+def discover(root=VERILOG_DIR):
+    """All jobs of the test modules below root
+
+    The modules are parsed, not imported, so that the regression does not
+    depend on their environment variables.
+    """
+    jobs = []
+    for module in sorted(root.rglob('tb_*.py')):
+        if 'regression_build' in module.parts or 'sim_build' in module.parts:
+            continue
+        tree = ast.parse(module.read_text(), str(module))
+
+        functions = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+        if 'test_runner' not in functions:
+            continue
+
+        variants = None
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == 'REGRESSION'
+                                                    for target in node.targets):
+                variants = ast.literal_eval(node.value)
+
+        if variants is None:
+            jobs.append(Job(module, None, {}))
+        else:
+            jobs += [Job(module, variant, env) for variant, env in variants.items()]
+    return jobs
+
+class History:
+    """Wall time of the jobs and of their tests in SQLite"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                job TEXT, started REAL, duration REAL, returncode INTEGER, tests INTEGER, failures INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS tests (
+                job TEXT, started REAL, name TEXT, duration REAL, passed INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS runs_job ON runs (job, started);
+        ''')
+
+    def expected(self, job):
+        """Mean of the last runs that got to the end, the failed ones may have stopped early"""
+        rows = self.connection.execute('''
+            SELECT duration FROM runs WHERE job = ? AND returncode = 0 ORDER BY started DESC LIMIT ?
+        ''', (job, HISTORY)).fetchall()
+        if not rows:
+            rows = self.connection.execute('''
+                SELECT duration FROM runs WHERE job = ? ORDER BY started DESC LIMIT ?
+            ''', (job, HISTORY)).fetchall()
+        return sum(row[0] for row in rows) / len(rows) if rows else None
+
+    def record(self, job, started, duration, returncode, testcases):
+        with self.connection:
+            self.connection.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                                    (job, started, duration, returncode, len(testcases),
+                                     sum(not passed for _, _, passed in testcases)))
+            self.connection.executemany('INSERT INTO tests VALUES (?, ?, ?, ?, ?)',
+                                        [(job, started, name, duration, passed)
+                                         for name, duration, passed in testcases])
+
+def find_results(job, started):
+    """The cocotb results of the job, written after it started"""
+    results = [path for path in job.directory.rglob('results.xml') if path.stat().st_mtime >= started]
+    return max(results, key=lambda path: path.stat().st_mtime, default=None)
+
+def testcases(results):
+    """(name, duration, passed) of every test in a cocotb results file"""
+    cases = []
+    for case in ET.parse(results).iter('testcase'):
+        passed = case.find('failure') is None and case.find('error') is None
+        cases.append((case.get('name'), float(case.get('time', 0)), passed))
+    return cases
+
+def run_job(job, running, stopping):
+    """Run the test module in its own process group, so that it can be stopped with the simulator"""
+    if stopping.is_set():
+        return None
+    job.directory.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ, **job.env, SIM_BUILD=str(job.directory))
+
+    started = time.time()
+    with open(job.directory / 'regression.log', 'w') as log:
+        process = subprocess.Popen([sys.executable, job.module.name], cwd=job.module.parent, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        running[job.name] = process
+        returncode = process.wait()
+        del running[job.name]
+
+    results = find_results(job, started)
+    return started, time.time() - started, returncode, results
+
+def stop(running):
+    for process in list(running.values()):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+def log_tail(job, lines=50):
+    try:
+        return ''.join((job.directory / 'regression.log').read_text(errors='replace').splitlines(True)[-lines:])
+    except OSError:
+        return ''
+
+def junit(outcomes):
+    """Merge the cocotb results into one testsuite per job
+
+    A job without results (build error, crash, stopped) becomes one test with an error.
+    """
+    root = ET.Element('testsuites', name='regression')
+    for job, (started, duration, returncode, results) in outcomes.items():
+        suite = ET.SubElement(root, 'testsuite', name=job.name,
+                              timestamp=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                              time=f'{duration:.3f}')
+        cases = list(ET.parse(results).iter('testcase')) if results else []
+        for case in cases:
+            case.set('classname', f'{job.name}.{case.get("classname", "")}'.rstrip('.'))
+            suite.append(case)
+        if not cases or (returncode != 0 and all(case.find('failure') is None for case in cases)):
+            case = ET.SubElement(suite, 'testcase', name=job.name, classname=job.name, time=f'{duration:.3f}')
+            error = ET.SubElement(case, 'error', message=f'exit code {returncode}' if returncode is not None
+                                  else 'not run')
+            error.text = log_tail(job)
+            cases.append(case)
+        suite.set('tests', str(len(cases)))
+        suite.set('failures', str(sum(case.find('failure') is not None for case in cases)))
+        suite.set('errors', str(sum(case.find('error') is not None for case in cases)))
+    ET.indent(root)
+    return ET.ElementTree(root)
+
+def passed(outcome):
+    _, _, returncode, results = outcome
+    return returncode == 0 and results is not None and all(passed for _, _, passed in testcases(results))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all cocotb testbenches in parallel, longest first.')
+    parser.add_argument('patterns', nargs='*', help='only the jobs matching these patterns, e.g. tb_toplevel:rtl')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of parallel jobs')
+    parser.add_argument('-x', '--fail-fast', action='store_true', help='stop all jobs at the first failure')
+    parser.add_argument('-l', '--list', action='store_true', help='only list the jobs')
+    parser.add_argument('--gl', action='store_true', help='also run the gate-level variants')
+    parser.add_argument('-o', '--junit', default=str(BUILD_DIR / 'junit.xml'), help='JUnit XML report')
+    parser.add_argument('--database', default=str(DATABASE), help='SQLite runtime history')
+    args = parser.parse_args()
+
+    jobs = discover()
+    if not args.gl:
+        skipped = [job.name for job in jobs if job.gate_level]
+        jobs = [job for job in jobs if not job.gate_level]
+        if skipped:
+            print(f'Skipping the gate-level jobs without --gl: {" ".join(skipped)}')
+    if args.patterns:
+        jobs = [job for job in jobs if any(fnmatch.fnmatch(job.name, pattern) for pattern in args.patterns)]
+        if not jobs:
+            sys.exit(f'Error: no job matches {" ".join(args.patterns)}')
+
+    history = History(args.database)
+    for job in jobs:
+        job.expected = history.expected(job.name)
+
+    # Longest first, the shorter jobs fill the gaps at the end
+    jobs.sort(key=lambda job: (-(job.expected or DEFAULT_RUNTIME), job.name))
+
+    for job in jobs:
+        print(f'{job.name}: ' + (f'~{job.expected:.0f} s' if job.expected is not None else 'no history'))
+    if args.list:
+        return
+
+    start = time.time()
+    outcomes = {}
+    running = {}
+    stopping = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(run_job, job, running, stopping): job for job in jobs}
+        pending = set(futures)
+
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = futures[future]
+                outcome = None if future.cancelled() else future.result()
+                if outcome is None:
+                    continue
+                outcomes[job] = outcome
+                started, duration, returncode, results = outcome
+
+                if stopping.is_set():
+                    print(f'Stopped {job.name}')
+                    continue
+
+                history.record(job.name, started, duration, returncode, testcases(results) if results else [])
+
+                if passed(outcome):
+                    print(f'Passed {job.name} in {duration:.0f} s')
+                else:
+                    print(f'Failed {job.name} in {duration:.0f} s, see {job.directory / "regression.log"}')
+                    if args.fail_fast:
+                        stopping.set()
+                        for other in pending:
+                            other.cancel()
+                        stop(running)
+
+    # Jobs that were never started are reported as errors
+    not_run = sorted(job.name for job in jobs if job not in outcomes)
+    for job in jobs:
+        outcomes.setdefault(job, (start, 0.0, None, None))
+
+    Path(args.junit).parent.mkdir(parents=True, exist_ok=True)
+    junit(outcomes).write(args.junit, encoding='utf-8', xml_declaration=True)
+
+    wall = time.time() - start
+    longest = max((outcome[1] for outcome in outcomes.values()), default=0)
+    total = sum(outcome[1] for outcome in outcomes.values())
+    failed = sorted(job.name for job, outcome in outcomes.items() if not passed(outcome) and job.name not in not_run)
+    print(f'{len(jobs) - len(failed) - len(not_run)} of {len(jobs)} jobs passed in {wall:.0f} s '
+          f'(longest job {longest:.0f} s, all jobs {total:.0f} s), report in {args.junit}')
+
+    if not_run:
+        print(f'Not run: {" ".join(not_run)}')
+    if failed or not_run:
+        sys.exit(f'Failed: {" ".join(failed)}')
+
+if __name__ == '__main__':
+    main()
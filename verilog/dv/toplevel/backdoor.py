@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Load the firmware into the memories of the toplevel from Python
+
+Instead of reading firmware.hex with $readmemh at elaboration, the
+segments of firmware.elf (or the bytes of a .hex file) are written
+directly into the memory array of the flash model and, optionally,
+into the WRAM. Together with FAST_FLASH, which replaces the SPI flash
+controller of leosoc with a behavioural port, tests can skip the cost
+of booting over SPI.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'firmware'))
+from elf2image import read_elf
+
+FLASH_BASE = 0x02000000
+FLASH_SIZE = 16 * 1024 * 1024
+
+WRAM_BASE = 0x00000000
+WRAM_WORDS = 1 << 10
+
+# Words per GF180 SRAM macro, see sram_gf180.sv
+SRAM_WORDS = 512
+
+def wram_location(index, banks, interleave):
+    """Bank and index in the bank of a word of the WRAM, see wram_banked.sv"""
+    block, offset = divmod(index, interleave)
+    return block % banks, block // banks * interleave + offset
+
+def readmemh_bytes(path, base):
+    """The bytes of a $readmemh file with one byte per word, see the Makefile"""
+    image = {}
+    address = base
+    with open(path) as reader:
+        for line in reader:
+            for token in line.split('//', 1)[0].split():
+                if token.startswith('@'):
+                    address = base + int(token[1:], 16)
+                else:
+                    image[address] = int(token, 16)
+                    address += 1
+    return image
+
+def flash_image(path):
+    """Address -> byte of everything that is stored in the flash"""
+    path = Path(path)
+    if path.suffix == '.hex':
+        # The flash model loads the file at OFFSET 0x200000
+        return readmemh_bytes(path, FLASH_BASE + 0x200000)
+
+    image = {}
+    for segment in read_elf(path):
+        image.update(zip(range(segment.paddr, segment.paddr + len(segment.data)), segment.data))
+    return image
+
+def wram_image(path):
+    """Address -> byte of the initialised data and bss in the WRAM"""
+    image = {}
+    for segment in read_elf(path):
+        if WRAM_BASE <= segment.vaddr < WRAM_BASE + WRAM_WORDS * 4:
+            data = bytes(segment.data).ljust(segment.memsz, b'\x00')
+            image.update(zip(range(segment.vaddr, segment.vaddr + segment.memsz), data))
+    return image
+
+class Backdoor:
+    """Write the memories of user_project_wrapper_wrapper"""
+
+    def __init__(self, dut, wram_banks=None, wram_interleave=1):
+        self.dut = dut
+        self.leosoc = dut.user_project_wrapper_i.leosoc_i
+        self.wram_banks = wram_banks    # None: the single WRAM without WRAM_BANKED
+        self.wram_interleave = wram_interleave
+
+    def flash_memory(self):
+        """The memory of spi_flash_fast with FAST_FLASH, of the spiflash model otherwise"""
+        if hasattr(self.leosoc.spi_flash_inst, 'memory'):
+            return self.leosoc.spi_flash_inst.memory
+        return self.dut.spiflash_inst.memory
+
+    def load_flash(self, path):
+        memory = self.flash_memory()
+        image = flash_image(path)
+        for address, value in image.items():
+            if not FLASH_BASE <= address < FLASH_BASE + FLASH_SIZE:
+                raise ValueError(f'address 0x{address:08X} is outside of the flash')
+            memory[address - FLASH_BASE].value = value
+        self.dut._log.info(f'Loaded {len(image)} bytes of {path} into the flash')
+
+    def load_wram(self, path):
+        wram = self.leosoc.wram
+        image = wram_image(path)
+
+        words = {}
+        for address, value in image.items():
+            word = words.setdefault((address - WRAM_BASE) >> 2, [None] * 4)
+            word[address & 3] = value
+
+        for index, word in words.items():
+            if self.wram_banks is None:
+                memory = wram.memory
+            else:
+                bank, index = wram_location(index, self.wram_banks, self.wram_interleave)
+                memory = wram.banks[bank].bank.memory
+            instance = memory[index // SRAM_WORDS].sram512x32_i
+            for lane, value in enumerate(word):
+                if value is not None:
+                    sram = getattr(instance, f'sram512x8_i{lane}').sram512x8
+                    sram.mem[index % SRAM_WORDS].value = value
+        self.dut._log.info(f'Loaded {len(image)} bytes of {path} into the WRAM')
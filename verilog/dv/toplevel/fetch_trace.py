@@ -0,0 +1,92 @@
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Record the instruction fetches of the toplevel simulation
+
+fetch_trace.sv writes the address of every lookup of the instruction
+cache of each hart into a buffer, the testbench drains it once it is
+full. The trace is stored with np.savez_compressed as one uint32
+array per hart (hart0, hart1) together with the measured refills:
+
+    refills[hart] = [flash misses, flash miss cycles, other misses, other miss cycles]
+
+The traces are replayed by verilog/rtl/cache/tb/cache_explorer.py.
+
+Without recording, only the counters of fetch_trace.sv run and
+statistics() summarises them per hart for icache_benchmark.py.
+"""
+
+import json
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import RisingEdge, ReadOnly
+
+class FetchTrace:
+
+    def __init__(self, dut, harts=2, record=True):
+        self.dut = dut
+        self.harts = harts
+        self.record = record
+        self.chunks = [[] for _ in range(harts)]
+
+    def start(self):
+        self.dut.fetch_trace_enable.value = 1
+        if self.record:
+            for hart in range(self.harts):
+                cocotb.start_soon(self.collect(hart))
+
+    def recorder(self, hart):
+        return self.dut.fetch[hart].fetch_trace_i
+
+    def read(self, hart, count):
+        buffer = self.recorder(hart).buffer
+        return np.array([buffer[index].value.integer for index in range(count)], dtype=np.uint32)
+
+    async def collect(self, hart):
+        recorder = self.recorder(hart)
+        depth = len(recorder.buffer)
+        while True:
+            await RisingEdge(recorder.full)
+            await ReadOnly()
+            self.chunks[hart].append(self.read(hart, depth))
+
+    def save(self, path):
+        traces = {}
+        refills = []
+        for hart in range(self.harts):
+            recorder = self.recorder(hart)
+            chunks = self.chunks[hart] + [self.read(hart, recorder.index.value.integer)]
+            traces[f'hart{hart}'] = np.concatenate(chunks)
+            refills.append([recorder.flash_misses.value.integer, recorder.flash_miss_cycles.value.integer,
+                            recorder.other_misses.value.integer, recorder.other_miss_cycles.value.integer])
+
+        np.savez_compressed(path, refills=np.array(refills, dtype=np.uint32), **traces)
+        fetches = sum(len(trace) for trace in traces.values())
+        self.dut._log.info(f'Wrote {fetches} instruction fetches to {path}')
+
+    def statistics(self, cycles):
+        """Lookups, misses and retired instructions of every hart after cycles"""
+        core_wrapper = self.dut.user_project_wrapper_i.leosoc_i.core_wrapper
+        harts = []
+        for hart in range(self.harts):
+            recorder = self.recorder(hart)
+            lookups = recorder.lookups.value.integer
+            misses = recorder.flash_misses.value.integer + recorder.other_misses.value.integer
+            instret = core_wrapper.cpus[hart].leorv32_inst.instret.value.integer
+            harts.append({
+                'lookups': lookups,
+                'misses': misses,
+                'miss_cycles': recorder.flash_miss_cycles.value.integer + recorder.other_miss_cycles.value.integer,
+                'hit_rate': 1 - misses / lookups if lookups else 0,
+                'instret': instret,
+                'cpi': cycles / instret if instret else 0
+            })
+        return {'cycles': cycles, 'harts': harts}
+
+    def save_statistics(self, path, cycles):
+        with open(path, 'w') as writer:
+            json.dump(self.statistics(cycles), writer, indent=4)
+        self.dut._log.info(f'Wrote the instruction cache statistics to {path}')
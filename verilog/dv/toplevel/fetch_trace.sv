@@ -0,0 +1,80 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Instruction fetch recorder of fetch_trace.py, simulation only
+// The address of every lookup of the instruction cache is written into
+// a buffer of DEPTH entries, full pulses when it wraps, so that the
+// testbench only wakes up once per DEPTH fetches. The misses and the
+// cycles spent on refills are counted separately for the flash and
+// everything else, this is the miss latency of the explorer. Together
+// with the number of lookups they give the hit rate of the cache.
+module fetch_trace #(
+    parameter int DEPTH = 4096
+) (
+    input clk,
+    input reset,
+
+    input enable,
+
+    input        lookup,    // request of the core is looked up
+    input        refill,    // cache waits for memory
+    input [31:0] addr,      // of the request
+
+    output logic        full,   // pulse, buffer holds DEPTH new entries
+    output logic [31:0] index,  // next entry to be written
+
+    output logic [31:0] lookups,
+    output logic [31:0] flash_misses,
+    output logic [31:0] flash_miss_cycles,
+    output logic [31:0] other_misses,
+    output logic [31:0] other_miss_cycles
+);
+
+    localparam bit [7:0] FLASH_REGION = 8'h02;
+
+    logic [31:0] buffer [DEPTH];
+
+    logic refill_d;
+    logic flash;
+    assign flash = addr[31:24] == FLASH_REGION;
+
+    always_ff @(posedge clk) begin
+        full <= 1'b0;
+
+        if (reset) begin
+            index               <= '0;
+            lookups             <= '0;
+            refill_d            <= 1'b0;
+            flash_misses        <= '0;
+            flash_miss_cycles   <= '0;
+            other_misses        <= '0;
+            other_miss_cycles   <= '0;
+        end else if (enable) begin
+            if (lookup) begin
+                lookups <= lookups + 1;
+                buffer[index] <= addr;
+                if (index == DEPTH - 1) begin
+                    index <= '0;
+                    full  <= 1'b1;
+                end else begin
+                    index <= index + 1;
+                end
+            end
+
+            refill_d <= refill;
+            if (refill) begin
+                if (flash) begin
+                    flash_miss_cycles <= flash_miss_cycles + 1;
+                    if (!refill_d) flash_misses <= flash_misses + 1;
+                end else begin
+                    other_miss_cycles <= other_miss_cycles + 1;
+                    if (!refill_d) other_misses <= other_misses + 1;
+                end
+            end
+        end
+    end
+
+endmodule
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Convert the firmware ELF into memory images
+
+The PT_LOAD segments are read from the program headers of the ELF and
+placed at their physical (load) address, like objcopy -O binary. The
+image is written as
+
+    hex   $readmemh file, one word per line
+    vmem  $readmemh file with the word index in front of every line
+    raw   binary
+
+with a selectable word width, byte order and base address. The words
+are formatted with NumPy and the file is written at once.
+
+firmware.hex is equivalent to the one of the former makehex.py for
+$readmemh, not identical: the digits are upper case and the padding is
+one 00 line per byte up to --size, where makehex.py wrote a single 0
+line per missing word and left the rest of the 8 KiB unloaded.
+
+Examples:
+
+    elf2image.py firmware.elf -o firmware.hex -w 1 --size 8192
+    elf2image.py firmware.elf -o firmware.vmem -w 4
+    elf2image.py firmware.elf -o firmware.bin
+"""
+
+import os
+import sys
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+PT_LOAD = 1
+
+FORMATS = ['hex', 'vmem', 'raw']
+
+# Words per line of a vmem file
+VMEM_WORDS_PER_LINE = 4
+
+# The two hex digits of every byte value in one uint16
+BYTE_DIGITS = np.frombuffer(''.join(f'{value:02X}' for value in range(256)).encode(), dtype=np.uint16)
+
+class Segment:
+
+    def __init__(self, paddr, vaddr, data, memsz):
+        self.paddr = paddr  # load address
+        self.vaddr = vaddr  # run address
+        self.data = data    # memoryview into the ELF
+        self.memsz = memsz  # size in memory, including bss
+
+def elf_segments(data):
+    """The PT_LOAD segments of a 32-bit little endian ELF
+
+    data is any buffer, the segment data are memoryviews into it.
+    """
+    data = memoryview(data)
+    if bytes(data[:4]) != b'\x7fELF' or data[4] != 1 or data[5] != 1:
+        raise ValueError('not a 32-bit little endian ELF file')
+
+    phoff, = struct.unpack_from('<I', data, 28)
+    phentsize, phnum = struct.unpack_from('<HH', data, 42)
+
+    segments = []
+    for index in range(phnum):
+        p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, _, _ = \
+            struct.unpack_from('<8I', data, phoff + index * phentsize)
+        if p_type == PT_LOAD:
+            segments.append(Segment(p_paddr, p_vaddr, data[p_offset:p_offset + p_filesz], p_memsz))
+    return segments
+
+def read_elf(path):
+    """The segments of an ELF file, the file is memory mapped"""
+    with open(path, 'rb') as reader:
+        data = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+    return elf_segments(data)
+
+def flatten(segments, base=None, size=None):
+    """Place the segments at their load address in one zero-filled image
+
+    Returns (base, image), image is a uint8 array.
+    """
+    # Segments without file content (bss) are not part of the image
+    segments = [segment for segment in segments if len(segment.data)]
+
+    if base is None:
+        base = min((segment.paddr for segment in segments), default=0)
+    end = max((segment.paddr + len(segment.data) for segment in segments), default=base)
+
+    length = end - base
+    if size is not None:
+        if size < length:
+            raise ValueError(f'the image needs {length} bytes, more than {size}')
+        length = size
+
+    image = np.zeros(length, dtype=np.uint8)
+    for segment in segments:
+        offset = segment.paddr - base
+        if offset < 0:
+            raise ValueError(f'segment at 0x{segment.paddr:08X} is below the base address 0x{base:08X}')
+        image[offset:offset + len(segment.data)] = np.frombuffer(segment.data, dtype=np.uint8)
+    return base, image
+
+def words(image, width, byteorder):
+    """The image as (words, width) bytes, the most significant byte first"""
+    padding = -len(image) % width
+    if padding:
+        image = np.concatenate([image, np.zeros(padding, dtype=np.uint8)])
+    image = image.reshape(-1, width)
+    return image[:, ::-1] if byteorder == 'little' else image
+
+def hex_digits(data):
+    """Upper case hex digits of (n, k) bytes as a (n, 2 * k) uint8 array"""
+    return np.ascontiguousarray(BYTE_DIGITS[data]).view(np.uint8)
+
+def columns(*parts):
+    """Join (n, k) uint8 arrays and single characters into lines"""
+    rows = next(part.shape[0] for part in parts if not isinstance(part, bytes))
+    output = np.empty((rows, sum(1 if isinstance(part, bytes) else part.shape[1] for part in parts)), dtype=np.uint8)
+    column = 0
+    for part in parts:
+        if isinstance(part, bytes):
+            output[:, column] = part[0]
+            column += 1
+        else:
+            output[:, column:column + part.shape[1]] = part
+            column += part.shape[1]
+    return output
+
+def format_hex(data):
+    return columns(hex_digits(data), b'\n').ravel()
+
+def vmem_lines(data, first, per_line):
+    """Lines of per_line words, the address is the index of the first word of the line"""
+    rows = len(data) // per_line
+    addresses = (first + np.arange(rows, dtype='>u4') * per_line).astype('>u4')
+    digits = hex_digits(data).reshape(rows, per_line, -1)
+    parts = [b'@', hex_digits(addresses.view(np.uint8).reshape(rows, 4))]
+    for column in range(per_line):
+        parts += [b' ', digits[:, column]]
+    return columns(*parts, b'\n').ravel()
+
+def format_vmem(data):
+    """srec_cat style, the addresses are word indices relative to the base address"""
+    full = len(data) - len(data) % VMEM_WORDS_PER_LINE
+    lines = [vmem_lines(data[:full], 0, VMEM_WORDS_PER_LINE)] if full else []
+    if len(data) > full:
+        lines.append(vmem_lines(data[full:], full, len(data) - full))
+    return np.concatenate(lines) if len(lines) > 1 else lines[0]
+
+def convert(segments, image_format='hex', width=4, byteorder='little', base=None, size=None):
+    """The content of the image file as a memoryview"""
+    _, image = flatten(segments, base, size)
+
+    if image_format == 'raw':
+        if byteorder == 'little' or width == 1:
+            return memoryview(image)
+        return memoryview(np.ascontiguousarray(words(image, width, 'little')))
+
+    data = words(image, width, byteorder)
+    if image_format == 'hex':
+        return memoryview(format_hex(data))
+    return memoryview(format_vmem(data))
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the firmware ELF into a memory image.')
+    parser.add_argument('elf', help='input ELF file')
+    parser.add_argument('-o', '--output', required=True, help='output file')
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        help='image format (default: from the extension of the output, .bin is raw)')
+    parser.add_argument('-w', '--width', type=int, choices=[1, 2, 4, 8], default=4, help='word width in bytes')
+    parser.add_argument('-e', '--byteorder', choices=['little', 'big'], default='little',
+                        help='byte order of the words, little gives the value as the core reads it')
+    parser.add_argument('-b', '--base', type=lambda value: int(value, 0),
+                        help='address of the first byte (default: the lowest load address)')
+    parser.add_argument('-s', '--size', type=lambda value: int(value, 0), help='pad the image to this many bytes')
+    args = parser.parse_args()
+
+    image_format = args.format
+    if image_format is None:
+        extension = os.path.splitext(args.output)[1][1:]
+        image_format = extension if extension in FORMATS else 'raw'
+
+    try:
+        output = convert(read_elf(args.elf), image_format, args.width, args.byteorder, args.base, args.size)
+    except ValueError as error:
+        sys.exit(f'Error: {args.elf}: {error}')
+
+    with open(args.output, 'wb') as writer:
+        writer.write(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#ifndef PERF_H
+#define PERF_H
+
+#include <stdint.h>
+
+// Performance counters, see peripheral_perf.sv
+// perf_report.py turns the output of perf_dump() into a report
+
+#define PERF_BASE_ADDRESS 0x07000000
+
+#define PERF_FREEZE   (1<<0)
+#define PERF_CLEAR    (1<<1)
+#define PERF_SNAPSHOT (1<<2)
+
+typedef struct
+{
+	volatile uint32_t control;
+	volatile uint32_t info;
+	volatile uint32_t reserved[2];
+	volatile uint32_t snapshot[60];
+} perf_t;
+
+static volatile perf_t *const perf0 = (volatile perf_t *const) PERF_BASE_ADDRESS;
+
+// Number of counters, of the SoC and of all harts
+static inline uint32_t perf_counters(void)
+{
+    uint32_t info = perf0->info;
+    return ((info >> 8) & 0xFF) + ((info >> 16) & 0xFF) * (info & 0xFF);
+}
+
+// Start counting from 0
+static inline void perf_start(void)
+{
+    perf0->control = PERF_CLEAR;
+}
+
+// Stop counting and copy the counters to the snapshot
+static inline void perf_stop(void)
+{
+    perf0->control = PERF_FREEZE | PERF_SNAPSHOT;
+}
+
+// Copy the counters to the snapshot and keep counting
+static inline void perf_snapshot(void)
+{
+    perf0->control = PERF_SNAPSHOT;
+}
+
+// Write the info and the snapshot as one line of hex words,
+// "PERF <info> <counter 0> <counter 1> ...\n", with this function
+static inline void perf_dump(void (*put)(char))
+{
+    const char *digits = "0123456789ABCDEF";
+    uint32_t count = perf_counters();
+
+    put('P'); put('E'); put('R'); put('F');
+
+    for (uint32_t i = 0; i <= count; i++)
+    {
+        uint32_t value = i == 0 ? perf0->info : perf0->snapshot[i - 1];
+        put(' ');
+        for (int shift = 28; shift >= 0; shift -= 4)
+        {
+            put(digits[(value >> shift) & 0xF]);
+        }
+    }
+
+    put('\n');
+}
+
+#endif
@@ -0,0 +1,28 @@
+#ifndef SIM_H
+#define SIM_H
+
+#include <stdint.h>
+
+// Simulation mailbox, observed by the testbench
+// Writes to these addresses have no effect on the SoC
+
+#define SIM_EXIT_ADDRESS 0x0E000000
+#define SIM_MARK_ADDRESS 0x0E000004
+#define SIM_EXIT_MAGIC   0xC0DE0000
+
+#define SIM_PASS 0
+#define SIM_FAIL 1
+
+// Stop the simulation, code 0 means pass
+static inline void sim_exit(uint16_t code)
+{
+    *(volatile uint32_t *const) SIM_EXIT_ADDRESS = SIM_EXIT_MAGIC | code;
+}
+
+// Notify the testbench, e.g. that the firmware is ready for input
+static inline void sim_mark(uint32_t value)
+{
+    *(volatile uint32_t *const) SIM_MARK_ADDRESS = value;
+}
+
+#endif
@@ -1,4 +1,5 @@
 #include <stdint.h>
+#include "sim.h"
 
 static volatile long *const led_data = (volatile long *const) 0x0F000000;
 
@@ -94,6 +95,9 @@ int get_mhartid(void)
 }
 
 int sync_flag = 0;
+volatile int core1_done = 0;
+
+#define MARK_UART0_READY 1
 
 #define F_CPU 40000000
 #define BAUDRATE_UART0 115200
@@ -127,9 +131,14 @@ void main()
         //while (!sync_flag);
         uart1->baudrate = F_CPU / BAUDRATE_UART1;
         write(uart1, "Core 1\n");
+        while (uart1->status & TX_FLAG);
+        core1_done = 1;
         while (1);
     }
 
+    sim_mark(MARK_UART0_READY);
+
+    // Echo until the end of the line
     while (1)
     {
         //tx_uart(uart0, rx_uart(uart0));
@@ -139,7 +148,13 @@ void main()
         
         while(uart0->status & TX_FLAG);
         uart0->tx = data;
+        
+        if (data == '\n') break;
     }
     
+    while(uart0->status & TX_FLAG);
+    while (!core1_done);
+    sim_exit(SIM_PASS);
+    
     while(1);
 }
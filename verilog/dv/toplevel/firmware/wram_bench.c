@@ -0,0 +1,157 @@
+#include <stdint.h>
+#include "sim.h"
+#include "perf.h"
+
+// WRAM benchmark, see wram_benchmark.py
+//
+// Both harts run the same load/store kernel on arrays of their own in
+// the WRAM, first at the same time, then hart 0 alone while hart 1
+// waits in a loop without memory accesses. Hart 0 checks the arrays and
+// writes the cycles over UART0, hex words as perf_dump():
+//
+//     WRAM <alone> <together hart 0> <together hart 1>
+//     PERF ... (counters of the run together)
+//
+// make PROG=wram_bench OBJ=wram_bench.o wram_bench.elf
+
+typedef struct
+{
+	volatile uint32_t status;
+	volatile uint32_t rx;
+	volatile uint32_t tx;
+	volatile uint32_t baudrate;
+} uart_t;
+
+static volatile uart_t *const uart0 = (volatile uart_t *const) 0x03000000;
+
+#define TX_FLAG (1<<1) // high on tx busy
+
+#define F_CPU 40000000
+#define BAUDRATE_UART0 115200
+
+#define WORDS  64
+#define ROUNDS 8
+
+// Arrays of each hart
+uint32_t source[2][WORDS];
+uint32_t target[2][WORDS];
+
+// Handshake, each flag is written by one hart only
+volatile int hart1_ready;
+volatile int hart0_go;
+volatile int hart1_done;
+
+uint32_t cycles[2];
+
+static inline uint32_t get_cycle(void)
+{
+    uint32_t cycle;
+    __asm__ volatile ("rdcycle %0" : "=r"(cycle));
+    return cycle;
+}
+
+static inline int get_mhartid(void)
+{
+    int mhartid;
+    __asm__ volatile ("csrr %0, mhartid" : "=r"(mhartid));
+    return mhartid;
+}
+
+void put(char data)
+{
+    while(uart0->status & TX_FLAG);
+    uart0->tx = data;
+}
+
+void put_hex(uint32_t value)
+{
+    const char *digits = "0123456789ABCDEF";
+    put(' ');
+    for (int shift = 28; shift >= 0; shift -= 4)
+    {
+        put(digits[(value >> shift) & 0xF]);
+    }
+}
+
+void init(int hart)
+{
+    for (int i = 0; i < WORDS; i++)
+    {
+        source[hart][i] = i + 1;
+        target[hart][i] = hart;
+    }
+}
+
+// Two loads and a store per word
+uint32_t kernel(int hart)
+{
+    uint32_t *src = source[hart];
+    uint32_t *dst = target[hart];
+    uint32_t start = get_cycle();
+
+    for (int round = 0; round < ROUNDS; round++)
+    {
+        for (int i = 0; i < WORDS; i++)
+        {
+            dst[i] += src[i];
+        }
+    }
+
+    return get_cycle() - start;
+}
+
+int check(int hart)
+{
+    for (int i = 0; i < WORDS; i++)
+    {
+        if (target[hart][i] != hart + ROUNDS * (uint32_t)(i + 1)) return 0;
+    }
+    return 1;
+}
+
+void main()
+{
+    int hart = get_mhartid();
+
+    init(hart);
+
+    if (hart == 1) {
+        // Both harts are past the startup code before any flag is set
+        while (!hart0_go) hart1_ready = 1;
+        cycles[1] = kernel(1);
+        hart1_done = 1;
+        while (1);
+    }
+
+    uart0->baudrate = F_CPU / BAUDRATE_UART0;
+
+    while (!hart1_ready);
+    perf_start();
+    hart0_go = 1;
+    cycles[0] = kernel(0);
+
+    // Poll rarely, the delay loop stays in registers not to slow down hart 1
+    while (!hart1_done)
+    {
+        __asm__ volatile ("li t0, 32\n1: addi t0, t0, -1\nbnez t0, 1b" ::: "t0");
+    }
+    perf_stop();
+
+    int passed = check(0) && check(1);
+
+    init(0);
+    uint32_t alone = kernel(0);
+    passed = passed && check(0);
+
+    put('W'); put('R'); put('A'); put('M');
+    put_hex(alone);
+    put_hex(cycles[0]);
+    put_hex(cycles[1]);
+    put('\n');
+    perf_dump(put);
+
+    while(uart0->status & TX_FLAG);
+    sim_exit(passed ? SIM_PASS : SIM_FAIL);
+
+    while(1);
+}
@@ -0,0 +1,39 @@
+// Simulation view of gf180_ram_512x8_wrapper for the toplevel bench
+//
+// The same as verilog/rtl/gf180_ram_512x8_wrapper.v, which is the input
+// of the hardened macro and stays unchanged, with the power pins of the
+// netlists behind USE_POWER_PINS, so that it can be mixed with them,
+// see sources.json
+
+module gf180_ram_512x8_wrapper (
+`ifdef USE_POWER_PINS
+	inout        VDD,
+	inout        VSS,
+`endif
+	input        CLK,  // Clock
+	input        CEN,  // Chip enable
+	input        GWEN, // Global write enable
+	input  [7:0] WEN,  // Write enable
+	input  [8:0] A,    // Address
+	input  [7:0] D,    // Data in
+	output [7:0] Q     // Data out
+);
+
+gf180mcu_fd_ip_sram__sram512x8m8wm1 sram512x8 (
+    .CLK    (CLK),
+    .CEN    (CEN),
+    .GWEN   (GWEN),
+    .WEN    (WEN),
+    .A      (A),
+    .D      (D),
+    .Q      (Q),
+`ifdef USE_POWER_PINS
+    .VDD    (VDD),
+    .VSS    (VSS)
+`else
+    .VDD    (),
+    .VSS    ()
+`endif
+);
+
+endmodule
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Compare geometries of the instruction cache on the firmware (main.c)
+
+Every geometry (lines x words per line x ways) is one run of
+tb_toplevel.py with ICACHE set, in its own build and test directory
+icache_build/<geometry>/. The counters of fetch_trace.sv give the hit
+rate and the cycles per refill, instret of both harts the cycles per
+instruction from the reset to sim_exit(). The runs are independent
+and go in parallel.
+
+Unlike cache_explorer.py, which replays a trace through models, every
+geometry is simulated with the RTL cache, the burst refill and the
+real SPI flash (unless FAST_FLASH is set).
+
+Examples:
+
+    icache_benchmark.py                             the default geometries
+    icache_benchmark.py -g 32x1x1 -g 8x4x1 -j 2     these two
+    icache_benchmark.py --json icache.json          also write all results
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+TOPLEVEL_DIR = Path(__file__).resolve().parent
+BUILD_DIR = TOPLEVEL_DIR / 'icache_build'
+
+# The current cache first, then about the same data size in longer lines and more ways
+GEOMETRIES = [
+    '32x1x1',
+    '8x4x1', '4x8x1', '2x16x1',
+    '8x4x2', '8x4x4', '4x8x2',
+    '16x4x1', '32x4x1', '32x4x2', '16x8x2'
+]
+
+def parse_geometry(text):
+    try:
+        size, line_words, ways = (int(value) for value in text.split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text}: expected LINESxWORDSxWAYS, e.g. 8x4x2')
+    for value in (size, line_words, ways):
+        if value < 1 or value & (value - 1):
+            raise argparse.ArgumentTypeError(f'{text}: all values must be powers of two')
+    if ways > size:
+        raise argparse.ArgumentTypeError(f'{text}: more ways than lines')
+    return text
+
+def run(geometry):
+    """Simulate the firmware with this geometry, the statistics or None"""
+    directory = BUILD_DIR / geometry
+    directory.mkdir(parents=True, exist_ok=True)
+    statistics = directory / 'icache.json'
+    statistics.unlink(missing_ok=True)
+
+    env = dict(os.environ, ICACHE=geometry, ICACHE_STATS=str(statistics), SIM_BUILD=str(directory))
+    with open(directory / 'benchmark.log', 'w') as log:
+        returncode = subprocess.run([sys.executable, 'tb_toplevel.py'], cwd=TOPLEVEL_DIR, env=env,
+                                    stdout=log, stderr=subprocess.STDOUT).returncode
+
+    if not statistics.exists():
+        print(f'{geometry}: failed with exit code {returncode}, see {directory / "benchmark.log"}')
+        return None
+    with open(statistics) as reader:
+        return json.load(reader)
+
+def summary(geometry, statistics):
+    size, line_words, ways = (int(value) for value in geometry.split('x'))
+    harts = statistics['harts']
+    lookups = sum(hart['lookups'] for hart in harts)
+    misses = sum(hart['misses'] for hart in harts)
+    miss_cycles = sum(hart['miss_cycles'] for hart in harts)
+    return {
+        'geometry': geometry,
+        'bytes': size * line_words * 4,
+        'cycles': statistics['cycles'],
+        'hit_rate': 1 - misses / lookups if lookups else 0,
+        'refill': miss_cycles / misses if misses else 0,
+        'cpi': [hart['cpi'] for hart in harts],
+        'harts': harts
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the firmware with several instruction cache geometries.')
+    parser.add_argument('-g', '--geometry', type=parse_geometry, action='append',
+                        help='LINESxWORDSxWAYS, repeatable (default: a selection around 128 bytes)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of parallel simulations')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    geometries = args.geometry or GEOMETRIES
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        results = [summary(geometry, statistics) for geometry, statistics in
+                   zip(geometries, executor.map(run, geometries)) if statistics]
+
+    if not results:
+        sys.exit('Error: no simulation finished')
+
+    print(f'{"geometry":>10} {"bytes":>6} {"hit rate":>9} {"refill":>7} '
+          + ' '.join(f'{f"CPI {hart}":>7}' for hart in range(len(results[0]['cpi']))) + f' {"cycles":>10}')
+    for result in results:
+        print(f'{result["geometry"]:>10} {result["bytes"]:>6} {result["hit_rate"]:>9.2%} {result["refill"]:>7.1f} '
+              + ' '.join(f'{cpi:>7.2f}' for cpi in result['cpi']) + f' {result["cycles"]:>10}')
+
+    if args.json:
+        with open(args.json, 'w') as writer:
+            json.dump(results, writer, indent=4)
+
+    if len(results) < len(geometries):
+        sys.exit(f'Failed: {len(geometries) - len(results)} of {len(geometries)} geometries')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Instruction set simulator of LeoSoC
+
+Runs the firmware without the RTL: the two RV32I harts of leorv32 and
+the memory map of leosoc.sv, WRAM at 0x00, the flash at 0x02, UART0/1
+at 0x03/0x04, GPIO0 at 0x05, TRNG0 at 0x06, the performance counters
+at 0x07, the configuration of the flash at 0x08, blink at 0x0F and
+the simulation mailbox of firmware/lib/sim.h at 0x0E.
+
+The memories are NumPy arrays, accessed through memoryviews for
+speed. Every instruction is decoded once into a closure, kept in a
+cache per hart by its address; stores to the WRAM invalidate the
+instructions they overwrite. The harts run in turns of a few
+instructions each. That gives about one million instructions per
+second: 1.18 MIPS on firmware/firmware.elf, the speed is printed after
+every run.
+
+The model follows leorv32.sv, not only the specification: there are
+no traps, CSR writes are ignored, illegal instructions write 0 to rd
+(or nothing), stores of halfwords to odd addresses write nothing, a
+store to the flash hangs the bus. The cycle counter is an estimate of
+4 cycles per instruction, it also times the UARTs.
+
+    iss.py firmware/firmware.elf --uart0 'test data!!!\\n' --input-mark 1
+
+lockstep.py runs the ISS alongside the RTL, see LOCKSTEP of
+tb_toplevel.py.
+"""
+
+import sys
+import time
+import argparse
+from collections import deque
+
+import numpy as np
+
+from backdoor import flash_image, wram_image, FLASH_BASE, FLASH_SIZE, WRAM_BASE, WRAM_WORDS
+
+MASK = 0xFFFFFFFF
+SIGN = 0x80000000
+
+RESET_ADDR = 0x02200000
+NUM_HARTS = 2
+
+# Region of an address, mem_addr[31:24]
+WRAM_REGION = 0x00
+FLASH_REGION = 0x02
+FLASH_CONFIG_REGION = 0x08
+SIM_REGION = 0x0E
+BLINK_REGION = 0x0F
+
+UART0_BASE_ADDRESS = 0x03000000
+UART1_BASE_ADDRESS = 0x04000000
+GPIO0_BASE_ADDRESS = 0x05000000
+TRNG0_BASE_ADDRESS = 0x06000000
+PERF0_BASE_ADDRESS = 0x07000000
+
+# Firmware/lib/sim.h
+SIM_EXIT_ADDRESS = 0x0E000000
+SIM_MARK_ADDRESS = 0x0E000004
+SIM_EXIT_MAGIC = 0xC0DE
+
+# Configuration register of spi_flash.sv after the reset: SINGLE, continuous, 8 dummy cycles
+FLASH_CONFIG_RESET = 0x88
+
+FREQUENCY = 40_000_000
+BAUDRATE = 9600
+
+# leorv32_pkg.sv
+OP_IMM = 0b0010011
+OP_LUI = 0b0110111
+OP_AUIPC = 0b0010111
+OP_ARITH = 0b0110011
+OP_JAL = 0b1101111
+OP_JALR = 0b1100111
+OP_BRANCH = 0b1100011
+OP_LOAD = 0b0000011
+OP_STORE = 0b0100011
+OP_SYSTEM = 0b1110011
+
+FUNC_CSRRS = 0b010
+
+CSR_RDCYCLE = 0xC00
+CSR_RDCYCLEH = 0xC80
+CSR_RDTIME = 0xC01
+CSR_RDTIMEH = 0xC81
+CSR_RDINSTRET = 0xC02
+CSR_RDINSTRETH = 0xC82
+CSR_MHARTID = 0xF14
+
+# Of the 4-state FSM of leorv32, at least
+CYCLES_PER_INSTRUCTION = 4
+
+class SimExit(Exception):
+    """The firmware wrote to the exit address of the mailbox"""
+
+    def __init__(self, code):
+        super().__init__(f'exit code {code}')
+        self.code = code
+
+class Halted(Exception):
+    """The hart jumps to itself and will do so forever"""
+
+class BusError(Exception):
+    """An access the RTL can not complete"""
+
+def sext(value, bits):
+    sign = 1 << (bits - 1)
+    return ((value & (sign - 1)) - (value & sign)) & MASK
+
+class Uart:
+    """peripheral_uart.sv, timed by the cycle estimate of the harts
+
+    A byte takes 10 bit times (wait_cycles) to send or to receive. The
+    input is received byte after byte from the time it is opened on, a
+    byte that is not picked up in time is overwritten as in the RTL.
+    """
+
+    def __init__(self, now):
+        self.now = now
+        self.output = bytearray()
+        self.input = deque()
+        self.opened = None      # Cycle the first byte starts
+        self.rx_flag = 0
+        self.rx_data = 0
+        self.tx_end = 0
+        self.wait_cycles = FREQUENCY // BAUDRATE
+
+    def open(self, cycle=None):
+        if self.opened is None:
+            self.opened = self.now() if cycle is None else cycle
+
+    def receive(self):
+        while self.input and self.opened is not None and self.now() >= self.opened + 10 * self.wait_cycles:
+            self.rx_data = self.input.popleft()
+            self.rx_flag = 1
+            self.opened += 10 * self.wait_cycles
+
+    def read(self, offset):
+        self.receive()
+        if offset == 0x00:
+            # The flag is cleared by reading the status
+            status = (self.now() < self.tx_end) << 1 | self.rx_flag
+            self.rx_flag = 0
+            return status
+        if offset == 0x04:
+            return self.rx_data
+        if offset == 0x0C:
+            return self.wait_cycles
+        return 0
+
+    def write(self, offset, wdata, wmask):
+        if offset == 0x08:
+            self.output.append(wdata & 0xFF)
+            self.tx_end = self.now() + 10 * self.wait_cycles
+        elif offset == 0x0C:
+            if wmask & 1:
+                self.wait_cycles = (self.wait_cycles & 0xFF00) | (wdata & 0xFF)
+            if wmask & 2:
+                self.wait_cycles = (self.wait_cycles & 0x00FF) | (wdata & 0xFF00)
+
+class Gpio:
+    """peripheral_gpio.sv, reading the value returns the inputs"""
+
+    def __init__(self, inputs=0):
+        self.inputs = inputs
+        self.value = 0
+        self.output_enable = 0
+
+    def read(self, offset):
+        if offset == 0x00:
+            return self.inputs
+        if offset == 0x04:
+            return self.output_enable
+        return 0
+
+    def write(self, offset, wdata, wmask):
+        if offset == 0x00:
+            self.value = wdata
+        elif offset == 0x04:
+            self.output_enable = wdata
+
+class Trng:
+    """peripheral_trng.sv, 15 TRNGs with pseudo-random bits"""
+
+    def __init__(self, seed=None):
+        self.enable = 0
+        self.random = np.random.default_rng(seed)
+
+    def read(self, offset):
+        if offset == 0x00:
+            return self.enable
+        if offset == 0x04:
+            return int(self.random.integers(0, 1 << 15)) & self.enable
+        return 0
+
+    def write(self, offset, wdata, wmask):
+        if offset == 0x00:
+            self.enable = wdata
+
+class Perf:
+    """peripheral_perf.sv, only the cycles and the UART bytes count
+
+    The ISS has no caches, no bus and no flash timing, the counters of
+    these events stay 0. Counters are the values since the last clear,
+    a freeze keeps them at their value.
+    """
+
+    SOC_COUNTERS = 6
+    HART_COUNTERS = 5
+
+    def __init__(self, soc):
+        self.soc = soc
+        self.freeze = 0
+        self.frozen = None
+        self.base = self.live()
+        self.snapshot = [0] * (self.SOC_COUNTERS + self.HART_COUNTERS * NUM_HARTS)
+
+    def live(self):
+        return [self.soc.now(), 0, 0, len(self.soc.uart0.output), len(self.soc.uart1.output), 0] \
+               + [0] * (self.HART_COUNTERS * NUM_HARTS)
+
+    def counters(self):
+        values = self.frozen if self.frozen is not None else self.live()
+        return [(value - base) & MASK for value, base in zip(values, self.base)]
+
+    def read(self, offset):
+        if offset == 0x00:
+            return self.freeze
+        if offset == 0x04:
+            return self.HART_COUNTERS << 16 | self.SOC_COUNTERS << 8 | NUM_HARTS
+        index = (offset - 0x10) >> 2
+        if 0 <= index < len(self.snapshot):
+            return self.snapshot[index]
+        return 0
+
+    def write(self, offset, wdata, wmask):
+        if offset != 0x00 or not wmask & 1:
+            return
+        if wdata & 4:
+            self.snapshot = self.counters()
+        if wdata & 2:
+            self.base = self.frozen if self.frozen is not None else self.live()
+        if wdata & 1 and self.frozen is None:
+            self.frozen = self.live()
+        elif not wdata & 1 and self.frozen is not None:
+            # Continue from the frozen values
+            live = self.live()
+            self.base = [(base + now - frozen) & MASK for base, now, frozen in zip(self.base, live, self.frozen)]
+            self.frozen = None
+        self.freeze = wdata & 1
+
+class LeoSoC:
+    """Memory map and peripherals of leosoc.sv, shared by the harts"""
+
+    def __init__(self, gpio_inputs=0, seed=None, input_mark=None, input_cycle=0):
+        self.wram = np.zeros(WRAM_WORDS * 4, dtype=np.uint8)
+        self.flash = np.zeros(FLASH_SIZE, dtype=np.uint8)
+
+        # Word accesses without NumPy scalars, little endian like RISC-V
+        self.wram_words = memoryview(self.wram).cast('I')
+        self.flash_words = memoryview(self.flash).cast('I')
+
+        self.harts = []
+
+        self.uart0 = Uart(self.now)
+        self.uart1 = Uart(self.now)
+        self.gpio0 = Gpio(gpio_inputs)
+        self.trng0 = Trng(seed)
+        self.perf0 = Perf(self)
+        self.blink = 0
+        self.flash_config = FLASH_CONFIG_RESET
+
+        self.peripherals = {
+            UART0_BASE_ADDRESS: self.uart0,
+            UART1_BASE_ADDRESS: self.uart1,
+            GPIO0_BASE_ADDRESS: self.gpio0,
+            TRNG0_BASE_ADDRESS: self.trng0,
+        }
+
+        self.marks = []
+
+        # The UARTs receive from this sim_mark() on, from input_cycle if None
+        self.input_mark = input_mark
+        if input_mark is None:
+            self.uart0.open(input_cycle)
+            self.uart1.open(input_cycle)
+
+        # Word indices of the WRAM that hold decoded instructions
+        self.wram_code = set()
+
+        # Set by every access whose result the RTL may see differently
+        # (peripherals, counters), for lockstep.py
+        self.volatile = False
+
+    def now(self):
+        """Cycles since the reset, the harts run in parallel"""
+        return max([hart.instret for hart in self.harts], default=0) * CYCLES_PER_INSTRUCTION
+
+    def load(self, path):
+        """The firmware.elf or .hex into the flash, as the flash model does"""
+        image = flash_image(path)
+        for address, value in image.items():
+            if not FLASH_BASE <= address < FLASH_BASE + FLASH_SIZE:
+                raise ValueError(f'address 0x{address:08X} is outside of the flash')
+            self.flash[address - FLASH_BASE] = value
+        return len(image)
+
+    def load_wram(self, path):
+        """The initialised data of firmware.elf into the WRAM, as backdoor.py does"""
+        image = wram_image(path)
+        for address, value in image.items():
+            self.wram[(address - WRAM_BASE) & (WRAM_WORDS * 4 - 1)] = value
+        return len(image)
+
+    def read(self, addr):
+        """The word of mem_rdata for a read of addr"""
+        region = addr >> 24
+        if region == WRAM_REGION:
+            return self.wram_words[(addr >> 2) & (WRAM_WORDS - 1)]
+        if region == FLASH_REGION:
+            return self.flash_words[(addr & (FLASH_SIZE - 1)) >> 2]
+
+        self.volatile = True
+        if region == BLINK_REGION:
+            return MASK if self.blink else 0
+        if region == FLASH_CONFIG_REGION:
+            return self.flash_config
+        if addr & ~0xFF == PERF0_BASE_ADDRESS:
+            return self.perf0.read(addr & 0xFF)
+        peripheral = self.peripherals.get(addr & ~0xF)
+        if peripheral is not None:
+            return peripheral.read(addr & 0xF)
+        # Nothing selected, the peripheral bus of the crossbar reads 0
+        return 0
+
+    def write(self, addr, wdata, wmask):
+        region = addr >> 24
+        if region == WRAM_REGION:
+            index = (addr >> 2) & (WRAM_WORDS - 1)
+            if wmask == 0xF:
+                self.wram_words[index] = wdata
+            else:
+                for lane in range(4):
+                    if wmask >> lane & 1:
+                        self.wram[4 * index + lane] = (wdata >> (8 * lane)) & 0xFF
+            if index in self.wram_code:
+                self.invalidate(index)
+        elif region == FLASH_REGION:
+            # spi_flash never answers a write
+            raise BusError(f'write to the flash at 0x{addr:08X} hangs the bus')
+        elif region == BLINK_REGION:
+            self.blink = wdata & 1
+        elif region == FLASH_CONFIG_REGION:
+            # Only the timing of the flash reads changes, unknown modes are SINGLE
+            mode = wdata & 0x7
+            self.flash_config = wdata & 0xF8 | (mode if mode <= 4 else 0)
+        elif region == SIM_REGION:
+            if addr == SIM_EXIT_ADDRESS and wdata >> 16 == SIM_EXIT_MAGIC:
+                raise SimExit(wdata & 0xFFFF)
+            if addr == SIM_MARK_ADDRESS:
+                self.marks.append(wdata)
+                if wdata == self.input_mark:
+                    self.uart0.open()
+                    self.uart1.open()
+        elif addr & ~0xFF == PERF0_BASE_ADDRESS:
+            self.perf0.write(addr & 0xFF, wdata, wmask)
+        else:
+            peripheral = self.peripherals.get(addr & ~0xF)
+            if peripheral is not None:
+                peripheral.write(addr & 0xF, wdata, wmask)
+
+    def invalidate(self, index):
+        self.wram_code.discard(index)
+        for hart in self.harts:
+            hart.decoded.pop(WRAM_BASE + 4 * index, None)
+
+    def fetch(self, pc):
+        region = pc >> 24
+        if region == WRAM_REGION:
+            self.wram_code.add((pc >> 2) & (WRAM_WORDS - 1))
+        elif region != FLASH_REGION:
+            raise BusError(f'instruction fetch from 0x{pc:08X}')
+        return self.read(pc)
+
+class Hart:
+    """One leorv32 with its registers and decoded instructions"""
+
+    def __init__(self, soc, mhartid, reset_addr=RESET_ADDR):
+        self.soc = soc
+        self.mhartid = mhartid
+        self.regs = [0] * 32
+        self.pc = reset_addr
+        self.instret = 0
+        self.halted = False
+        self.decoded = {}
+        soc.harts.append(self)
+
+    @property
+    def cycles(self):
+        return self.instret * CYCLES_PER_INSTRUCTION
+
+    def run(self, count):
+        """Run up to count instructions, SimExit and BusError are passed on"""
+        decoded = self.decoded
+        pc = self.pc
+        try:
+            for _ in range(count):
+                op = decoded.get(pc) or self.decode(pc)
+                pc = op()
+                self.instret += 1
+        except Halted:
+            self.instret += 1
+            self.halted = True
+        except SimExit:
+            self.instret += 1
+            pc = (pc + 4) & MASK
+            raise
+        finally:
+            self.pc = pc
+
+    def step(self):
+        """Execute one instruction, a jump to itself is executed as well"""
+        try:
+            self.run(1)
+        finally:
+            self.halted = False
+
+    def decode(self, pc):
+        op = decode(self, pc, self.soc.fetch(pc))
+        self.decoded[pc] = op
+        return op
+
+    def csr(self, address):
+        if address == CSR_MHARTID:
+            return self.mhartid
+        if address in (CSR_RDCYCLE, CSR_RDTIME):
+            self.soc.volatile = True
+            return self.cycles & MASK
+        if address in (CSR_RDCYCLEH, CSR_RDTIMEH):
+            self.soc.volatile = True
+            return self.cycles >> 32
+        if address == CSR_RDINSTRET:
+            return self.instret & MASK
+        if address == CSR_RDINSTRETH:
+            return self.instret >> 32
+        return 0
+
+def decode(hart, pc, instr):
+    """A closure that executes the instruction and returns the next PC"""
+    regs = hart.regs
+    soc = hart.soc
+    read = soc.read
+    write = soc.write
+
+    opcode = instr & 0x7F
+    rd = (instr >> 7) & 0x1F
+    funct3 = (instr >> 12) & 0x7
+    rs1 = (instr >> 15) & 0x1F
+    rs2 = (instr >> 20) & 0x1F
+    funct7 = instr >> 25
+
+    imm_i = sext(instr >> 20, 12)
+    imm_s = sext(((instr >> 25) << 5) | ((instr >> 7) & 0x1F), 12)
+    imm_b = sext(((instr >> 31) << 12) | (((instr >> 7) & 1) << 11) | (((instr >> 25) & 0x3F) << 5)
+                 | (((instr >> 8) & 0xF) << 1), 13)
+    imm_u = instr & 0xFFFFF000
+    imm_j = sext(((instr >> 31) << 20) | (((instr >> 12) & 0xFF) << 12) | (((instr >> 20) & 1) << 11)
+                 | (((instr >> 21) & 0x3FF) << 1), 21)
+
+    next_pc = (pc + 4) & MASK
+
+    def nop():
+        return next_pc
+
+    def constant(value):
+        # Writes value to rd
+        if not rd:
+            return nop
+        def op():
+            regs[rd] = value
+            return next_pc
+        return op
+
+    if opcode in (OP_IMM, OP_ARITH):
+        if not rd:
+            return nop
+        immediate = opcode == OP_IMM
+        shamt = imm_i & 0x1F
+        # The shifter of leorv32 is arithmetic with funct7[5] for both
+        shift_funct7 = (imm_i >> 5) & 0x7F if immediate else funct7
+
+        if funct3 == 0b000:
+            if immediate:
+                def op():
+                    regs[rd] = (regs[rs1] + imm_i) & MASK
+                    return next_pc
+            elif funct7 == 0b0000000:
+                def op():
+                    regs[rd] = (regs[rs1] + regs[rs2]) & MASK
+                    return next_pc
+            elif funct7 == 0b0100000:
+                def op():
+                    regs[rd] = (regs[rs1] - regs[rs2]) & MASK
+                    return next_pc
+            else:
+                return constant(0)
+        elif funct3 == 0b010:
+            if immediate:
+                def op():
+                    regs[rd] = int(regs[rs1] ^ SIGN < imm_i ^ SIGN)
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = int(regs[rs1] ^ SIGN < regs[rs2] ^ SIGN)
+                    return next_pc
+        elif funct3 == 0b011:
+            if immediate:
+                def op():
+                    regs[rd] = int(regs[rs1] < imm_i)
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = int(regs[rs1] < regs[rs2])
+                    return next_pc
+        elif funct3 == 0b111:
+            if immediate:
+                def op():
+                    regs[rd] = regs[rs1] & imm_i
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = regs[rs1] & regs[rs2]
+                    return next_pc
+        elif funct3 == 0b110:
+            if immediate:
+                def op():
+                    regs[rd] = regs[rs1] | imm_i
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = regs[rs1] | regs[rs2]
+                    return next_pc
+        elif funct3 == 0b100:
+            if immediate:
+                def op():
+                    regs[rd] = regs[rs1] ^ imm_i
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = regs[rs1] ^ regs[rs2]
+                    return next_pc
+        elif funct3 == 0b001:
+            if immediate:
+                def op():
+                    regs[rd] = (regs[rs1] << shamt) & MASK
+                    return next_pc
+            else:
+                def op():
+                    regs[rd] = (regs[rs1] << (regs[rs2] & 0x1F)) & MASK
+                    return next_pc
+        else:
+            if shift_funct7 == 0b0000000:
+                if immediate:
+                    def op():
+                        regs[rd] = regs[rs1] >> shamt
+                        return next_pc
+                else:
+                    def op():
+                        regs[rd] = regs[rs1] >> (regs[rs2] & 0x1F)
+                        return next_pc
+            elif shift_funct7 == 0b0100000:
+                if immediate:
+                    def op():
+                        value = regs[rs1]
+                        regs[rd] = ((value | ~MASK) >> shamt) & MASK if value & SIGN else value >> shamt
+                        return next_pc
+                else:
+                    def op():
+                        value = regs[rs1]
+                        shift = regs[rs2] & 0x1F
+                        regs[rd] = ((value | ~MASK) >> shift) & MASK if value & SIGN else value >> shift
+                        return next_pc
+            else:
+                return constant(0)
+        return op
+
+    if opcode == OP_LUI:
+        return constant(imm_u)
+
+    if opcode == OP_AUIPC:
+        return constant((pc + imm_u) & MASK)
+
+    if opcode == OP_JAL:
+        target = (pc + imm_j) & MASK
+        if target == pc:
+            def op():
+                if rd:
+                    regs[rd] = next_pc
+                raise Halted()
+            return op
+        if not rd:
+            return lambda: target
+        def op():
+            regs[rd] = next_pc
+            return target
+        return op
+
+    if opcode == OP_JALR:
+        def op():
+            target = (regs[rs1] + imm_i) & 0xFFFFFFFE
+            if rd:
+                regs[rd] = next_pc
+            return target
+        return op
+
+    if opcode == OP_BRANCH:
+        target = (pc + imm_b) & MASK
+        if funct3 == 0b000:
+            def op():
+                return target if regs[rs1] == regs[rs2] else next_pc
+        elif funct3 == 0b001:
+            def op():
+                return target if regs[rs1] != regs[rs2] else next_pc
+        elif funct3 == 0b100:
+            def op():
+                return target if regs[rs1] ^ SIGN < regs[rs2] ^ SIGN else next_pc
+        elif funct3 == 0b101:
+            def op():
+                return target if regs[rs1] ^ SIGN >= regs[rs2] ^ SIGN else next_pc
+        elif funct3 == 0b110:
+            def op():
+                return target if regs[rs1] < regs[rs2] else next_pc
+        elif funct3 == 0b111:
+            def op():
+                return target if regs[rs1] >= regs[rs2] else next_pc
+        else:
+            # jump_addr of leorv32_execute defaults to 0
+            def op():
+                return 0
+        return op
+
+    if opcode == OP_LOAD:
+        if funct3 == 0b010:
+            def op():
+                value = read((regs[rs1] + imm_i) & MASK)
+                if rd:
+                    regs[rd] = value
+                return next_pc
+        elif funct3 in (0b000, 0b100):
+            signed = funct3 == 0b000
+            def op():
+                addr = (regs[rs1] + imm_i) & MASK
+                value = (read(addr) >> (8 * (addr & 3))) & 0xFF
+                if rd:
+                    regs[rd] = sext(value, 8) if signed else value
+                return next_pc
+        elif funct3 in (0b001, 0b101):
+            signed = funct3 == 0b001
+            def op():
+                addr = (regs[rs1] + imm_i) & MASK
+                value = (read(addr) >> (16 * ((addr >> 1) & 1))) & 0xFFFF
+                if rd:
+                    regs[rd] = sext(value, 16) if signed else value
+                return next_pc
+        else:
+            def op():
+                read((regs[rs1] + imm_i) & MASK)
+                if rd:
+                    regs[rd] = 0
+                return next_pc
+        return op
+
+    if opcode == OP_STORE:
+        if funct3 == 0b010:
+            def op():
+                write((regs[rs1] + imm_s) & MASK, regs[rs2], 0xF)
+                return next_pc
+        elif funct3 == 0b000:
+            def op():
+                addr = (regs[rs1] + imm_s) & MASK
+                lane = addr & 3
+                write(addr, (regs[rs2] & 0xFF) << (8 * lane), 1 << lane)
+                return next_pc
+        elif funct3 == 0b001:
+            def op():
+                addr = (regs[rs1] + imm_s) & MASK
+                if addr & 1:
+                    # No mask and no data for odd addresses
+                    write(addr, 0, 0)
+                elif addr & 2:
+                    write(addr, (regs[rs2] << 16) & MASK, 0xC)
+                else:
+                    write(addr, regs[rs2] & 0xFFFF, 0x3)
+                return next_pc
+        else:
+            def op():
+                write((regs[rs1] + imm_s) & MASK, 0, 0)
+                return next_pc
+        return op
+
+    if opcode == OP_SYSTEM:
+        # leorv32 writes rd only if the value of rs1 is 0, only CSRRS reads the CSR
+        csr = imm_i & 0xFFF
+        if not rd:
+            return nop
+        if funct3 == FUNC_CSRRS:
+            csr_read = hart.csr
+            def op():
+                if not regs[rs1]:
+                    regs[rd] = csr_read(csr)
+                return next_pc
+        else:
+            def op():
+                if not regs[rs1]:
+                    regs[rd] = 0
+                return next_pc
+        return op
+
+    # FENCE and everything unknown
+    return nop
+
+class Simulator:
+    """The harts of LeoSoC, taking turns of quantum instructions"""
+
+    def __init__(self, firmware=None, harts=NUM_HARTS, gpio_inputs=0, seed=None, input_mark=None, input_cycle=0):
+        self.soc = LeoSoC(gpio_inputs, seed, input_mark, input_cycle)
+        if firmware:
+            self.soc.load(firmware)
+        self.harts = [Hart(self.soc, mhartid) for mhartid in range(harts)]
+        self.exit_code = None
+
+    @property
+    def instret(self):
+        return sum(hart.instret for hart in self.harts)
+
+    def run(self, max_instructions=None, quantum=64):
+        """Until the firmware exits, all harts halt or max_instructions, returns the exit code"""
+        while self.exit_code is None:
+            running = [hart for hart in self.harts if not hart.halted]
+            if not running:
+                break
+            if max_instructions is not None and self.instret >= max_instructions:
+                break
+            for hart in running:
+                try:
+                    hart.run(quantum)
+                except SimExit as exit:
+                    self.exit_code = exit.code
+                    break
+        return self.exit_code
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the firmware on an instruction set simulator of LeoSoC.')
+    parser.add_argument('firmware', help='firmware.elf or firmware.hex')
+    parser.add_argument('--uart0', default='', help='input of UART0, with Python escapes')
+    parser.add_argument('--uart1', default='', help='input of UART1, with Python escapes')
+    parser.add_argument('--input-mark', type=int, help='start the UART input at this sim_mark(), e.g. 1')
+    parser.add_argument('--input-cycle', type=int, default=0, help='start the UART input at this cycle')
+    parser.add_argument('--gpio', type=lambda value: int(value, 0), default=0, help='value of the GPIO0 inputs')
+    parser.add_argument('-n', '--max-instructions', type=int, help='stop after this many instructions')
+    parser.add_argument('-q', '--quantum', type=int, default=64, help='instructions of a hart per turn')
+    parser.add_argument('--seed', type=int, help='seed of the TRNG')
+    args = parser.parse_args()
+
+    simulator = Simulator(args.firmware, gpio_inputs=args.gpio, seed=args.seed, input_mark=args.input_mark,
+                          input_cycle=args.input_cycle)
+    soc = simulator.soc
+    soc.uart0.input.extend(args.uart0.encode().decode('unicode_escape').encode('latin-1'))
+    soc.uart1.input.extend(args.uart1.encode().decode('unicode_escape').encode('latin-1'))
+
+    start = time.perf_counter()
+    try:
+        exit_code = simulator.run(args.max_instructions, args.quantum)
+    except BusError as error:
+        sys.exit(f'Error: {error}')
+    elapsed = time.perf_counter() - start
+
+    for name, uart in (('uart0', soc.uart0), ('uart1', soc.uart1)):
+        if uart.output:
+            print(f'{name}: {uart.output.decode("ascii", errors="replace")!r}')
+    if soc.marks:
+        print(f'marks: {", ".join(str(mark) for mark in soc.marks)}')
+
+    instret = simulator.instret
+    print(f'{instret} instructions in {elapsed:.2f} s ({instret / elapsed / 1e6:.2f} MIPS), '
+          + ', '.join(f'hart {hart.mhartid}: {hart.instret}' + (' (halted)' if hart.halted else '')
+                      for hart in simulator.harts))
+
+    if exit_code is None:
+        sys.exit('Error: the firmware did not exit')
+    print(f'Exit code {exit_code}')
+    sys.exit(exit_code)
+
+if __name__ == '__main__':
+    main()
@@ -22,10 +22,13 @@ module leosoc_wrapper (
     output logic blink
 );
 
+    // Verilator traces with --trace-fst, see tb_toplevel.py
+`ifndef VERILATOR
     initial begin
         $dumpfile("dump.fst");
         $dumpvars(0, leosoc_wrapper);
     end
+`endif
 
     leosoc leosoc_i (
     `ifdef USE_POWER_PINS
@@ -41,7 +44,7 @@ module leosoc_wrapper (
         .uart1_rx,
         .uart1_tx,
         
-        .gpio0_in,
+        .gpio0_in       ({gpio0_in[31:24], flash_io[3:2], gpio0_in[21:0]}),
         .gpio0_out,
         .gpio0_oe,
 
@@ -49,16 +52,64 @@ module leosoc_wrapper (
         
         // SPI signals
         .sck,
-        .sdo,
-        .sdi,
+    `ifdef SPI_FLASH_MULTI_IO
+        .cs,
+        .flash_io_out,
+        .flash_io_oe,
+        .flash_io_in    (flash_io[1:0])
+    `else
+        .sdo            (flash_io[0]),
+        .sdi            (flash_io[1]),
         .cs
+    `endif
     );
+
+`ifdef SPI_FLASH_MULTI_IO
+    // Bidirectional io0 and io1, io2 and io3 on gpio0[23:22]
+    logic [1:0] flash_io_out;
+    logic [1:0] flash_io_oe;
+
+    assign flash_io[0] = flash_io_oe[0] ? flash_io_out[0] : 1'bz;
+    assign flash_io[1] = flash_io_oe[1] ? flash_io_out[1] : 1'bz;
+    assign flash_io[2] = gpio0_oe[22] ? gpio0_out[22] : 1'bz;
+    assign flash_io[3] = gpio0_oe[23] ? gpio0_out[23] : 1'bz;
+`endif
     
+`ifndef GL
+    // Simulation mailbox, see firmware/lib/sim.h
+    // Writes to these addresses have no effect on the SoC
+
+    localparam SIM_EXIT_ADDRESS = 32'h0E000000;
+    localparam SIM_MARK_ADDRESS = 32'h0E000004;
+    localparam SIM_EXIT_MAGIC   = 16'hC0DE;
+
+    logic        sim_exit = 1'b0;
+    logic [15:0] sim_exit_code = '0;
+    logic        sim_mark_strobe = 1'b0;
+    logic [31:0] sim_mark = '0;
+
+    always_ff @(posedge clk) begin
+        sim_mark_strobe <= 1'b0;
+        if (!reset && leosoc_i.mem_wstrb) begin
+            if (leosoc_i.mem_addr == SIM_EXIT_ADDRESS && leosoc_i.mem_wdata[31:16] == SIM_EXIT_MAGIC) begin
+                sim_exit <= 1'b1;
+                sim_exit_code <= leosoc_i.mem_wdata[15:0];
+            end
+            if (leosoc_i.mem_addr == SIM_MARK_ADDRESS) begin
+                sim_mark_strobe <= 1'b1;
+                sim_mark <= leosoc_i.mem_wdata;
+            end
+        end
+    end
+`endif
+
     // SPI signals
     wire sck;
-    wire sdo;
-    wire sdi;
     wire cs;
+    wire [3:0] flash_io;
+
+    pullup (flash_io[2]);
+    pullup (flash_io[3]);
 
     spiflash #(
         .INIT_F("../firmware/firmware.hex"),
@@ -66,10 +117,10 @@ module leosoc_wrapper (
     ) spiflash_inst (
         .csb    (cs),
         .clk    (sck),
-        .io0    (sdo), // MOSI
-        .io1    (sdi), // MISO
-        .io2    (),
-        .io3    ()
+        .io0    (flash_io[0]), // MOSI
+        .io1    (flash_io[1]), // MISO
+        .io2    (flash_io[2]),
+        .io3    (flash_io[3])
     );
 
 endmodule
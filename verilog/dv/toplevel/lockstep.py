@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Run the instruction set simulator in lockstep with the RTL
+
+Every time a hart of the RTL retires an instruction (retire of
+leorv32), the same hart of iss.py executes one instruction. The PC,
+the instruction word, instret and the register write (writeback, rd,
+rd_data) of the RTL are compared with the ISS, the test fails at the
+first instruction that differs.
+
+The harts of the ISS follow the order in which the RTL retires, so the
+shared WRAM sees the same sequence of accesses. The results of reads
+from the peripherals and of the cycle counter depend on the timing of
+the RTL and are taken over by the ISS instead of compared.
+"""
+
+from collections import deque
+
+import cocotb
+from cocotb.triggers import RisingEdge, ReadOnly
+
+from iss import Simulator, SimExit, BusError, NUM_HARTS
+
+# Retired instructions shown at a divergence
+HISTORY = 16
+
+class Lockstep:
+
+    def __init__(self, dut, firmware, wram=False, harts=NUM_HARTS):
+        self.dut = dut
+        self.simulator = Simulator(firmware, harts)
+        if wram:
+            self.simulator.soc.load_wram(firmware)
+        core_wrapper = dut.user_project_wrapper_i.leosoc_i.core_wrapper
+        self.cpus = [core_wrapper.cpus[hart].leorv32_inst for hart in range(harts)]
+        self.history = deque(maxlen=HISTORY)
+        self.retired = 0
+
+    def start(self):
+        for hart in range(len(self.cpus)):
+            cocotb.start_soon(self.follow(hart))
+
+    async def follow(self, hart):
+        cpu = self.cpus[hart]
+        while True:
+            await RisingEdge(cpu.retire)
+            await ReadOnly()
+            self.check(hart, cpu, self.simulator.harts[hart])
+
+    def fail(self, hart, pc, instr, message):
+        for entry in self.history:
+            self.dut._log.error('retired: hart {} PC 0x{:08X} 0x{:08X}'.format(*entry))
+        raise AssertionError(f'Lockstep: hart {hart} PC 0x{pc:08X} instruction 0x{instr:08X}: {message}')
+
+    def check(self, hart, cpu, model):
+        soc = self.simulator.soc
+
+        pc = cpu.PC.value.integer
+        instr = cpu.cur_instr.value.integer
+        if pc != model.pc:
+            self.fail(hart, pc, instr, f'the ISS is at PC 0x{model.pc:08X}')
+
+        expected = soc.read(pc)
+        if instr != expected:
+            self.fail(hart, pc, instr, f'the ISS fetched 0x{expected:08X}')
+
+        instret = cpu.instret.value.integer
+        if instret != model.instret:
+            self.fail(hart, pc, instr, f'instret is {instret}, {model.instret} in the ISS')
+
+        rd = (instr >> 7) & 0x1F
+        before = model.regs[rd]
+
+        soc.volatile = False
+        try:
+            model.step()
+        except SimExit:
+            pass # The testbench sees the exit of the RTL
+        except BusError as error:
+            self.fail(hart, pc, instr, str(error))
+
+        self.history.append((hart, pc, instr))
+        self.retired += 1
+
+        if cpu.writeback.value and rd != 0:
+            if not cpu.rd_data.value.is_resolvable:
+                self.fail(hart, pc, instr, f'x{rd} is written with {cpu.rd_data.value.binstr}')
+            value = cpu.rd_data.value.integer
+        else:
+            value = before
+
+        if soc.volatile:
+            # A peripheral or the cycle counter, the RTL knows better
+            model.regs[rd] = value if rd else 0
+        elif model.regs[rd] != value:
+            self.fail(hart, pc, instr, f'x{rd} is 0x{value:08X}, 0x{model.regs[rd]:08X} in the ISS')
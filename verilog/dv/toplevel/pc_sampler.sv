@@ -0,0 +1,106 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Sampling hook of profiler.py, simulation only
+// Every interval cycles the PC of the next retired instruction is
+// latched and sample pulses, so the testbench only wakes up once per
+// sample. A shadow call stack of the call sites is kept alongside,
+// calls and returns are detected as in the RISC-V return address
+// stack hints (rd/rs1 = ra or t0). Calls beyond STACK_DEPTH are only
+// counted, their returns are matched before the stored entries, and the
+// samples taken meanwhile are marked as truncated.
+module pc_sampler #(
+    parameter int STACK_DEPTH = 64
+) (
+    input clk,
+    input reset,
+
+    input [31:0] interval,  // cycles between samples, 0: off
+
+    input        retire,    // instruction retires
+    input [31:0] pc,        // of the retired instruction
+    input [31:0] instr,     // retired instruction
+
+    output logic        sample,         // pulse, new sample
+    output logic [31:0] sample_pc,      // sampled PC
+    output logic [31:0] sample_depth,       // valid entries of stack
+    output logic        sample_truncated    // inner call sites are missing
+);
+
+    localparam bit [6:0] OP_JAL  = 7'b1101111;
+    localparam bit [6:0] OP_JALR = 7'b1100111;
+
+    // Call sites, stack[0] is the outermost
+    logic [31:0] stack [STACK_DEPTH];
+    logic [31:0] depth;
+    logic [31:0] overflow;  // calls that did not fit
+
+    logic [ 6:0] opcode;
+    logic [ 4:0] rd;
+    logic [ 4:0] rs1;
+
+    assign opcode = instr[6:0];
+    assign rd     = instr[11:7];
+    assign rs1    = instr[19:15];
+
+    logic rd_link, rs1_link;
+    assign rd_link  = rd  == 5'd1 || rd  == 5'd5;
+    assign rs1_link = rs1 == 5'd1 || rs1 == 5'd5;
+
+    logic push, pop;
+    assign push = (opcode == OP_JAL || opcode == OP_JALR) && rd_link;
+    assign pop  = opcode == OP_JALR && rs1_link && (!rd_link || rd != rs1);
+
+    logic [31:0] counter;
+    logic        pending;
+
+    always_ff @(posedge clk) begin
+        sample <= 1'b0;
+
+        if (reset) begin
+            depth    <= '0;
+            overflow <= '0;
+            counter  <= '0;
+            pending  <= 1'b0;
+        end else begin
+            if (retire) begin
+                if (pending) begin
+                    sample           <= 1'b1;
+                    sample_pc        <= pc;
+                    sample_depth     <= depth;
+                    sample_truncated <= overflow != 0;
+                    pending          <= 1'b0;
+                end
+
+                // Pop, then push for a call through ra, the
+                // overflowed calls are popped first
+                if (pop && push) begin
+                    if (overflow == 0 && depth != 0) stack[depth - 1] <= pc;
+                end else if (pop) begin
+                    if (overflow != 0) overflow <= overflow - 1;
+                    else if (depth != 0) depth <= depth - 1;
+                end else if (push) begin
+                    if (depth < STACK_DEPTH) begin
+                        stack[depth] <= pc;
+                        depth <= depth + 1;
+                    end else begin
+                        overflow <= overflow + 1;
+                    end
+                end
+            end
+
+            // After the sample, so that a new request is not lost
+            if (interval != 0) begin
+                counter <= counter + 1;
+                if (counter >= interval - 1) begin
+                    counter <= '0;
+                    pending <= 1'b1;
+                end
+            end
+        end
+    end
+
+endmodule
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Report of the performance counters of peripheral_perf.sv
+
+The firmware writes the counters with perf_dump() of
+firmware/lib/perf.h as one line of hex words over a UART:
+
+    PERF <info> <counter 0> <counter 1> ...
+
+The lines are picked out of any text, e.g. the log of a terminal
+connected to the chip or the uart0 output of the testbench. With
+PERF_COUNTERS, tb_toplevel.py writes the same line from the counters
+of the RTL at the end of the simulation, so both are reported alike.
+
+Examples:
+
+    perf_report.py uart0.log                    all dumps in the log
+    perf_report.py sim_build/perf.txt --json perf.json
+    perf_report.py uart0.log -n -1              only the last dump
+"""
+
+import re
+import sys
+import json
+import argparse
+
+PERF_LINE = re.compile(r'PERF((?: [0-9A-Fa-f]{8})+)')
+
+SOC_NAMES = ['cycles', 'flash_reads', 'flash_busy', 'uart0_bytes', 'uart1_bytes', 'wram_conflicts']
+HART_NAMES = ['icache_hits', 'icache_misses', 'fetch_stall', 'execute_stall', 'grant_wait']
+
+def decode(words):
+    """The counters of one dump, info first, as a dictionary"""
+    info = words[0]
+    harts = info & 0xFF
+    soc_counters = (info >> 8) & 0xFF
+    hart_counters = (info >> 16) & 0xFF
+    counters = words[1:]
+    if len(counters) != soc_counters + hart_counters * harts:
+        raise ValueError(f'{len(counters)} counters, info 0x{info:08X} expects '
+                         f'{soc_counters + hart_counters * harts}')
+
+    # Counters unknown to this script keep their index
+    def names(known, count):
+        return known[:count] + [f'counter_{index}' for index in range(len(known), count)]
+
+    dump = dict(zip(names(SOC_NAMES, soc_counters), counters[:soc_counters]))
+    dump['harts'] = []
+    for hart in range(harts):
+        start = soc_counters + hart_counters * hart
+        dump['harts'].append(dict(zip(names(HART_NAMES, hart_counters), counters[start:start + hart_counters])))
+    return dump
+
+def parse(text):
+    """All dumps in the text"""
+    return [decode([int(word, 16) for word in match.group(1).split()]) for match in PERF_LINE.finditer(text)]
+
+def line(words):
+    """The line of perf_dump() for these words, info first"""
+    return 'PERF' + ''.join(f' {word:08X}' for word in words)
+
+def read_counters(dut):
+    """The info and the live counters of the RTL, for tb_toplevel.py with PERF_COUNTERS"""
+    counters = dut.user_project_wrapper_i.leosoc_i.perf0.peripheral_perf_i.counters
+    harts = (len(counters) - len(SOC_NAMES)) // len(HART_NAMES)
+    info = len(HART_NAMES) << 16 | len(SOC_NAMES) << 8 | harts
+    return [info] + [counters[index].value.integer for index in range(len(counters))]
+
+def percent(value, total):
+    return f'{value / total:7.2%}' if total else '      -'
+
+def report(dump):
+    cycles = dump.get('cycles', 0)
+    print(f'cycles          {cycles:>12}')
+
+    if 'flash_reads' in dump:
+        reads, busy = dump['flash_reads'], dump['flash_busy']
+        per_read = f'{busy / reads:.1f}' if reads else '-'
+        print(f'flash reads     {reads:>12}   {per_read} cycles per word')
+        print(f'flash busy      {busy:>12}   {percent(busy, cycles)} of the cycles')
+    for uart in ('uart0', 'uart1'):
+        if f'{uart}_bytes' in dump:
+            print(f'{uart} bytes     {dump[f"{uart}_bytes"]:>12}')
+    if 'wram_conflicts' in dump:
+        print(f'wram conflicts  {dump["wram_conflicts"]:>12}   {percent(dump["wram_conflicts"], cycles)} of the cycles')
+
+    for index, hart in enumerate(dump['harts']):
+        print(f'hart {index}')
+        if 'icache_hits' in hart:
+            lookups = hart['icache_hits'] + hart['icache_misses']
+            print(f'  icache hits   {hart["icache_hits"]:>12}   {percent(hart["icache_hits"], lookups)} hit rate')
+            print(f'  icache misses {hart["icache_misses"]:>12}')
+        for name, label in (('fetch_stall', 'fetch stall'), ('execute_stall', 'execute stall'),
+                            ('grant_wait', 'grant wait')):
+            if name in hart:
+                print(f'  {label:<13} {hart[name]:>12}   {percent(hart[name], cycles)} of the cycles')
+        for name, value in hart.items():
+            if name.startswith('counter_'):
+                print(f'  {name:<13} {value:>12}')
+
+    for name, value in dump.items():
+        if name.startswith('counter_'):
+            print(f'{name:<15} {value:>12}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the performance counters dumped by perf_dump().')
+    parser.add_argument('log', nargs='*', help='text with PERF lines, e.g. a UART log (default: stdin)')
+    parser.add_argument('-n', '--index', type=int, action='append', help='only this dump, -1 is the last (repeatable)')
+    parser.add_argument('--json', help='write the decoded dumps to this file')
+    args = parser.parse_args()
+
+    text = ''
+    if args.log:
+        for path in args.log:
+            with open(path, errors='replace') as reader:
+                text += reader.read()
+    else:
+        text = sys.stdin.read()
+
+    dumps = parse(text)
+    if not dumps:
+        sys.exit('Error: no PERF line found')
+    if args.index:
+        dumps = [dumps[index] for index in args.index]
+
+    for number, dump in enumerate(dumps):
+        if number:
+            print()
+        if len(dumps) > 1:
+            print(f'dump {number}')
+        report(dump)
+
+    if args.json:
+        with open(args.json, 'w') as writer:
+            json.dump(dumps, writer, indent=4)
+
+if __name__ == '__main__':
+    main()
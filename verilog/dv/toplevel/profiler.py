@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Sampling profiler for the firmware of the toplevel simulation
+
+pc_sampler.sv latches the PC of the next retired instruction of each
+hart every PROFILE cycles, together with a shadow call stack of the
+call sites. The testbench only wakes up on these samples and writes
+them to profile.json. This script maps them to the symbols (and with
+riscv32-unknown-elf-addr2line to the source lines) of firmware.elf.
+
+Examples:
+
+    profiler.py flat sim_build/profile.json firmware/firmware.elf
+    profiler.py callgraph sim_build/profile.json firmware/firmware.elf
+    profiler.py folded sim_build/profile.json firmware/firmware.elf > firmware.folded
+    profiler.py lines sim_build/profile.json firmware/firmware.elf -n 20
+
+The folded stacks can be read by flamegraph.pl or speedscope.
+"""
+
+import sys
+import json
+import mmap
+import bisect
+import shutil
+import struct
+import argparse
+import subprocess
+from collections import Counter, defaultdict
+
+ADDR2LINE = 'riscv32-unknown-elf-addr2line'
+
+SHT_SYMTAB = 2
+STT_NOTYPE = 0
+STT_FUNC = 2
+
+class Profiler:
+    """Collect the samples of pc_sampler in the testbench"""
+
+    def __init__(self, dut, interval, harts=2):
+        self.dut = dut
+        self.interval = interval
+        self.harts = harts
+        self.samples = [Counter() for _ in range(harts)]
+
+    def start(self):
+        import cocotb
+        self.dut.profile_interval.value = self.interval
+        for hart in range(self.harts):
+            cocotb.start_soon(self.collect(hart))
+
+    async def collect(self, hart):
+        from cocotb.triggers import RisingEdge, ReadOnly
+        sampler = self.dut.profile[hart].pc_sampler_i
+        while True:
+            await RisingEdge(sampler.sample)
+            await ReadOnly()
+            depth = sampler.sample_depth.value.integer
+            stack = tuple(sampler.stack[index].value.integer for index in range(depth))
+            truncated = bool(sampler.sample_truncated.value.integer)
+            self.samples[hart][(stack, sampler.sample_pc.value.integer, truncated)] += 1
+
+    def save(self, path):
+        samples = [{'hart': hart, 'stack': list(stack), 'pc': pc, 'truncated': truncated, 'count': count}
+                   for hart, counter in enumerate(self.samples)
+                   for (stack, pc, truncated), count in counter.items()]
+        with open(path, 'w') as writer:
+            json.dump({'interval': self.interval, 'samples': samples}, writer)
+        total = sum(sample['count'] for sample in samples)
+        self.dut._log.info(f'Wrote {total} samples to {path}')
+
+def elf_symbols(path):
+    """(address, name) of the functions and labels of the ELF, sorted by address"""
+    with open(path, 'rb') as reader:
+        data = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+    shoff, = struct.unpack_from('<I', data, 32)
+    shentsize, shnum = struct.unpack_from('<HH', data, 46)
+    sections = [struct.unpack_from('<10I', data, shoff + index * shentsize) for index in range(shnum)]
+
+    symbols = {}
+    for _, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize in sections:
+        if sh_type != SHT_SYMTAB:
+            continue
+        strtab = sections[sh_link][4]
+        for offset in range(sh_offset, sh_offset + sh_size, sh_entsize):
+            st_name, st_value, _, st_info, _, st_shndx = struct.unpack_from('<IIIBBH', data, offset)
+            name = data[strtab + st_name:data.find(b'\0', strtab + st_name)].decode()
+            kind = st_info & 0xF
+            if st_shndx == 0 or kind not in (STT_FUNC, STT_NOTYPE) or not name or name[0] in '.$':
+                continue
+            # Functions take precedence over labels at the same address
+            if kind == STT_FUNC or st_value not in symbols:
+                symbols[st_value] = name
+    return sorted(symbols.items())
+
+class Symbolizer:
+
+    def __init__(self, elf):
+        self.elf = elf
+        symbols = elf_symbols(elf)
+        self.addresses = [address for address, _ in symbols]
+        self.names = [name for _, name in symbols]
+
+    def function(self, pc):
+        index = bisect.bisect_right(self.addresses, pc) - 1
+        return self.names[index] if index >= 0 else f'0x{pc:08x}'
+
+    def lines(self, pcs):
+        """pc -> file:line, all PCs are resolved in one call of addr2line"""
+        if shutil.which(ADDR2LINE) is None:
+            sys.exit(f'Error: {ADDR2LINE} not found')
+        pcs = sorted(pcs)
+        output = subprocess.run([ADDR2LINE, '-e', self.elf] + [f'0x{pc:x}' for pc in pcs],
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        return dict(zip(pcs, output))
+
+def load_profile(path, harts=None):
+    with open(path) as reader:
+        profile = json.load(reader)
+    samples = [sample for sample in profile['samples'] if harts is None or sample['hart'] in harts]
+    return profile['interval'], samples
+
+def frames(sample, symbolizer):
+    """Functions from the outermost to the sampled one, ... for the call sites beyond the shadow stack"""
+    return ([symbolizer.function(pc) for pc in sample['stack']] + (['...'] if sample.get('truncated') else [])
+            + [symbolizer.function(sample['pc'])])
+
+def flat(samples, symbolizer, interval, count):
+    own = Counter()
+    total = Counter()
+    for sample in samples:
+        stack = frames(sample, symbolizer)
+        own[stack[-1]] += sample['count']
+        for function in set(stack):
+            total[function] += sample['count']
+
+    number = sum(own.values()) or 1
+    print(f'{number} samples, {interval} cycles each')
+    print(f'{"self %":>8}{"self":>8}{"total %":>9}{"total":>8}{"cycles":>12}  function')
+    for function, samples_own in own.most_common(count):
+        print(f'{samples_own / number * 100:8.2f}{samples_own:8d}{total[function] / number * 100:9.2f}'
+              f'{total[function]:8d}{samples_own * interval:12d}  {function}')
+
+def callgraph(samples, symbolizer, interval, count):
+    total = Counter()
+    callers = defaultdict(Counter)
+    callees = defaultdict(Counter)
+    for sample in samples:
+        stack = frames(sample, symbolizer)
+        for function in set(stack):
+            total[function] += sample['count']
+        for caller, callee in set(zip(stack, stack[1:])):
+            callers[callee][caller] += sample['count']
+            callees[caller][callee] += sample['count']
+
+    number = sum(sample['count'] for sample in samples) or 1
+    for function, samples_total in total.most_common(count):
+        print(f'{function}: {samples_total / number * 100:.2f}% ({samples_total * interval} cycles)')
+        for caller, samples_caller in callers[function].most_common():
+            print(f'    <- {caller:<30}{samples_caller:8d}')
+        for callee, samples_callee in callees[function].most_common():
+            print(f'    -> {callee:<30}{samples_callee:8d}')
+
+def folded(samples, symbolizer, interval, count):
+    stacks = Counter()
+    for sample in samples:
+        stacks[';'.join([f'hart{sample["hart"]}'] + frames(sample, symbolizer))] += sample['count']
+    for stack, samples_stack in sorted(stacks.items()):
+        print(f'{stack} {samples_stack}')
+
+def lines(samples, symbolizer, interval, count):
+    locations = symbolizer.lines({sample['pc'] for sample in samples})
+    own = Counter()
+    for sample in samples:
+        own[(symbolizer.function(sample['pc']), locations[sample['pc']])] += sample['count']
+
+    number = sum(own.values()) or 1
+    print(f'{"self %":>8}{"self":>8}  {"function":<24}line')
+    for (function, location), samples_own in own.most_common(count):
+        print(f'{samples_own / number * 100:8.2f}{samples_own:8d}  {function:<24}{location}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the samples of the PC sampling profiler.')
+    parser.add_argument('report', choices=['flat', 'callgraph', 'folded', 'lines'], help='type of the report')
+    parser.add_argument('profile', help='profile.json of the testbench')
+    parser.add_argument('elf', help='firmware ELF')
+    parser.add_argument('-n', '--count', type=int, default=None, help='number of entries')
+    parser.add_argument('--hart', type=int, action='append', help='only this hart (can be repeated)')
+    args = parser.parse_args()
+
+    interval, samples = load_profile(args.profile, args.hart)
+    symbolizer = Symbolizer(args.elf)
+
+    report = {'flat': flat, 'callgraph': callgraph, 'folded': folded, 'lines': lines}[args.report]
+    report(samples, symbolizer, interval, args.count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+File list of the toplevel simulation from sources.json
+
+Every hardened block of the design has a behavioural (rtl) and a
+gate-level (gl) view. A block at gate level replaces the blocks it
+contains, e.g. the netlist of user_project_wrapper already includes
+leosoc, while the macros inside it (TRNGs, SRAM) are still chosen
+separately. This way the cost of a gate-level simulation is only
+spent on the block under signoff.
+
+The standard cells are added as soon as one block is at gate level.
+"signoff" lists the blocks of a full gate-level simulation (GL=1).
+The netlists in verilog/gl are written by hardening the block, a
+missing one is an error before anything is compiled.
+
+Examples:
+
+    sources.py                        everything behavioural
+    sources.py --gl leosoc            leosoc at gate level
+    sources.py --gl 'trng_*' --gl gf180_ram_512x8_wrapper
+    sources.py --signoff              the same as GL=1
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import argparse
+from pathlib import Path
+
+MANIFEST = Path(__file__).resolve().parent / 'sources.json'
+NETLIST_DIR = (MANIFEST.parent / '../../gl').resolve()
+
+class Sources:
+
+    def __init__(self, files, defines, levels):
+        self.files = files      # Paths in compilation order
+        self.defines = defines  # list of (name, value)
+        self.levels = levels    # block -> 'rtl', 'gl' or None if it is part of a netlist
+
+    def gate_level(self, block):
+        """Whether the block is simulated from a netlist, its own or of a parent"""
+        return self.levels[block] != 'rtl'
+
+def load_manifest(path=MANIFEST):
+    with open(path) as reader:
+        return json.load(reader)
+
+def resolve(path):
+    path = os.path.expandvars(path)
+    if '$' in path:
+        raise ValueError(f'{path}: environment variable not set')
+    return (MANIFEST.parent / path).resolve()
+
+def select(patterns, manifest=None):
+    """The sources with the blocks matching one of the patterns at gate level"""
+    manifest = manifest or load_manifest()
+    blocks = manifest['blocks']
+
+    gate_level = set()
+    for pattern in patterns:
+        matches = fnmatch.filter(blocks, pattern)
+        if not matches:
+            raise ValueError(f'no block matches {pattern!r}, the blocks are: {", ".join(blocks)}')
+        gate_level.update(matches)
+
+    # Blocks inside a netlist are not compiled again
+    levels = {name: 'gl' if name in gate_level else 'rtl' for name in blocks}
+    for name in gate_level:
+        for child in blocks[name].get('contains', []):
+            levels[child] = None
+
+    files = [resolve(path) for path in manifest['testbench']]
+    defines = {}
+    for name, block in blocks.items():
+        level = levels[name]
+        if level is None:
+            continue
+        for path in map(resolve, block[level]):
+            if level == 'gl' and path.parent == NETLIST_DIR and not path.exists():
+                raise ValueError(f'the gate-level netlist of {name} is missing: {path} is written by '
+                                 f'hardening {name}, e.g. "make {name}" or "openlane/harden.py {name}"')
+            files.append(path)
+        defines.update(block.get(f'{level}_defines', {}))
+
+    if gate_level:
+        files += [resolve(path) for path in manifest['cells']]
+        defines.update(manifest['cells_defines'])
+        # The netlists have power pins, the behavioural views next to them as well
+        defines['USE_POWER_PINS'] = 1
+
+    return Sources(files, list(defines.items()), levels)
+
+def from_environment(gl, gl_blocks, manifest=None):
+    """GL_BLOCKS is a comma-separated list of patterns, GL alone selects the signoff blocks"""
+    manifest = manifest or load_manifest()
+    if gl_blocks:
+        patterns = [pattern.strip() for pattern in gl_blocks.split(',') if pattern.strip()]
+    elif gl:
+        patterns = manifest['signoff']
+    else:
+        patterns = []
+    return select(patterns, manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the file list of the toplevel simulation.')
+    parser.add_argument('--gl', action='append', default=[], help='block at gate level, can be a pattern')
+    parser.add_argument('--signoff', action='store_true', help='all blocks of a full gate-level simulation')
+    parser.add_argument('--defines', action='store_true', help='print the defines as +define+ arguments too')
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    try:
+        sources = select(args.gl + (manifest['signoff'] if args.signoff else []), manifest)
+    except ValueError as error:
+        sys.exit(f'Error: {error}')
+
+    if args.defines:
+        for name, value in sources.defines:
+            print(f'+define+{name}={value}')
+    for path in sources.files:
+        print(path)
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,134 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import sys
+import json
+import fcntl
 import random
+import hashlib
+import subprocess
 from pathlib import Path
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.runner import get_runner
-from cocotb.triggers import Timer, RisingEdge, FallingEdge
+from cocotb.triggers import Timer, RisingEdge, FallingEdge, ClockCycles, with_timeout
+from cocotb.result import SimTimeoutError
 from cocotb.types import LogicArray
+from cocotb.utils import get_sim_time
 
 from cocotbext.uart import UartSource, UartSink
 
+from backdoor import Backdoor
+from profiler import Profiler
+from tracer import Tracer, scopes
+from sources import from_environment
+from fetch_trace import FetchTrace
+from lockstep import Lockstep
+from perf_report import read_counters, line
+
 from random import randint
 
 ENV_GL = os.getenv("GL", None)
-ENV_PDK_ROOT = os.getenv("PDK_ROOT")
+
+# Blocks at gate level, e.g. leosoc or trng_*, see sources.json
+ENV_GL_BLOCKS = os.getenv("GL_BLOCKS", None)
+
+# Simulator, icarus or verilator
+ENV_SIM = os.getenv("SIM", "icarus")
+
+# Number of threads of the Verilator model
+ENV_THREADS = int(os.getenv("THREADS", 4))
+
+# Record an FST trace of the whole model with Verilator
+ENV_WAVES = os.getenv("WAVES", None)
+
+# Dump these scopes with Icarus, see tracer.py
+ENV_TRACE = os.getenv("TRACE", None)
+
+# Only dump from this event on, e.g. write:0x0E000004=1 or uart:A
+ENV_TRACE_TRIGGER = os.getenv("TRACE_TRIGGER", None)
+
+# Cycles to dump after the trigger, 0: until the end
+ENV_TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", 0))
+
+# Cycles of the bus kept before the trigger or a failure
+ENV_TRACE_PRE = int(os.getenv("TRACE_PRE", 1024))
+
+try:
+    SOURCES = from_environment(ENV_GL, ENV_GL_BLOCKS)
+except ValueError as error:
+    sys.exit(f"Error: {error}")
+
+# Without a behavioural leosoc there is no mailbox and the hierarchy is flattened
+SOC_GL = SOURCES.gate_level("leosoc")
+POWER_PINS = "USE_POWER_PINS" in dict(SOURCES.defines)
+
+ENV_TRACING = (ENV_TRACE is not None or ENV_TRACE_TRIGGER is not None) and not SOC_GL
+
+# Load this firmware.elf or .hex from Python instead of firmware.hex
+ENV_FIRMWARE = os.getenv("FIRMWARE", None)
+
+# Replace the SPI flash controller with a behavioural port
+ENV_FAST_FLASH = os.getenv("FAST_FLASH", None)
+
+# Sample the PC of both harts every PROFILE cycles into profile.json
+ENV_PROFILE = int(os.getenv("PROFILE", 0))
+
+# Build and test directory, the regression gives every job its own
+ENV_SIM_BUILD = os.getenv("SIM_BUILD", None)
+
+# Record the instruction fetches of both harts into this .npz file
+ENV_FETCH_TRACE = os.getenv("FETCH_TRACE", None)
+
+# Write the hit rate and CPI of both harts into this .json file
+ENV_ICACHE_STATS = os.getenv("ICACHE_STATS", None)
+
+# Instruction cache geometry, lines x words per line x ways, e.g. 32x4x2
+ENV_ICACHE = os.getenv("ICACHE", None)
+
+# Read mode of the flash controller, e.g. QUAD_IO, see spi_flash.sv
+ENV_FLASH_MODE = os.getenv("FLASH_MODE", None)
+
+# Interconnect of the cores, CROSSBAR or SHARED, and the arbiter, e.g.
+# SHARED:PRIORITY, see crossbar.sv
+ENV_INTERCONNECT = os.getenv("INTERCONNECT", None)
+
+# Banks of the WRAM x words interleaved per bank, e.g. 2x1, see wram_banked.sv;
+# unset is the single WRAM of the taped-out leosoc
+ENV_WRAM = os.getenv("WRAM", None)
+WRAM_BANKS, WRAM_INTERLEAVE = (int(value) for value in ENV_WRAM.split("x")) if ENV_WRAM else (None, 1)
+
+# Write the performance counters at the end into this file, see perf_report.py
+ENV_PERF_COUNTERS = os.getenv("PERF_COUNTERS", None)
+
+# Compare every retired instruction with iss.py
+ENV_LOCKSTEP = os.getenv("LOCKSTEP", None)
+
+# Run a firmware other than main.c, e.g. wram_bench.c, without the UART
+# test until it exits and write its UART0 output into this file
+ENV_BENCHMARK = os.getenv("BENCHMARK", None)
+
+# The performance counters of leosoc are only built for these
+PERF = bool(ENV_PERF_COUNTERS or ENV_BENCHMARK)
+
+# Watchdog, the test fails if the firmware does not exit in time
+ENV_TIMEOUT = int(os.getenv("TIMEOUT", 2_000_000)) # cycles
+
+CLOCK_PERIOD = 25 # ns
+
+# Variants run by ../regression.py, name -> environment; gl only with --gl
+REGRESSION = {
+    "rtl": {},
+    "gl": {"GL": "1"},
+    "dual_io": {"FLASH_MODE": "DUAL_IO"},
+    "quad_io": {"FLASH_MODE": "QUAD_IO"},
+    "shared": {"INTERCONNECT": "SHARED"},
+    "wram_2x1": {"WRAM": "2x1"},
+}
+
+# Simulation mailbox, see firmware/lib/sim.h
+MARK_UART0_READY = 1
 
 # Reset coroutine
 async def reset_dut(rst, duration_ns):
@@ -36,8 +149,6 @@ async def simple_test(dut):
     await cocotb.start(c.start())
 
     # Reset values
-    dut.sdi.value = 0
-
     uart0_source = UartSource(dut.uart0_rx, baud=115200, bits=8)
     uart0_sink   = UartSink(dut.uart0_tx, baud=115200, bits=8)
     
@@ -46,154 +157,229 @@ async def simple_test(dut):
     
     dut.gpio0_in.value = 42;
 
-    if ENV_GL: # Apply power for gate-level simulation
+    if POWER_PINS: # Apply power for gate-level simulation
         dut.vdd.value = 1
         dut.vss.value = 0
 
+    if ENV_FIRMWARE and not SOC_GL:
+        # After the initial $readmemh of the flash model
+        await Timer(1, units="ns")
+        backdoor = Backdoor(dut, WRAM_BANKS, WRAM_INTERLEAVE)
+        backdoor.load_flash(ENV_FIRMWARE)
+        if not ENV_FIRMWARE.endswith('.hex'):
+            backdoor.load_wram(ENV_FIRMWARE)
+
+    if ENV_PROFILE and not SOC_GL:
+        profiler = Profiler(dut, ENV_PROFILE)
+        profiler.start()
+
+    if (ENV_FETCH_TRACE or ENV_ICACHE_STATS) and not SOC_GL:
+        fetch_trace = FetchTrace(dut, record=bool(ENV_FETCH_TRACE))
+        fetch_trace.start()
+
+    if ENV_LOCKSTEP and not SOC_GL:
+        # The same image as the flash model, and the WRAM as the backdoor
+        firmware = ENV_FIRMWARE or str(Path(__file__).resolve().parent / "firmware/firmware.hex")
+        lockstep = Lockstep(dut, firmware, wram=bool(ENV_FIRMWARE) and not ENV_FIRMWARE.endswith('.hex'))
+        lockstep.start()
+
+    tracer = None
+    if ENV_TRACING:
+        tracer = Tracer(dut, ENV_TRACE_TRIGGER, ENV_TRACE_WINDOW, CLOCK_PERIOD)
+        tracer.start()
+
     # Execution will block until reset_dut has completed
     await reset_dut(dut.reset, 50)
-    
-    # Wait for 100 clock cycles
-    for i in range(100):
-        await FallingEdge(dut.clk)
-    
-    # Wait for 500000 clock cycles
-    for i in range(500000):
-        await FallingEdge(dut.clk)
-        
-    await uart0_source.write(b'test data!!!')
-    await uart0_source.wait()
-    
+    start = get_sim_time('ns')
+
+    try:
+        await run_firmware(dut, uart0_source, uart0_sink, uart1_sink)
+    except (AssertionError, SimTimeoutError) as error:
+        # Keep the cycles before the failure
+        if tracer:
+            await tracer.capture(f"{type(error).__name__} {error}")
+        raise
+
+    if ENV_PROFILE and not SOC_GL:
+        profiler.save("profile.json")
+
+    if ENV_FETCH_TRACE and not SOC_GL:
+        fetch_trace.save(ENV_FETCH_TRACE)
+
+    if ENV_ICACHE_STATS and not SOC_GL:
+        fetch_trace.save_statistics(ENV_ICACHE_STATS, round((get_sim_time('ns') - start) / CLOCK_PERIOD))
+
+    if ENV_PERF_COUNTERS and not SOC_GL:
+        with open(ENV_PERF_COUNTERS, "w") as writer:
+            writer.write(line(read_counters(dut)) + "\n")
+
+    if ENV_LOCKSTEP and not SOC_GL:
+        dut._log.info(f"Lockstep: {lockstep.retired} instructions match the ISS")
+
+    dut._log.info("Simulation done")
+
+async def run_firmware(dut, uart0_source, uart0_sink, uart1_sink):
+    """Talk to the firmware until it exits and check the UART output"""
+    if ENV_BENCHMARK and not SOC_GL:
+        await with_timeout(RisingEdge(dut.sim_exit), ENV_TIMEOUT * CLOCK_PERIOD, 'ns')
+        exit_code = dut.sim_exit_code.value.integer
+        dut._log.info(f"Benchmark exited with code {exit_code} after {get_sim_time('ns') / CLOCK_PERIOD:.0f} cycles")
+
+        data0 = uart0_sink.read_nowait()
+        dut._log.info(f"uart0: {data0.decode('ascii')}")
+        with open(ENV_BENCHMARK, "wb") as writer:
+            writer.write(data0)
+        assert exit_code == 0
+        return
+
+    if SOC_GL:
+        # The mailbox is not available in the gate-level netlist
+        await ClockCycles(dut.clk, 500100)
+        await uart0_source.write(b'test data!!!\n')
+        await uart0_source.wait()
+        await ClockCycles(dut.clk, 10000)
+    else:
+        # Wait until the firmware is ready for input
+        await with_timeout(RisingEdge(dut.sim_mark_strobe), ENV_TIMEOUT * CLOCK_PERIOD, 'ns')
+        assert dut.sim_mark.value == MARK_UART0_READY
+
+        await uart0_source.write(b'test data!!!\n')
+
+        # Wait until the firmware is done
+        await with_timeout(RisingEdge(dut.sim_exit), ENV_TIMEOUT * CLOCK_PERIOD, 'ns')
+        exit_code = dut.sim_exit_code.value.integer
+        dut._log.info(f"Firmware exited with code {exit_code} after {get_sim_time('ns') / CLOCK_PERIOD:.0f} cycles")
+        assert exit_code == 0
+
     data0 = uart0_sink.read_nowait()
     dut._log.info(f"uart0: {data0.decode('ascii')}")
+    assert data0.endswith(b'test data!!!\n')
 
     data1 = uart1_sink.read_nowait()
     dut._log.info(f"uart1: {data1.decode('ascii')}")
-    
-    dut._log.info("Simulation done")
+    assert data1 == b'Core 1\n'
+
+def build_key(sim, hdl_toplevel, verilog_sources, defines, build_args):
+    """Hash of everything that goes into the compiled model"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([sim, hdl_toplevel, defines, build_args]).encode())
+    for source in verilog_sources:
+        digest.update(Path(source).read_bytes())
+    return digest.hexdigest()[:16]
+
+def build_firmware(firmware_dir):
+    """firmware.hex of main.c for the flash model, make only rebuilds what changed
+
+    The regression runs several variants at once, they build one after the other.
+    """
+    with open(firmware_dir / ".make.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        subprocess.run(["make", "firmware.hex"], cwd=firmware_dir, check=True)
 
 def test_runner():
 
-    sim = "icarus" #"verilator"
+    sim = ENV_SIM
     proj_path = Path(__file__).resolve().parent
+    sim_build = Path(ENV_SIM_BUILD).resolve() if ENV_SIM_BUILD else proj_path / "sim_build"
 
-    if ENV_GL:
-        verilog_sources = [
-	        proj_path / "user_project_wrapper_wrapper.sv",
-        
-	        proj_path / "../../gl/user_project_wrapper.v",
-
-            proj_path / "../../gl/trng_1x3.v",
-            proj_path / "../../gl/trng_1x5.v",
-            proj_path / "../../gl/trng_1x7.v",
-            proj_path / "../../gl/trng_2x3.v",
-            proj_path / "../../gl/trng_2x5.v",
-            proj_path / "../../gl/trng_2x7.v",
-            proj_path / "../../gl/trng_8x3.v",
-            proj_path / "../../gl/trng_8x5.v",
-            proj_path / "../../gl/trng_8x7.v",
-            proj_path / "../../gl/trng_32x3.v",
-            proj_path / "../../gl/trng_32x5.v",
-            proj_path / "../../gl/trng_32x7.v",
-            proj_path / "../../gl/trng_128x3.v",
-            proj_path / "../../gl/trng_128x5.v",
-            proj_path / "../../gl/trng_128x7.v",
-            
-	        proj_path / "../../gl/gf180_ram_512x8_wrapper.v",
-	        
-	        proj_path / "../../rtl/spi_flash/tb/spiflash.v",
-
-	        #proj_path / "../../rtl/gf180mcu_fd_ip_sram__sram512x8m8wm1.v" # TODO from PDK
-	        
-	        Path(ENV_PDK_ROOT) / "gf180mcuD/libs.ref/gf180mcu_fd_sc_mcu7t5v0/verilog/primitives.v",
-	        Path(ENV_PDK_ROOT) / "gf180mcuD/libs.ref/gf180mcu_fd_sc_mcu7t5v0/verilog/gf180mcu_fd_sc_mcu7t5v0.v",
-	        
-	        Path(ENV_PDK_ROOT) / "gf180mcuD/libs.ref/gf180mcu_fd_ip_sram/verilog/gf180mcu_fd_ip_sram__sram512x8m8wm1.v"
-        ]
-    else:
-        verilog_sources = [
-	        proj_path / "user_project_wrapper_wrapper.sv",
-
-	        proj_path / "../../rtl/defines.v",
-	        proj_path / "../../rtl/user_project_wrapper.v",
-	        proj_path / "../../rtl/leorv32/rtl/leorv32_pkg.sv",
-	        proj_path / "../../rtl/leorv32/rtl/leorv32.sv",
-	        proj_path / "../../rtl/soc/rtl/leosoc.sv",
-	        proj_path / "../../rtl/soc/rtl/core_wrapper.sv",
-	        proj_path / "../../rtl/cache/rtl/direct_mapped_cache.sv",
-	        proj_path / "../../rtl/sram/rtl/sram_gf180.sv",
-	        proj_path / "../../rtl/arbiter/rtl/arbiter.sv",
-	        proj_path / "../../rtl/uart/rtl/uart_rx.sv",
-	        proj_path / "../../rtl/uart/rtl/uart_tx.sv",
-	        proj_path / "../../rtl/uart/rtl/peripheral_uart.sv",
-	        proj_path / "../../rtl/gpio/rtl/peripheral_gpio.sv",
-	        proj_path / "../../rtl/peripheral_trng/rtl/peripheral_trng.sv",
-	        proj_path / "../../rtl/spi_flash/rtl/spi_flash.sv",
-	        proj_path / "../../rtl/util/rtl/synchronizer.sv",
-
-            proj_path / "../../rtl/trng_configs/trng_1x3_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_1x5_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_1x7_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_2x3_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_2x5_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_2x7_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_8x3_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_8x5_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_8x7_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_32x3_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_32x5_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_32x7_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_128x3_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_128x5_model.sv",
-            proj_path / "../../rtl/trng_configs/trng_128x7_model.sv",
-	        
-	        proj_path / "../../rtl/spi_flash/tb/spiflash.v",
-
-	        proj_path / "../../rtl/gf180_ram_512x8_wrapper.v",
-	        proj_path / "../../rtl/gf180mcu_fd_ip_sram__sram512x8m8wm1.v" # TODO from PDK
-        ]
+    # A FIRMWARE loaded by the backdoor does not need the RISC-V toolchain
+    if not ENV_FIRMWARE or SOC_GL:
+        build_firmware(proj_path / "firmware")
+
+    verilog_sources = list(SOURCES.files)
 
     defines = [
         ("COCOTB", 1),
         ("GF180", 1)
-    ]
-    
-    if ENV_GL:
-        defines.append(("USE_POWER_PINS", 1))
-        defines.append(("FUNCTIONAL", 1))
-        defines.append(("MGM_BG_0", '#1')) # Delay
-        defines.append(("MGM_BG_1", '#1')) # Delay
-        defines.append(("MGM_BG_2", '#1')) # Delay
-        defines.append(("MGM_BG_3", '#1')) # Delay
-        defines.append(("MGM_BG_4", '#1')) # Delay
-        defines.append(("MGM_BG_5", '#1')) # Delay
-        defines.append(("MGM_BG_6", '#1')) # Delay
-        defines.append(("MGM_BG_7", '#1')) # Delay
-        defines.append(("MGM_BG_8", '#1')) # Delay
-        defines.append(("MGM_BG_9", '#1')) # Delay
-        defines.append(("MGM_BG_10", '#1')) # Delay
-        defines.append(("MGM_BG_11", '#1')) # Delay
-        defines.append(("MGM_BG_12", '#1')) # Delay
-        defines.append(("MGM_BG_13", '#1')) # Delay
-        defines.append(("MGM_BG_14", '#1')) # Delay
-    
+    ] + SOURCES.defines
+
+    if ENV_FAST_FLASH and not SOC_GL:
+        defines.append(("FAST_FLASH", 1))
+        verilog_sources.append(proj_path / "../../rtl/spi_flash/tb/spi_flash_fast.sv")
+
+    # Without TRACE nothing is dumped
+    trace_scopes = scopes(ENV_TRACE or "all") if ENV_TRACING else None
+    if ENV_TRACING:
+        defines.append(("TRACE", 1))
+        defines.append(("TRACE_PRE_DEPTH", ENV_TRACE_PRE))
+        if trace_scopes:
+            defines.append(("TRACE_SCOPES", trace_scopes))
+        verilog_sources.append(proj_path / "trace_control.sv")
+
+    # The parameters of leosoc, the defaults of leosoc.sv unless set;
+    # the fast reads, the banks of the WRAM and the performance counters
+    # change the taped-out leosoc and are only built when needed
+    if (ENV_ICACHE or ENV_FLASH_MODE or ENV_INTERCONNECT or ENV_WRAM or PERF) and not SOC_GL:
+        size, line_words, ways = (int(value) for value in (ENV_ICACHE or "32x1x1").split("x"))
+        interconnect, _, arbiter = (ENV_INTERCONNECT or "CROSSBAR").partition(":")
+        if (ENV_FLASH_MODE or "SINGLE") != "SINGLE":
+            defines.append(("SPI_FLASH_MULTI_IO", 1))
+        if ENV_WRAM:
+            defines.append(("WRAM_BANKED", 1))
+        defines.append(("LEOSOC_PARAMETERS", 1))
+        defines.append(("INSTR_CACHE_SIZE", size))
+        defines.append(("INSTR_CACHE_LINE_WORDS", line_words))
+        defines.append(("INSTR_CACHE_WAYS", ways))
+        defines.append(("SPI_FLASH_READ_MODE", f'"{ENV_FLASH_MODE or "SINGLE"}"'))
+        defines.append(("SPI_FLASH_DUMMY_CYCLES", 8)) # LATENCY of spiflash.v
+        defines.append(("SPI_FLASH_CONTINUOUS_READ", 1))
+        defines.append(("INTERCONNECT", f'"{interconnect}"'))
+        defines.append(("ARBITER", f'"{arbiter or "ROUNDROB"}"'))
+        defines.append(("WRAM_BANKS", WRAM_BANKS or 1))
+        defines.append(("WRAM_INTERLEAVE", WRAM_INTERLEAVE))
+        defines.append(("PERF_COUNTERS", int(PERF)))
+
     hdl_toplevel = "user_project_wrapper_wrapper"
-    build_args=[]#["-Wno-fatal", "--timing", "--trace-fst", "--trace-structs"]
+
+    if sim == "verilator":
+        build_args = ["-Wno-fatal", "--timing", "--threads", str(ENV_THREADS)]
+        if ENV_WAVES:
+            build_args += ["--trace-fst", "--trace-structs"]
+    else:
+        build_args = []
+
+    # Only build again if the sources, defines or flags changed,
+    # a new firmware does not need a new model
+    build_dir = sim_build / f"{sim}-{build_key(sim, hdl_toplevel, verilog_sources, defines, build_args)}"
 
     runner = get_runner(sim)
 
-    runner.build(
-        verilog_sources=verilog_sources,
-        defines=defines,
-        build_args=build_args,
-        hdl_toplevel=hdl_toplevel,
-        always=True,
-    )
+    if (build_dir / "build.json").exists():
+        print(f"Using the cached model in {build_dir}")
+    else:
+        runner.build(
+            verilog_sources=verilog_sources,
+            defines=defines,
+            build_args=build_args,
+            hdl_toplevel=hdl_toplevel,
+            build_dir=build_dir,
+            always=True,
+            waves=sim == "verilator" and bool(ENV_WAVES),
+        )
+
+        with open(build_dir / "build.json", "w") as writer:
+            json.dump({
+                "sim": sim,
+                "sources": [str(source) for source in verilog_sources],
+                "defines": defines,
+                "build_args": build_args
+            }, writer, indent=4)
+
+    # The flash model reads the firmware relative to the test directory,
+    # which can be anywhere
+    firmware_hex = os.path.relpath(proj_path / "firmware/firmware.hex", sim_build)
 
-    runner.test(
+    return runner.test(
         hdl_toplevel=hdl_toplevel,
         test_module="tb_toplevel,",
-        plusargs=['-fst']
+        build_dir=build_dir,
+        test_dir=sim_build,
+        waves=sim == "verilator" and bool(ENV_WAVES),
+        extra_env={name: str(Path(value).resolve()) for name, value in
+                   [("FIRMWARE", ENV_FIRMWARE), ("FETCH_TRACE", ENV_FETCH_TRACE),
+                    ("ICACHE_STATS", ENV_ICACHE_STATS), ("PERF_COUNTERS", ENV_PERF_COUNTERS),
+                    ("BENCHMARK", ENV_BENCHMARK)] if value},
+        plusargs=[f"+firmware={firmware_hex}"] + (['-fst'] if sim == "icarus" and trace_scopes else [])
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Trigger and pre-trigger buffer of tracer.py, simulation only
+// The trigger is an access to any of the NUM_PORTS buses that matches
+// an address and optionally the data, or a cycle count. The waveform
+// dump is enabled for window cycles after the trigger (0: until the
+// end). All buses of the last PRE_DEPTH cycles (0: none) are kept in a
+// ring buffer, which stops at the trigger so that the testbench can
+// read it out.
+module trace_control #(
+    parameter int PRE_DEPTH = 1024,
+    parameter int NUM_PORTS = 1     // buses served in the same cycle, e.g. the targets of a crossbar
+) (
+    input clk,
+    input reset,
+
+    // SoC buses, port n in the bits of n
+    input [32*NUM_PORTS-1:0] mem_addr,
+    input [32*NUM_PORTS-1:0] mem_wdata,
+    input [ 4*NUM_PORTS-1:0] mem_wmask,
+    input [   NUM_PORTS-1:0] mem_wstrb,
+    input [32*NUM_PORTS-1:0] mem_rdata,
+    input [   NUM_PORTS-1:0] mem_rstrb,
+    input [   NUM_PORTS-1:0] mem_done,
+
+    // Set by the testbench
+    input [ 2:0] trigger_mode,  // see TRIGGER_*
+    input [31:0] trigger_addr,
+    input [31:0] trigger_data,
+    input [31:0] trigger_mask,  // data bits to compare, 0: any data
+    input [31:0] trigger_cycle,
+    input [31:0] window,        // cycles to dump after the trigger, 0: until the end
+
+    output logic        trigger,    // pulse
+    output logic        triggered,
+    output logic        dumping,
+    output logic [31:0] cycle,
+
+    output logic [31:0] ring_index, // next entry to be written
+    output logic [31:0] ring_count  // valid entries
+);
+
+    localparam bit [2:0] TRIGGER_NONE  = 3'd0; // dump from the start
+    localparam bit [2:0] TRIGGER_WRITE = 3'd1;
+    localparam bit [2:0] TRIGGER_READ  = 3'd2;
+    localparam bit [2:0] TRIGGER_ANY   = 3'd3;
+    localparam bit [2:0] TRIGGER_CYCLE = 3'd4;
+
+    // {mem_addr, mem_wdata, mem_rdata, mem_wmask, mem_wstrb, mem_rstrb, mem_done} of a port
+    localparam int PROBE_WIDTH = 3*32 + 4 + 3;
+
+    logic [NUM_PORTS-1:0] address_match;
+    logic [NUM_PORTS-1:0] data_match;
+
+    // An entry of the ring buffer, port 0 in the MSBs
+    logic [NUM_PORTS*PROBE_WIDTH-1:0] probe;
+
+    for (genvar port = 0; port < NUM_PORTS; port++) begin : ports
+        assign address_match[port] = mem_addr[32*port+:32] == trigger_addr;
+        assign data_match[port] = (mem_wdata[32*port+:32] & trigger_mask) == (trigger_data & trigger_mask);
+
+        assign probe[PROBE_WIDTH*(NUM_PORTS-1-port)+:PROBE_WIDTH] = {
+            mem_addr[32*port+:32], mem_wdata[32*port+:32], mem_rdata[32*port+:32],
+            mem_wmask[4*port+:4], mem_wstrb[port], mem_rstrb[port], mem_done[port]
+        };
+    end
+
+    logic match;
+    always_comb begin
+        match = 1'b0;
+        case (trigger_mode)
+            TRIGGER_WRITE:  match = |(mem_wstrb & address_match & data_match);
+            TRIGGER_READ:   match = |(mem_rstrb & mem_done & address_match);
+            TRIGGER_ANY:    match = |((mem_wstrb | mem_rstrb) & address_match);
+            TRIGGER_CYCLE:  match = cycle == trigger_cycle;
+            default:        match = 1'b0;
+        endcase
+    end
+
+    logic [31:0] remaining;
+
+    always_ff @(posedge clk) begin
+        trigger <= 1'b0;
+
+        if (reset) begin
+            triggered  <= 1'b0;
+            dumping    <= trigger_mode == TRIGGER_NONE;
+            cycle      <= '0;
+            remaining  <= '0;
+        end else begin
+            cycle <= cycle + 1;
+
+            if (match && !triggered) begin
+                trigger   <= 1'b1;
+                triggered <= 1'b1;
+                dumping   <= 1'b1;
+                remaining <= window;
+            end else if (dumping && triggered && window != 0) begin
+                if (remaining <= 1) dumping <= 1'b0;
+                remaining <= remaining - 1;
+            end
+        end
+    end
+
+    // Pre-trigger buffer, keeps running until the trigger
+    if (PRE_DEPTH > 0) begin : pre
+        logic [NUM_PORTS*PROBE_WIDTH-1:0] ring [PRE_DEPTH];
+
+        initial begin
+            ring_index = '0;
+            ring_count = '0;
+        end
+
+        always_ff @(posedge clk) begin
+            if (!triggered) begin
+                ring[ring_index] <= probe;
+                ring_index <= ring_index == PRE_DEPTH - 1 ? '0 : ring_index + 1;
+                if (ring_count < PRE_DEPTH) ring_count <= ring_count + 1;
+            end
+        end
+    end else begin : no_pre
+        assign ring_index = '0;
+        assign ring_count = '0;
+    end
+
+endmodule
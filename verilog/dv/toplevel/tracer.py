@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Targeted waveform dumps of the toplevel simulation
+
+By default nothing is dumped. With TRACE, only the selected scopes are
+dumped to dump.fst, and with a trigger only for a window of cycles
+around an event on the buses of leosoc. trace_control.sv detects the
+trigger on the bus of every target of the crossbar and switches the
+dump with $dumpon/$dumpoff, so the testbench does not wake up on every
+cycle.
+
+The buses of the last TRACE_PRE cycles before the trigger are kept in
+a ring buffer in trace_control.sv, as the dump can not go back in time.
+They are written to pretrigger.vcd, one scope per target, at the
+trigger, or when the test fails before the trigger.
+
+Triggers:
+
+    write:ADDRESS[=DATA[/MASK]]   write to the address, optionally with this data
+    read:ADDRESS                  read from the address
+    access:ADDRESS                read or write
+    cycle:CYCLES                  cycles after the reset
+    uart:BYTE                     byte written to the transmitter of UART0, e.g. uart:0x0A or uart:A
+    mark:VALUE                    sim_mark() of the firmware
+"""
+
+import cocotb
+from cocotb.triggers import RisingEdge, ReadOnly
+from cocotb.utils import get_sim_time
+
+UART0_TX_ADDRESS = 0x03000008
+SIM_MARK_ADDRESS = 0x0E000004
+
+# See trace_control.sv
+TRIGGER_NONE = 0
+TRIGGER_WRITE = 1
+TRIGGER_READ = 2
+TRIGGER_ANY = 3
+TRIGGER_CYCLE = 4
+
+# Fields of a port in an entry of the ring buffer, from the MSB,
+# port 0 comes first
+PROBES = [
+    ('mem_addr', 32),
+    ('mem_wdata', 32),
+    ('mem_rdata', 32),
+    ('mem_wmask', 4),
+    ('mem_wstrb', 1),
+    ('mem_rstrb', 1),
+    ('mem_done', 1),
+]
+PROBE_WIDTH = sum(width for _, width in PROBES)
+
+def parse_number(value):
+    return int(value, 0)
+
+def parse_trigger(spec):
+    """TRACE_TRIGGER -> (mode, address, data, mask, cycle)"""
+    if not spec:
+        return TRIGGER_NONE, 0, 0, 0, 0
+
+    kind, _, argument = spec.partition(':')
+    if kind == 'write':
+        address, _, data = argument.partition('=')
+        data, _, mask = data.partition('/')
+        mask = parse_number(mask) if mask else 0xFFFFFFFF if data else 0
+        return TRIGGER_WRITE, parse_number(address), parse_number(data) if data else 0, mask, 0
+    if kind == 'read':
+        return TRIGGER_READ, parse_number(argument), 0, 0, 0
+    if kind == 'access':
+        return TRIGGER_ANY, parse_number(argument), 0, 0, 0
+    if kind == 'cycle':
+        return TRIGGER_CYCLE, 0, 0, 0, parse_number(argument)
+    if kind == 'uart':
+        byte = ord(argument) if len(argument) == 1 else parse_number(argument)
+        return TRIGGER_WRITE, UART0_TX_ADDRESS, byte, 0xFF, 0
+    if kind == 'mark':
+        return TRIGGER_WRITE, SIM_MARK_ADDRESS, parse_number(argument), 0xFFFFFFFF, 0
+    raise ValueError(f'unknown trigger {spec!r}')
+
+def scopes(spec):
+    """TRACE -> the argument of $dumpvars relative to user_project_wrapper_wrapper
+
+    Scopes below leosoc can be given from leosoc_i, e.g. leosoc_i.core_wrapper.
+    Returns None if no waveform is dumped.
+    """
+    if spec in ('none', ''):
+        return None
+    if spec in ('1', 'all'):
+        return 'user_project_wrapper_wrapper'
+    names = []
+    for name in spec.split(','):
+        name = name.strip()
+        if name.startswith('leosoc_i'):
+            name = 'user_project_wrapper_i.' + name
+        names.append(name)
+    return ','.join(names)
+
+def target_names(count):
+    """The targets of the crossbar of leosoc in the order of its buses"""
+    banks = count - 2
+    return [f'wram{bank}' if banks > 1 else 'wram' for bank in range(banks)] + ['flash', 'peripherals']
+
+def write_vcd(path, entries, period, ports):
+    """entries: (time in ns, bits) of the ring buffer, oldest first
+
+    bits is the binary string of an entry, X and Z are kept. ports are
+    the names of the buses in the entry, each one gets a scope.
+    """
+    fields = [(port, name, width) for port in ports for name, width in PROBES]
+    identifiers = [chr(ord('!') + index) for index in range(len(fields))]
+    slices = []
+    offset = 0
+    for _, _, width in fields:
+        slices.append(slice(offset, offset + width))
+        offset += width
+
+    with open(path, 'w') as writer:
+        writer.write('$timescale 1ns $end\n$scope module trace_control $end\n')
+        for port in ports:
+            writer.write(f'$scope module {port} $end\n')
+            for (scope, name, width), identifier in zip(fields, identifiers):
+                if scope == port:
+                    writer.write(f'$var wire {width} {identifier} {name} $end\n')
+            writer.write('$upscope $end\n')
+        writer.write('$upscope $end\n$enddefinitions $end\n')
+
+        previous = [None] * len(fields)
+        for time, bits in entries:
+            changes = []
+            for index, ((_, _, width), identifier) in enumerate(zip(fields, identifiers)):
+                field = bits[slices[index]].lower()
+                if field != previous[index]:
+                    previous[index] = field
+                    changes.append(f'{field}{identifier}' if width == 1 else f'b{field} {identifier}')
+            if changes:
+                writer.write(f'#{time}\n' + '\n'.join(changes) + '\n')
+        if entries:
+            writer.write(f'#{entries[-1][0] + period}\n')
+
+class Tracer:
+    """Configure trace_control and read out its pre-trigger buffer"""
+
+    def __init__(self, dut, trigger=None, window=0, period=25):
+        self.dut = dut
+        self.control = dut.trace_control_i
+        self.trigger = parse_trigger(trigger)
+        self.window = window
+        self.period = period
+        self.captured = False
+
+    def start(self):
+        """Before the reset"""
+        mode, address, data, mask, cycle = self.trigger
+        self.dut.trace_trigger_mode.value = mode
+        self.dut.trace_trigger_addr.value = address
+        self.dut.trace_trigger_data.value = data
+        self.dut.trace_trigger_mask.value = mask
+        self.dut.trace_trigger_cycle.value = cycle
+        self.dut.trace_window.value = self.window
+        if mode != TRIGGER_NONE:
+            cocotb.start_soon(self.wait())
+
+    async def wait(self):
+        await RisingEdge(self.control.trigger)
+        await ReadOnly()
+        self.dut._log.info(f'Trace triggered at cycle {self.control.cycle.value.integer}')
+        self.save('pretrigger.vcd')
+
+    async def capture(self, reason):
+        """Save the pre-trigger buffer, e.g. when the test fails"""
+        if self.captured:
+            return
+        await RisingEdge(self.dut.clk)
+        await ReadOnly()
+        self.dut._log.info(f'Trace captured: {reason}')
+        self.save('pretrigger.vcd')
+
+    def save(self, path):
+        self.captured = True
+        count = self.control.ring_count.value.integer
+        if count == 0:
+            return
+        ring = self.control.pre.ring
+        depth = len(ring)
+        index = self.control.ring_index.value.integer
+
+        # The newest entry was sampled at this clock edge
+        now = int(get_sim_time('ns'))
+        entries = []
+        for age in range(count - 1, -1, -1):
+            bits = ring[(index - 1 - age) % depth].value.binstr
+            entries.append((now - age * self.period, bits))
+
+        ports = target_names(len(entries[0][1]) // PROBE_WIDTH)
+        write_vcd(path, entries, self.period, ports)
+        self.dut._log.info(f'Wrote {count} cycles of {", ".join(ports)} before the trigger to {path}')
@@ -23,11 +23,6 @@ module user_project_wrapper_wrapper (
     output logic blink
 );
 
-    initial begin
-        $dumpfile("dump.fst");
-        $dumpvars(0, user_project_wrapper_wrapper);
-    end
-
     user_project_wrapper user_project_wrapper_i (
     `ifdef USE_POWER_PINS
         .vdd,
@@ -68,9 +63,14 @@ module user_project_wrapper_wrapper (
     wire [37:0] io_oeb;
     
     assign sck = io_out[5];
-    assign sdo = io_out[6];
-    assign io_in[7] = sdi;
     assign cs = io_out[8];
+
+    // io0 and io1 of the flash on io[6] and io[7], io2 and io3 on the GPIO 22 and 23
+    assign flash_io[0] = !io_oeb[6]  ? io_out[6]  : 1'bz;
+    assign flash_io[1] = !io_oeb[7]  ? io_out[7]  : 1'bz;
+    assign flash_io[2] = !io_oeb[36] ? io_out[36] : 1'bz;
+    assign flash_io[3] = !io_oeb[37] ? io_out[37] : 1'bz;
+    assign io_in[7:6] = flash_io[1:0];
     
     assign io_in[9] = uart0_rx;
     assign uart0_tx = io_out[10];
@@ -80,15 +80,162 @@ module user_project_wrapper_wrapper (
     
     assign blink = io_out[13];
     
-    assign io_in[37:14] = gpio0_in;
+    assign io_in[35:14] = gpio0_in[21:0];
+    assign io_in[37:36] = flash_io[3:2];
     assign gpio0_out = io_out[37:14];
     assign gpio0_oe = io_oeb[37:14];
 
+`ifndef GL
+    // Simulation mailbox, see firmware/lib/sim.h
+    // Writes to these addresses have no effect on the SoC
+
+    localparam SIM_EXIT_ADDRESS = 32'h0E000000;
+    localparam SIM_MARK_ADDRESS = 32'h0E000004;
+    localparam SIM_EXIT_MAGIC   = 16'hC0DE;
+
+    logic        sim_exit = 1'b0;
+    logic [15:0] sim_exit_code = '0;
+    logic        sim_mark_strobe = 1'b0;
+    logic [31:0] sim_mark = '0;
+
+    always_ff @(posedge clk) begin
+        sim_mark_strobe <= 1'b0;
+        if (!reset && user_project_wrapper_i.leosoc_i.mem_wstrb) begin
+            if (user_project_wrapper_i.leosoc_i.mem_addr == SIM_EXIT_ADDRESS && user_project_wrapper_i.leosoc_i.mem_wdata[31:16] == SIM_EXIT_MAGIC) begin
+                sim_exit <= 1'b1;
+                sim_exit_code <= user_project_wrapper_i.leosoc_i.mem_wdata[15:0];
+            end
+            if (user_project_wrapper_i.leosoc_i.mem_addr == SIM_MARK_ADDRESS) begin
+                sim_mark_strobe <= 1'b1;
+                sim_mark <= user_project_wrapper_i.leosoc_i.mem_wdata;
+            end
+        end
+    end
+
+    // PC sampling profiler, see profiler.py
+    // The interval is set by the testbench, 0 disables sampling
+
+    localparam NUM_HARTS = 2; // NUM_CORES of leosoc
+
+    logic [31:0] profile_interval = '0;
+
+    for (genvar hart = 0; hart < NUM_HARTS; hart++) begin : profile
+        pc_sampler pc_sampler_i (
+            .clk,
+            .reset,
+            .interval   (profile_interval),
+            .retire     (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].leorv32_inst.retire),
+            .pc         (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].leorv32_inst.PC),
+            .instr      (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].leorv32_inst.cur_instr),
+            .sample     (),
+            .sample_pc  (),
+            .sample_depth (),
+            .sample_truncated ()
+        );
+    end
+
+    // Instruction fetch trace, see fetch_trace.py
+
+    logic fetch_trace_enable = 1'b0;
+
+    for (genvar hart = 0; hart < NUM_HARTS; hart++) begin : fetch
+        fetch_trace fetch_trace_i (
+            .clk,
+            .reset,
+            .enable     (fetch_trace_enable),
+            .lookup     (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].icache.direct_mapped_cache_i.lookup),
+            .refill     (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].icache.direct_mapped_cache_i.refill),
+            .addr       (user_project_wrapper_i.leosoc_i.core_wrapper.cpus[hart].icache.direct_mapped_cache_i.cache_addr),
+            .full       (),
+            .index      (),
+            .lookups    (),
+            .flash_misses       (),
+            .flash_miss_cycles  (),
+            .other_misses       (),
+            .other_miss_cycles  ()
+        );
+    end
+
+`ifdef TRACE
+    // Trigger and pre-trigger buffer, see tracer.py
+    // Set by the testbench before the reset
+
+    logic [ 2:0] trace_trigger_mode = '0;
+    logic [31:0] trace_trigger_addr = '0;
+    logic [31:0] trace_trigger_data = '0;
+    logic [31:0] trace_trigger_mask = '0;
+    logic [31:0] trace_trigger_cycle = '0;
+    logic [31:0] trace_window = '0;
+
+    logic trace_dumping;
+
+    // The crossbar of leosoc serves its targets in parallel, the buses of
+    // all targets are traced: the WRAM banks, the flash and the peripherals
+`ifdef LEOSOC_PARAMETERS
+    localparam TRACE_TARGETS = `WRAM_BANKS + 2;
+`elsif WRAM_BANKED
+    localparam TRACE_TARGETS = 4; // two banks, the default of leosoc with WRAM_BANKED
+`else
+    localparam TRACE_TARGETS = 3; // a single WRAM, the default of leosoc
+`endif
+
+    trace_control #(
+        .PRE_DEPTH  (`TRACE_PRE_DEPTH),
+        .NUM_PORTS  (TRACE_TARGETS)
+    ) trace_control_i (
+        .clk,
+        .reset,
+
+        .mem_addr   (user_project_wrapper_i.leosoc_i.bus_addr),
+        .mem_wdata  (user_project_wrapper_i.leosoc_i.bus_wdata),
+        .mem_wmask  (user_project_wrapper_i.leosoc_i.bus_wmask),
+        .mem_wstrb  (user_project_wrapper_i.leosoc_i.bus_wstrb),
+        .mem_rdata  (user_project_wrapper_i.leosoc_i.bus_rdata),
+        .mem_rstrb  (user_project_wrapper_i.leosoc_i.bus_rstrb),
+        .mem_done   (user_project_wrapper_i.leosoc_i.bus_done),
+
+        .trigger_mode   (trace_trigger_mode),
+        .trigger_addr   (trace_trigger_addr),
+        .trigger_data   (trace_trigger_data),
+        .trigger_mask   (trace_trigger_mask),
+        .trigger_cycle  (trace_trigger_cycle),
+        .window         (trace_window),
+
+        .trigger    (),
+        .triggered  (),
+        .dumping    (trace_dumping),
+        .cycle      (),
+        .ring_index (),
+        .ring_count ()
+    );
+
+    // Only the selected scopes are dumped and only while trace_dumping is set,
+    // Verilator traces the whole model with WAVES instead
+`ifdef TRACE_SCOPES
+`ifndef VERILATOR
+    initial begin
+        $dumpfile("dump.fst");
+        $dumpvars(0, `TRACE_SCOPES);
+        $dumpoff;
+    end
+
+    always @(trace_dumping) begin
+        if (trace_dumping === 1'b1) $dumpon;
+        else $dumpoff;
+    end
+`endif
+`endif
+`endif
+`endif
+
     // SPI signals
     wire sck;
-    wire sdo;
-    wire sdi;
     wire cs;
+    wire [3:0] flash_io;
+
+    // WP# and HOLD# are pulled up on the board
+    pullup (flash_io[2]);
+    pullup (flash_io[3]);
 
     spiflash #(
         .INIT_F("../firmware/firmware.hex"),
@@ -96,10 +243,10 @@ module user_project_wrapper_wrapper (
     ) spiflash_inst (
         .csb    (cs),
         .clk    (sck),
-        .io0    (sdo), // MOSI
-        .io1    (sdi), // MISO
-        .io2    (),
-        .io3    ()
+        .io0    (flash_io[0]), // MOSI
+        .io1    (flash_io[1]), // MISO
+        .io2    (flash_io[2]),
+        .io3    (flash_io[3])
     );
 
 endmodule
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Compare the banks of the WRAM on a memory heavy workload of both harts
+
+firmware/wram_bench.c runs the same load/store kernel on both harts at
+the same time, then on hart 0 alone, and writes the cycles of both and
+the performance counters of the run together over UART0. Every layout
+(banks x words interleaved per bank) is one run of tb_toplevel.py with
+WRAM and BENCHMARK set, in its own build and test directory
+wram_build/<layout>/. The runs are independent and go in parallel.
+
+The speedup is the work of both harts over the time of the slower one,
+relative to hart 0 alone: 2.0 if the harts never wait for each other,
+1.0 if they could as well run one after the other.
+
+Examples:
+
+    wram_benchmark.py                           the default layouts
+    wram_benchmark.py -l 1x1 -l 2x8             these two
+    FAST_FLASH=1 wram_benchmark.py --json wram.json
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from perf_report import parse
+
+TOPLEVEL_DIR = Path(__file__).resolve().parent
+BUILD_DIR = TOPLEVEL_DIR / 'wram_build'
+FIRMWARE = TOPLEVEL_DIR / 'firmware' / 'wram_bench.elf'
+
+# A single bank as before, then the banks of leosoc by word and by block
+LAYOUTS = ['1x1', '2x1', '2x4']
+
+WRAM_LINE = re.compile(r'WRAM((?: [0-9A-Fa-f]{8}){3})')
+
+def parse_layout(text):
+    try:
+        banks, interleave = (int(value) for value in text.split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text}: expected BANKSxWORDS, e.g. 2x1')
+    for value in (banks, interleave):
+        if value < 1 or value & (value - 1):
+            raise argparse.ArgumentTypeError(f'{text}: all values must be powers of two')
+    if banks > 2:
+        raise argparse.ArgumentTypeError(f'{text}: a bank needs 512 words, the WRAM has 1024')
+    return text
+
+def build_firmware():
+    subprocess.run(['make', 'PROG=wram_bench', 'OBJ=wram_bench.o', FIRMWARE.name],
+                   cwd=FIRMWARE.parent, check=True)
+
+def run(layout):
+    """Simulate the benchmark with this layout, the UART0 output or None"""
+    directory = BUILD_DIR / layout
+    directory.mkdir(parents=True, exist_ok=True)
+    output = directory / 'uart0.log'
+    output.unlink(missing_ok=True)
+
+    env = dict(os.environ, WRAM=layout, FIRMWARE=str(FIRMWARE), BENCHMARK=str(output), SIM_BUILD=str(directory))
+    with open(directory / 'benchmark.log', 'w') as log:
+        returncode = subprocess.run([sys.executable, 'tb_toplevel.py'], cwd=TOPLEVEL_DIR, env=env,
+                                    stdout=log, stderr=subprocess.STDOUT).returncode
+
+    if returncode or not output.exists():
+        print(f'{layout}: failed with exit code {returncode}, see {directory / "benchmark.log"}')
+        return None
+    return output.read_text(errors='replace')
+
+def summary(layout, text):
+    match = WRAM_LINE.search(text)
+    dumps = parse(text)
+    if not match or not dumps:
+        print(f'{layout}: no WRAM or PERF line in the output')
+        return None
+    alone, *together = (int(word, 16) for word in match.group(1).split())
+    counters = dumps[-1]
+    return {
+        'layout': layout,
+        'alone': alone,
+        'together': together,
+        'speedup': 2 * alone / max(together),
+        'conflicts': counters.get('wram_conflicts', 0),
+        'cycles': counters['cycles'],
+        'grant_wait': [hart['grant_wait'] for hart in counters['harts']],
+        'counters': counters
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the WRAM benchmark with several layouts of the WRAM banks.')
+    parser.add_argument('-l', '--layout', type=parse_layout, action='append',
+                        help=f'BANKSxWORDS, repeatable (default: {" ".join(LAYOUTS)})')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of parallel simulations')
+    parser.add_argument('--no-build', action='store_true', help=f'use {FIRMWARE.name} as it is')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    layouts = args.layout or LAYOUTS
+
+    if not args.no_build:
+        build_firmware()
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        results = [result for result in (summary(layout, text) for layout, text in
+                   zip(layouts, executor.map(run, layouts)) if text) if result]
+
+    if not results:
+        sys.exit('Error: no simulation finished')
+
+    print(f'{"layout":>8} {"alone":>8} {"hart 0":>8} {"hart 1":>8} {"speedup":>8} '
+          f'{"conflicts":>10} {"of cycles":>10}')
+    for result in results:
+        print(f'{result["layout"]:>8} {result["alone"]:>8} {result["together"][0]:>8} {result["together"][1]:>8} '
+              f'{result["speedup"]:>8.2f} {result["conflicts"]:>10} {result["conflicts"] / result["cycles"]:>10.2%}')
+
+    if args.json:
+        with open(args.json, 'w') as writer:
+            json.dump(results, writer, indent=4)
+
+    if len(results) < len(layouts):
+        sys.exit(f'Failed: {len(layouts) - len(results)} of {len(layouts)} layouts')
+
+if __name__ == '__main__':
+    main()
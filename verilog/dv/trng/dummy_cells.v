@@ -168,6 +168,17 @@ module gf180mcu_fd_sc_mcu7t5v0__clkbuf_16 (
     buf #1 (Z, I);
 endmodule
 
+module gf180mcu_fd_sc_mcu7t5v0__inv_1 (
+    input I,
+    output ZN,
+    inout VDD,
+    inout VNW,
+    inout VPW,
+    inout VSS
+);
+    not #1 (ZN, I);
+endmodule
+
 module gf180mcu_fd_sc_mcu7t5v0__clkinv_1 (
     input I,
     output ZN,
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Statistical tests for captured TRNG streams
+
+Runs the NIST SP 800-22 tests monobit, block frequency, runs, longest
+run of ones, serial, approximate entropy and DFT, and the SP 800-90B
+min-entropy estimators most common value, collision and Markov on
+bit-packed captures. All tests work on NumPy arrays, the streams are
+only unpacked in chunks.
+
+The SP 800-22 tests give the P-values of the worked examples of the
+spec, except for the DFT test, see dft().
+
+Input files are either captures of tb_trng.py (bit-packed, MSB first)
+or, with --peripheral, dumps of the TRNG value register of
+peripheral_trng (little-endian 32-bit words, bit i is trng_en[i]).
+
+    randomness.py sim_build/trng.bin
+    randomness.py --peripheral dump.bin
+"""
+
+import os
+import sys
+import math
+import argparse
+import importlib.util
+
+import numpy as np
+
+GENERATE_TRNGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../rtl/trng_configs/generate_trngs.py')
+
+# Significance level of SP 800-22
+ALPHA = 0.01
+
+# Bits that are unpacked at once
+CHUNK_BITS = 1 << 24
+
+def igamc(a, x):
+    """Regularized upper incomplete gamma function Q(a, x)"""
+    if x <= 0:
+        return 1.0
+    if a <= 0:
+        return 0.0
+
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+
+    # Series for P(a, x)
+    if x < a + 1:
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+
+    # Continued fraction for Q(a, x)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 100000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, h * math.exp(log_prefix))
+
+class BitStream:
+    """A bit-packed stream, MSB first"""
+
+    def __init__(self, packed, length=None):
+        self.packed = np.asarray(packed, dtype=np.uint8)
+        self.length = length if length is not None else len(self.packed) * 8
+
+    def chunks(self, size=CHUNK_BITS, overlap=0):
+        """Unpacked chunks of size bits, extended by overlap bits of the next one"""
+        for start in range(0, self.length, size):
+            end = min(start + size + overlap, self.length)
+            bits = np.unpackbits(self.packed[start // 8:(end + 7) // 8])
+            yield bits[:end - start]
+
+    def bits(self, start, end):
+        offset = start % 8
+        return np.unpackbits(self.packed[start // 8:(end + 7) // 8])[offset:offset + end - start]
+
+    def ones(self):
+        full = self.length // 8
+        count = int(np.unpackbits(self.packed[:full]).sum(dtype=np.int64))
+        if self.length % 8:
+            count += int(self.bits(full * 8, self.length).sum())
+        return count
+
+def pattern_counts(stream, m):
+    """Number of occurrences of all overlapping m-bit patterns, wrapping around
+
+    The patterns are cut out of 32-bit windows of the packed chunk,
+    one pass for each of the eight bit offsets in a byte.
+    """
+    assert m <= 25
+    counts = np.zeros(1 << m, dtype=np.int64)
+    head = stream.bits(0, min(m - 1, stream.length))
+
+    for start, chunk in zip(range(0, stream.length, CHUNK_BITS), stream.chunks(overlap=m - 1)):
+        if start + len(chunk) >= stream.length:
+            chunk = np.concatenate([chunk, head])
+        windows = len(chunk) - m + 1
+        if windows <= 0:
+            continue
+
+        packed = np.concatenate([np.packbits(chunk), np.zeros(3, dtype=np.uint8)]).astype(np.uint32)
+        words = (packed[:-3] << 24) | (packed[1:-2] << 16) | (packed[2:-1] << 8) | packed[3:]
+        for offset in range(8):
+            positions = (windows - offset + 7) // 8
+            if positions > 0:
+                values = (words[:positions] >> (32 - m - offset)) & ((1 << m) - 1)
+                counts += np.bincount(values, minlength=1 << m)
+    return counts
+
+def fold(counts):
+    """Counts of the (m-1)-bit patterns from the counts of the m-bit patterns"""
+    return counts[0::2] + counts[1::2]
+
+def monobit(stream):
+    n = stream.length
+    s = 2 * stream.ones() - n
+    return math.erfc(abs(s) / math.sqrt(2 * n))
+
+def block_frequency(stream, block_size=128):
+    blocks = stream.length // block_size
+    ones = np.zeros(0)
+    for chunk in stream.chunks(size=(CHUNK_BITS // block_size) * block_size):
+        usable = len(chunk) // block_size * block_size
+        ones = np.concatenate([ones, chunk[:usable].reshape(-1, block_size).sum(axis=1)])
+    proportion = ones[:blocks] / block_size
+    chi2 = 4 * block_size * np.sum((proportion - 0.5) ** 2)
+    return igamc(blocks / 2, chi2 / 2)
+
+def runs(stream):
+    n = stream.length
+    pi = stream.ones() / n
+    if abs(pi - 0.5) >= 2 / math.sqrt(n):
+        return 0.0
+
+    changes = 0
+    for chunk in stream.chunks(overlap=1):
+        changes += int(np.count_nonzero(chunk[1:] != chunk[:-1]))
+    v = changes + 1
+    return math.erfc(abs(v - 2 * n * pi * (1 - pi)) / (2 * math.sqrt(2 * n) * pi * (1 - pi)))
+
+# Block size, classes and probabilities for the longest run of ones
+LONGEST_RUN = [
+    (750000, 10000, 10, [0.0882, 0.2092, 0.2483, 0.1933, 0.1208, 0.0675, 0.0727]),
+    (6272, 128, 4, [0.1174, 0.2430, 0.2493, 0.1752, 0.1027, 0.1124]),
+    (128, 8, 1, [0.2148, 0.3672, 0.2305, 0.1875])
+]
+
+def longest_runs(blocks):
+    """Longest run of ones in every row"""
+    rows, size = blocks.shape
+    padded = np.zeros((rows, size + 1), dtype=np.uint8)
+    padded[:, :size] = blocks
+    zeros = np.concatenate([[-1], np.flatnonzero(padded.ravel() == 0)])
+    lengths = np.diff(zeros) - 1
+    owner = zeros[1:] // (size + 1)
+    starts = np.searchsorted(owner, np.arange(rows))
+    return np.maximum.reduceat(lengths, starts)
+
+def longest_run(stream):
+    for minimum, block_size, first, probabilities in LONGEST_RUN:
+        if stream.length >= minimum:
+            break
+    else:
+        return float('nan')
+
+    classes = len(probabilities)
+    histogram = np.zeros(classes, dtype=np.int64)
+    for chunk in stream.chunks(size=(CHUNK_BITS // block_size) * block_size):
+        usable = len(chunk) // block_size * block_size
+        if not usable:
+            continue
+        longest = longest_runs(chunk[:usable].reshape(-1, block_size))
+        histogram += np.bincount(np.clip(longest - first, 0, classes - 1), minlength=classes)
+
+    blocks = histogram.sum()
+    expected = blocks * np.array(probabilities)
+    chi2 = np.sum((histogram - expected) ** 2 / expected)
+    return igamc((classes - 1) / 2, chi2 / 2)
+
+def psi2(counts, n):
+    return (len(counts) / n) * np.sum(counts.astype(np.float64) ** 2) - n
+
+def serial(stream, m=None):
+    n = stream.length
+    m = m or max(3, min(16, int(math.log2(n)) - 3))
+    counts = pattern_counts(stream, m)
+    psi_m = psi2(counts, n)
+    psi_m1 = psi2(fold(counts), n)
+    psi_m2 = psi2(fold(fold(counts)), n)
+    p1 = igamc(2 ** (m - 2), (psi_m - psi_m1) / 2)
+    p2 = igamc(2 ** (m - 3), (psi_m - 2 * psi_m1 + psi_m2) / 2)
+    return min(p1, p2)
+
+def approximate_entropy(stream, m=None):
+    n = stream.length
+    m = m or max(2, min(10, int(math.log2(n)) - 6))
+    counts = pattern_counts(stream, m + 1)
+
+    def phi(counts):
+        c = counts[counts > 0] / n
+        return np.sum(c * np.log(c))
+
+    apen = phi(fold(counts)) - phi(counts)
+    chi2 = 2 * n * (math.log(2) - apen)
+    return igamc(2 ** (m - 1), chi2 / 2)
+
+def dft(stream, block_size=1 << 20):
+    """Spectral test, the blocks are transformed separately and their counts summed
+
+    On the 100-bit worked example of SP 800-22 (2.6.8) this counts
+    N1 = 48 peaks below the threshold and gives P = 0.646, the spec
+    states N1 = 46 and P = 0.168669. That is a known erratum of the
+    spec, with N1 = 46 the formula gives its P-value.
+    """
+    observed = expected = variance = 0.0
+    for chunk in stream.chunks(size=block_size):
+        n = len(chunk) // 2 * 2
+        if n < 1000 and observed:
+            continue
+        x = 2.0 * chunk[:n] - 1
+        magnitude = np.abs(np.fft.rfft(x)[:n // 2])
+        threshold = math.sqrt(math.log(1 / 0.05) * n)
+        observed += np.count_nonzero(magnitude < threshold)
+        expected += 0.95 * n / 2
+        variance += n * 0.95 * 0.05 / 4
+    d = (observed - expected) / math.sqrt(variance)
+    return math.erfc(abs(d) / math.sqrt(2))
+
+def most_common_value(stream):
+    """SP 800-90B 6.3.1"""
+    n = stream.length
+    p = max(stream.ones(), n - stream.ones()) / n
+    p_upper = min(1.0, p + 2.576 * math.sqrt(p * (1 - p) / (n - 1)))
+    return -math.log2(p_upper)
+
+def collision_tables():
+    """Collisions in a byte depending on the entry offset (0..2) and the next byte
+
+    Returns the exit offset into the next byte and the number of
+    collisions after two and after three samples.
+    """
+    windows = np.arange(1 << 16)
+    bits = (windows[:, None] >> (15 - np.arange(16))) & 1
+
+    exit_offset = np.zeros((3, 1 << 16), dtype=np.int64)
+    twos = np.zeros((3, 1 << 16), dtype=np.int64)
+    threes = np.zeros((3, 1 << 16), dtype=np.int64)
+
+    for offset in range(3):
+        position = np.full(1 << 16, offset)
+        while True:
+            active = position < 8
+            if not active.any():
+                break
+            index = np.flatnonzero(active)
+            same = bits[index, position[index]] == bits[index, position[index] + 1]
+            twos[offset, index] += same
+            threes[offset, index] += ~same
+            position[index] += np.where(same, 2, 3)
+        exit_offset[offset] = position - 8
+
+    return exit_offset, twos, threes
+
+def collision(stream):
+    """SP 800-90B 6.3.2 for binary samples
+
+    The walk through the samples depends on all previous collisions.
+    It is computed per byte for all possible entry offsets and the
+    per-byte transitions are then composed pairwise.
+    """
+    exit_offset, twos, threes = collision_tables()
+    packed = stream.packed[:stream.length // 8]
+
+    offset = 0
+    count2 = count3 = 0
+    for start in range(0, len(packed) - 1, CHUNK_BITS // 8):
+        chunk = packed[start:start + CHUNK_BITS // 8 + 1].astype(np.int64)
+        windows = (chunk[:-1] << 8) | chunk[1:]
+
+        mapping = exit_offset[:, windows]
+        c2 = twos[:, windows]
+        c3 = threes[:, windows]
+
+        while mapping.shape[1] > 1:
+            if mapping.shape[1] % 2:
+                mapping = np.concatenate([mapping, np.arange(3)[:, None]], axis=1)
+                c2 = np.concatenate([c2, np.zeros((3, 1), dtype=np.int64)], axis=1)
+                c3 = np.concatenate([c3, np.zeros((3, 1), dtype=np.int64)], axis=1)
+            first, second = mapping[:, 0::2], mapping[:, 1::2]
+            c2 = c2[:, 0::2] + np.take_along_axis(c2[:, 1::2], first, axis=0)
+            c3 = c3[:, 0::2] + np.take_along_axis(c3[:, 1::2], first, axis=0)
+            mapping = np.take_along_axis(second, first, axis=0)
+
+        count2 += int(c2[offset, 0])
+        count3 += int(c3[offset, 0])
+        offset = int(mapping[offset, 0])
+
+    v = count2 + count3
+    if v < 2:
+        return float('nan')
+    mean = (2 * count2 + 3 * count3) / v
+    std = math.sqrt((4 * count2 + 9 * count3) / v - mean ** 2)
+    mean -= 2.576 * std / math.sqrt(v)
+
+    # E[t] = 2 + 2p(1-p) for binary samples
+    p = 0.5 + math.sqrt(max(0.0, 0.25 - (mean - 2) / 2))
+    return -math.log2(p)
+
+def markov(stream):
+    """SP 800-90B 6.3.3 for binary samples"""
+    n = stream.length
+    ones = stream.ones()
+    p1 = ones / n
+    p0 = 1 - p1
+
+    pairs = np.zeros(4, dtype=np.int64)
+    for chunk in stream.chunks(overlap=1):
+        pairs += np.bincount(chunk[:-1].astype(np.int64) * 2 + chunk[1:], minlength=4)
+
+    def transition(first, second):
+        total = pairs[first * 2] + pairs[first * 2 + 1]
+        return pairs[first * 2 + second] / total if total else 0.0
+
+    p00, p01, p10, p11 = transition(0, 0), transition(0, 1), transition(1, 0), transition(1, 1)
+
+    candidates = [
+        p0 * p00 ** 127,
+        p0 * p01 ** 64 * p10 ** 63,
+        p0 * p01 * p11 ** 126,
+        p1 * p10 * p00 ** 126,
+        p1 * p10 ** 64 * p01 ** 63,
+        p1 * p11 ** 127
+    ]
+    p_max = max(candidates)
+    return min(-math.log2(p_max) / 128, 1.0) if p_max > 0 else 1.0
+
+NIST_TESTS = {
+    'monobit': monobit,
+    'block_freq': block_frequency,
+    'runs': runs,
+    'longest_run': longest_run,
+    'serial': serial,
+    'apen': approximate_entropy,
+    'dft': dft
+}
+
+ENTROPY_ESTIMATORS = {
+    'mcv': most_common_value,
+    'collision': collision,
+    'markov': markov
+}
+
+def analyse(stream):
+    results = {}
+    for name, test in NIST_TESTS.items():
+        results[name] = test(stream)
+    for name, estimator in ENTROPY_ESTIMATORS.items():
+        results[name] = estimator(stream)
+    results['min_entropy'] = min(results[name] for name in ENTROPY_ESTIMATORS)
+    return results
+
+def trng_names():
+    spec = importlib.util.spec_from_file_location('generate_trngs', GENERATE_TRNGS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return [module.trng_name(config) for config in module.configs]
+
+def load_peripheral_dump(path):
+    """Split a dump of the TRNG value register into one stream per TRNG"""
+    words = np.fromfile(path, dtype='<u4')
+    streams = {}
+    for index, name in enumerate(trng_names()):
+        bits = ((words >> index) & 1).astype(np.uint8)
+        streams[name] = BitStream(np.packbits(bits), len(bits))
+    return streams
+
+def print_report(results):
+    columns = list(NIST_TESTS) + list(ENTROPY_ESTIMATORS) + ['min_entropy']
+    width = max(len(name) for name in results)
+    print(f'{"stream":<{width}}{"bits":>11}' + ''.join(f'{column:>13}' for column in columns))
+    for name, (length, values) in results.items():
+        line = f'{name:<{width}}{length:>11}'
+        for column in columns:
+            flag = '*' if column in NIST_TESTS and values[column] < ALPHA else ' '
+            line += f'{values[column]:>12.4f}{flag}'
+        print(line)
+    print(f'* p-value below {ALPHA}, entropies are in bits per sample')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run statistical tests on captured TRNG streams.')
+    parser.add_argument('captures', nargs='+', help='bit-packed captures or peripheral dumps')
+    parser.add_argument('--peripheral', action='store_true',
+                        help='the files are dumps of the value register of peripheral_trng')
+    parser.add_argument('-n', '--bits', type=int, help='only use the first N bits of every stream')
+    args = parser.parse_args()
+
+    streams = {}
+    for path in args.captures:
+        if args.peripheral:
+            for name, stream in load_peripheral_dump(path).items():
+                streams[f'{os.path.basename(path)}:{name}'] = stream
+        else:
+            name = os.path.splitext(os.path.basename(path))[0]
+            streams[name] = BitStream(np.fromfile(path, dtype=np.uint8))
+
+    results = {}
+    for name, stream in streams.items():
+        if args.bits:
+            stream.length = min(stream.length, args.bits)
+        if stream.length < 128:
+            print(f'Skipping {name}, only {stream.length} bits', file=sys.stderr)
+            continue
+        results[name] = (stream.length, analyse(stream))
+
+    print_report(results)
+
+if __name__ == '__main__':
+    main()
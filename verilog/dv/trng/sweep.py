@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Simulate and analyse all TRNG configurations
+
+Every configuration of generate_trngs.py is built and simulated in its
+own directory sweep_build/<name>/, several of them at once. The capture
+is then analysed with randomness.py and the result is stored in
+sweep_build/<name>/result.json. Configurations with a result for the
+same number of samples are skipped, so an interrupted sweep can simply
+be started again.
+
+This is a check of the flow from the netlists to the analysis, not a
+characterisation: the cells of dummy_cells.v have fixed delays, so the
+ring oscillators have no jitter and the captured streams are
+deterministic. The test results and the min-entropy of the simulation
+say nothing about the silicon, the configurations to enable have to be
+chosen from captures of the chip (randomness.py --peripheral).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATE_TRNGS = os.path.join(SCRIPT_DIR, '../../rtl/trng_configs/generate_trngs.py')
+SWEEP_DIR = os.path.join(SCRIPT_DIR, 'sweep_build')
+
+def load_configs():
+    spec = importlib.util.spec_from_file_location('generate_trngs', GENERATE_TRNGS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return [(index, module.trng_name(config), config) for index, config in enumerate(module.configs)]
+
+def result_path(name):
+    return os.path.join(SWEEP_DIR, name, 'result.json')
+
+def load_result(name, samples):
+    """The result of a previous run with the same number of samples"""
+    try:
+        with open(result_path(name)) as reader:
+            result = json.load(reader)
+    except (OSError, ValueError):
+        return None
+    return result if result.get('samples') == samples else None
+
+def characterise(index, name, config, samples):
+    """Simulate one configuration and analyse the capture, runs in a worker process"""
+    import tb_trng
+    import randomness
+    from cocotb.runner import get_results
+
+    build_dir = os.path.join(SWEEP_DIR, name)
+    capture = os.path.join(build_dir, f'{name}.bin')
+    os.makedirs(build_dir, exist_ok=True)
+
+    start = time.time()
+    results_xml = tb_trng.test_runner(name, build_dir, {'SAMPLES': str(samples), 'CAPTURE': capture})
+    duration = time.time() - start
+
+    _, failures = get_results(results_xml)
+    if failures or not os.path.isfile(capture):
+        raise RuntimeError(f'simulation of {name} failed, see {build_dir}')
+
+    stream = randomness.BitStream(np.fromfile(capture, dtype=np.uint8))
+    stream.length = min(stream.length, samples)
+    tests = randomness.analyse(stream)
+
+    result = {
+        'name': name,
+        'index': index,
+        'num_ringos': config['num_ringos'],
+        'num_inverter': config['num_inverter'],
+        'size': config.get('size'),
+        'samples': samples,
+        'simulation_s': duration,
+        'bias': stream.ones() / stream.length - 0.5,
+        'failed': [test for test in randomness.NIST_TESTS if tests[test] < randomness.ALPHA],
+        'tests': {test: float(value) for test, value in tests.items()}
+    }
+
+    # Write atomically, a half written result would stop the next sweep
+    with open(result_path(name) + '.tmp', 'w') as writer:
+        json.dump(result, writer, indent=4)
+    os.replace(result_path(name) + '.tmp', result_path(name))
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate and analyse all TRNG configurations (flow check only).')
+    parser.add_argument('configs', nargs='*', help='only these configurations, e.g. trng_8x5')
+    parser.add_argument('-n', '--samples', type=int, default=1 << 20, help='number of bits per configuration')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of parallel simulations')
+    parser.add_argument('-f', '--force', action='store_true', help='simulate again even if a result exists')
+    args = parser.parse_args()
+
+    configs = load_configs()
+    if args.configs:
+        unknown = set(args.configs) - {name for _, name, _ in configs}
+        if unknown:
+            sys.exit(f'Error: unknown configurations {" ".join(sorted(unknown))}')
+        configs = [entry for entry in configs if entry[1] in args.configs]
+
+    results = []
+    pending = []
+    for index, name, config in configs:
+        result = None if args.force else load_result(name, args.samples)
+        if result:
+            print(f'{name}: done')
+            results.append(result)
+        else:
+            pending.append((index, name, config))
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(characterise, index, name, config, args.samples): name
+                   for index, name, config in pending}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                print(f'{name}: {error}')
+                failed.append(name)
+                continue
+            print(f'{name}: simulated in {result["simulation_s"]:.0f} s')
+            results.append(result)
+
+    print(f'{"index":<6}{"config":<12}{"size":>6}{"bias":>9}{"min-H":>8}{"sim/s":>8}  failed tests')
+    for result in sorted(results, key=lambda result: result['index']):
+        entropy = result['tests']['min_entropy']
+        print(f'{result["index"]:<6}{result["name"]:<12}{result["size"] or "-":>6}{result["bias"]:>+9.4f}{entropy:>8.4f}'
+              f'{result["simulation_s"]:>8.0f}  {" ".join(result["failed"]) or "-"}')
+
+    print('The cells of dummy_cells.v have fixed delays, the streams are deterministic: '
+          'these results check the flow, they do not rate the configurations')
+
+    if failed:
+        sys.exit(f'Failed: {" ".join(sorted(failed))}')
+
+if __name__ == '__main__':
+    main()
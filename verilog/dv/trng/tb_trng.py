@@ -2,22 +2,128 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import time
 import random
 from pathlib import Path
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.runner import get_runner
-from cocotb.triggers import Timer, RisingEdge, FallingEdge
+from cocotb.triggers import Timer, RisingEdge, FallingEdge, ReadOnly
 from cocotb.types import LogicArray
 
 from random import randint
 
 ENV_PDK_ROOT = os.getenv("PDK_ROOT")
 
+# Number of bits to capture
+ENV_SAMPLES = int(os.getenv("SAMPLES", 1 << 16))
+
+# Bit-packed output file, the first bit is the MSB of the first byte
+ENV_CAPTURE = os.getenv("CAPTURE", "trng.bin")
+
+# Read single bits instead of the words of the deserializer
+ENV_BITWISE = os.getenv("BITWISE", None)
+
+# Build and test directory, the regression gives every job its own
+ENV_SIM_BUILD = os.getenv("SIM_BUILD", "sim_build")
+
+# Dump all signals into dump.vcd
+ENV_WAVES = os.getenv("WAVES", None)
+
+class TrngCapture:
+    """Collect the output of the TRNG into a bit-packed buffer
+
+    The buffer is written to the file whenever it is full,
+    so the number of samples is not limited by the memory.
+    """
+
+    def __init__(self, dut, samples, path, chunk_size=1 << 16):
+        self.dut = dut
+        self.samples = samples
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.bits = 0
+        self.ones = 0
+        self.unresolved = 0
+
+    def flush(self, writer):
+        writer.write(self.buffer)
+        self.buffer.clear()
+
+    async def capture_words(self, writer):
+        """Read a 32-bit word from the deserializer every 32 clocks
+
+        Of the last word only the bits up to the number of samples are kept.
+        """
+        while self.bits < self.samples:
+            await RisingEdge(self.dut.trng_word_valid)
+            await ReadOnly()
+
+            value = self.dut.trng_word.value
+            if not value.is_resolvable:
+                self.unresolved += 1
+                continue
+
+            bits = min(32, self.samples - self.bits)
+            word = value.integer >> (32 - bits) << (32 - bits)
+            self.buffer += word.to_bytes(4, 'big')[:(bits + 7) // 8]
+            self.ones += bin(word).count('1')
+            self.bits += bits
+
+            if len(self.buffer) >= self.chunk_size:
+                self.flush(writer)
+
+    async def capture_bits(self, writer):
+        """Read trng_out on every clock"""
+        byte = 0
+        count = 0
+        while self.bits < self.samples:
+            await RisingEdge(self.dut.clk)
+
+            value = self.dut.trng_out.value
+            if not value.is_resolvable:
+                self.unresolved += 1
+                continue
+
+            byte = (byte << 1) | value.integer
+            count += 1
+            self.bits += 1
+
+            if count == 8:
+                self.buffer.append(byte)
+                self.ones += bin(byte).count('1')
+                byte = 0
+                count = 0
+
+                if len(self.buffer) >= self.chunk_size:
+                    self.flush(writer)
+
+        # Pad the last byte with zeros
+        if count:
+            self.buffer.append(byte << (8 - count))
+            self.ones += bin(byte).count('1')
+
+    async def run(self, bitwise=False):
+        start = time.time()
+
+        with open(self.path, 'wb') as writer:
+            if bitwise:
+                await self.capture_bits(writer)
+            else:
+                await self.capture_words(writer)
+            self.flush(writer)
+
+        duration = time.time() - start
+        self.dut._log.info(f"Captured {self.bits} bits to {self.path} in {duration:.1f} s "
+                           f"({self.bits / duration:.0f} bits/s), ones: {self.ones / self.bits:.4f}")
+        if self.unresolved:
+            self.dut._log.warning(f"Skipped {self.unresolved} unresolved samples")
+
 @cocotb.test()
 async def simple_test(dut):
-    """ Simple test for """
+    """ Capture the output of the TRNG """
 
     # Start the clock
     c = Clock(dut.clk, 25, 'ns')
@@ -27,34 +133,55 @@ async def simple_test(dut):
     dut.trng_en.value = 0
     dut.vdd.value = 1
     dut.vss.value = 0
-    
+
     # Wait for 100 clock cycles
     for i in range(100):
         await RisingEdge(dut.clk)
 
     dut.trng_en.value = 1
-    
-    # Wait for 5000 clock cycles
-    for i in range(5000):
-        await RisingEdge(dut.clk)
 
-        dut._log.info(f"trng_out: {dut.trng_out.value}")
-    
+    capture = TrngCapture(dut, ENV_SAMPLES, ENV_CAPTURE)
+    await capture.run(bitwise=ENV_BITWISE)
+
     dut._log.info("Simulation done")
 
-def test_runner():
+def test_runner(config=None, build_dir=ENV_SIM_BUILD, extra_env=None):
+    """Simulate the generic trng macro or one of the configurations
+
+    config is e.g. "trng_8x5", its gate-level netlist is used if
+    it exists, the RTL otherwise.
+    """
+
+    extra_env = extra_env or {}
 
     sim = "icarus" #"verilator"
     proj_path = Path(__file__).resolve().parent
 
     verilog_sources = [
 	    proj_path / "trng_wrapper.v",
-	    proj_path / "../../gl/trng.v",
 	    proj_path / "dummy_cells.v"
     ]
     defines = [
         ("COCOTB", 1)
     ]
+
+    if ENV_WAVES:
+        defines.append(("WAVES", 1))
+
+    if config is None:
+        verilog_sources.append(proj_path / "../../gl/trng.v")
+    else:
+        defines.append(("TRNG_MODULE", config))
+        if (proj_path / f"../../gl/{config}.v").exists():
+            verilog_sources.append(proj_path / f"../../gl/{config}.v")
+        else:
+            verilog_sources += [
+                proj_path / f"../../rtl/trng_configs/{config}.sv",
+                proj_path / "../../rtl/trng.sv",
+                proj_path / "../../rtl/balanced_xor_tree.v",
+                proj_path / "../../rtl/ring_oscillator.v"
+            ]
+
     hdl_toplevel = "trng_wrapper"
     build_args=[]#["-Wno-fatal", "--timing", "--trace-fst", "--trace-structs"]
 
@@ -65,12 +192,15 @@ def test_runner():
         defines=defines,
         build_args=build_args,
         hdl_toplevel=hdl_toplevel,
+        build_dir=build_dir,
         always=True,
     )
 
-    runner.test(
+    return runner.test(
         hdl_toplevel=hdl_toplevel,
-        test_module="tb_trng,"
+        test_module="tb_trng,",
+        build_dir=build_dir,
+        extra_env=extra_env
     )
 
 if __name__ == "__main__":
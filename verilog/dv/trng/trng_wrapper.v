@@ -4,20 +4,32 @@
 module trng_wrapper (clk,
     trng_en,
     trng_out,
+    trng_word,
+    trng_word_valid,
     vdd,
     vss);
  input clk;
  input trng_en;
  output trng_out;
+ output reg [31:0] trng_word;
+ output reg trng_word_valid;
  input vdd;
  input vss;
 
+    // Only dumped with WAVES of tb_trng.py
+`ifdef WAVES
     initial begin
         $dumpfile("dump.vcd");
         $dumpvars(0, trng_wrapper);
     end
+`endif
 
-    trng trng_i (
+    // Set to e.g. trng_8x5 to simulate one of the configurations
+    `ifndef TRNG_MODULE
+    `define TRNG_MODULE trng
+    `endif
+
+    `TRNG_MODULE trng_i (
     `ifdef USE_POWER_PINS
         .vdd,
         .vss,
@@ -27,4 +39,25 @@ module trng_wrapper (clk,
         .trng_out
     );
 
+    // Deserializer: collect 32 samples into one word,
+    // the first sample ends up in the MSB.
+    // The testbench only needs to read every 32 clocks.
+
+    reg [31:0] trng_shift;
+    reg [4:0] trng_count;
+
+    always @(posedge clk) begin
+        trng_word_valid <= 1'b0;
+        if (!trng_en) begin
+            trng_count <= 5'd0;
+        end else begin
+            trng_shift <= {trng_shift[30:0], trng_out};
+            trng_count <= trng_count + 5'd1;
+            if (trng_count == 5'd31) begin
+                trng_word <= {trng_shift[30:0], trng_out};
+                trng_word_valid <= 1'b1;
+            end
+        end
+    end
+
 endmodule
@@ -4,10 +4,23 @@
 `default_nettype none
 `timescale 1ns / 1ps
 
+// A granted port keeps the grant as long as it claims, e.g. for the
+// burst refill of a cache line. A free bus is granted in the same cycle.
+//
+// ALGORITHM decides between the ports that claim a free bus:
+//
+//   PRIORITY   the lowest port
+//   ROUNDROB   the next port after the last granted one
+//   WEIGHTED   round robin between the ports with credit left, every
+//              grant takes one. If no claiming port has credit left, a
+//              second round robin between all of them; once no port at
+//              all has credit left, port i gets WEIGHTS[4*i+:4] (0 counts
+//              as 1). A core keeps its credit over the idle cycle between
+//              its accesses, so under load its share follows its weight.
 module arbiter #(
     parameter int NUM_PORTS = 2,
-    // TODO algorithm
-    parameter ALGORITHM = "ROUNDROB"
+    parameter ALGORITHM = "ROUNDROB",
+    parameter logic [4*NUM_PORTS-1:0] WEIGHTS = {NUM_PORTS{4'd1}}
 ) (
     input  logic clk,
     input  logic reset,
@@ -16,35 +29,89 @@ module arbiter #(
     output logic [NUM_PORTS-1:0] granted_signals // one-hot
 );
 
-    // Which port is currently granted access
-    // current_granted = 0 means that no port has access
-    logic [$clog2(NUM_PORTS+1)-1:0] current_granted;
-    
-    // Used to determine next port access
-    logic [$clog2(NUM_PORTS+1)-1:0] next_granted;
-    
+    localparam PORT_BITS = NUM_PORTS > 1 ? $clog2(NUM_PORTS) : 1;
+
+    // Port that has the bus, if owned
+    logic                 owned;
+    logic [PORT_BITS-1:0] owner;
+
+    // Last granted port, of the grants without credit (WEIGHTED)
+    logic [PORT_BITS-1:0] last;
+    logic [PORT_BITS-1:0] last_free;
+
+    // Grants left in this round (WEIGHTED)
+    logic [3:0] credit [NUM_PORTS];
+
+    // The owner keeps the bus
+    logic hold;
+    assign hold = owned && claim_signals[owner];
+
+    // Claiming ports that take part in the choice
+    logic [NUM_PORTS-1:0] eligible;
+    logic [NUM_PORTS-1:0] has_credit;
+    logic                 new_round;
+    logic                 free;         // a grant without credit
+
     always_comb begin
-        next_granted = '0;
-        
+        eligible  = claim_signals;
+        new_round = 1'b0;
+        free      = 1'b0;
+
+        for (int i=0; i<NUM_PORTS; i++) begin
+            has_credit[i] = credit[i] != '0;
+        end
+
+        if (ALGORITHM == "WEIGHTED") begin
+            // All ports used up their credit
+            new_round = has_credit == '0;
+
+            // Claiming ports without credit only get a free bus
+            if ((claim_signals & has_credit) != '0) begin
+                eligible = claim_signals & has_credit;
+            end else begin
+                free = !new_round;
+            end
+        end
+    end
+
+    // Credit before this grant, refilled for a new round
+    logic [3:0] round_credit [NUM_PORTS];
+
+    always_comb begin
+        for (int i=0; i<NUM_PORTS; i++) begin
+            round_credit[i] = credit[i];
+            if (new_round) begin
+                round_credit[i] = WEIGHTS[4*i+:4] == '0 ? 4'd1 : WEIGHTS[4*i+:4];
+            end
+        end
+    end
+
+    // Choice for a free bus
+    logic                 next_valid;
+    logic [PORT_BITS-1:0] next_port;
+    logic [PORT_BITS-1:0] search;
+
+    assign search = free ? last_free : last;
+
+    always_comb begin
+        next_valid = 1'b0;
+        next_port  = '0;
+
         if (ALGORITHM == "PRIORITY") begin
             // Lowest port has highest priority
             for (int i=NUM_PORTS-1; i>=0; i--) begin
-                if (claim_signals[i] == 1'b1) begin
-                    /* verilator lint_off WIDTHTRUNC */
-                    next_granted = i + 1;
-                    /* verilator lint_on WIDTHTRUNC */
+                if (eligible[i]) begin
+                    next_valid = 1'b1;
+                    next_port  = PORT_BITS'(i);
                 end
             end
-        end
-        
-        if (ALGORITHM == "ROUNDROB") begin
-            // Grant the next port
-            /* verilator lint_off WIDTHEXPAND */
-            if (current_granted < NUM_PORTS) begin
-            /* verilator lint_on WIDTHEXPAND */
-                next_granted = current_granted + 1;
-            end else begin
-                next_granted = '0;
+        end else begin
+            // Search from the port after the last granted one
+            for (int offset=NUM_PORTS; offset>=1; offset--) begin
+                if (eligible[(int'(search) + offset) % NUM_PORTS]) begin
+                    next_valid = 1'b1;
+                    next_port  = PORT_BITS'(unsigned'((int'(search) + offset) % NUM_PORTS));
+                end
             end
         end
     end
@@ -52,19 +119,30 @@ module arbiter #(
     // Manage access
     always_ff @(posedge clk, posedge reset) begin
         if (reset) begin
-            current_granted <= '0;
+            owned  <= 1'b0;
+            owner  <= '0;
+            last   <= PORT_BITS'(NUM_PORTS - 1); // port 0 first
+            last_free <= PORT_BITS'(NUM_PORTS - 1);
+            for (int i=0; i<NUM_PORTS; i++) begin
+                credit[i] <= '0;
+            end
         end else begin
-            
-            // Claim has been released
-            if (claim_signals[current_granted-1] == 1'b0) begin
+            if (!hold) begin
+                owned <= next_valid;
+                owner <= next_port;
 
-                // Let's see who wants to claim
-                current_granted <= next_granted;
-            end
-            
-            // Currently nothing is granted, let's see who wants to claim
-            if (current_granted == '0) begin
-                current_granted <= next_granted;                
+                // A new grant
+                if (next_valid) begin
+                    if (free) begin
+                        last_free <= next_port;
+                    end else begin
+                        last <= next_port;
+                    end
+
+                    for (int i=0; i<NUM_PORTS; i++) begin
+                        credit[i] <= int'(next_port) == i && round_credit[i] != '0 ? round_credit[i] - 1'b1 : round_credit[i];
+                    end
+                end
             end
         end
     end
@@ -72,18 +150,11 @@ module arbiter #(
     // Combinatorial for instant access
     always_comb begin
         granted_signals = '0;
-    
-        // Bus is free
-        if (current_granted == '0) begin
-            // Someone wants to claim
-            if (next_granted != 1'b0) begin
-                granted_signals = 1'b1 << (next_granted-1);
-            end
-        // Bus already claimed
-        end else begin
-            if (current_granted != 1'b0) begin
-                granted_signals = 1'b1 << (current_granted-1);
-            end
+
+        if (hold) begin
+            granted_signals[owner] = 1'b1;
+        end else if (next_valid) begin
+            granted_signals[next_port] = 1'b1;
         end
     end
 
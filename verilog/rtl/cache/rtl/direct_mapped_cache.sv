@@ -4,8 +4,17 @@
 `default_nettype none
 `timescale 1ns / 1ps
 
+// Read-only cache of CACHE_ENTRIES lines of LINE_WORDS words each
+// A miss refills the whole line with one sequential burst from the
+// first word of the line on, mem_rstrb stays asserted until the last
+// word so that the bus is not given away in between and spi_flash
+// continues the read command (ST_CONTINUE) instead of starting anew.
+// With WAYS > 1 the lines are organised in sets of WAYS lines, the
+// victim is chosen by a tree pseudo-LRU, an invalid way first.
 module direct_mapped_cache #(
-    parameter CACHE_ENTRIES = 32,
+    parameter CACHE_ENTRIES = 32,   // number of lines
+    parameter LINE_WORDS = 1,       // words per line, power of two
+    parameter WAYS = 1,             // lines per set, power of two
     parameter ADDR_WIDTH = 32
 ) (
     input  logic clk_i,
@@ -16,87 +25,190 @@ module direct_mapped_cache #(
     output logic [31:0] cache_rdata,  // read data
     input  logic        cache_rstrb,  // read strobe
     output logic        cache_done,   // done
-    
+
     // Connected to memory
     output logic [31:0] mem_addr,   // address
     input  logic [31:0] mem_rdata,  // read data
     output logic        mem_rstrb,  // read strobe
-    input  logic        mem_done    // done
+    input  logic        mem_done,   // done
+
+    // Performance counters
+    output logic        lookup_hit,   // pulse, the lookup hit
+    output logic        lookup_miss   // pulse, the lookup missed
 );
 
-    typedef struct packed {
-        logic valid;                                        // Cache entry valid
-        logic [ADDR_WIDTH-$clog2(CACHE_ENTRIES)-2-1:0] tag; // Tag
-        logic [31:0] data;                                  // Data (4 bytes)
-    } cache_set_t;
-    
-    // Cache memory
-    cache_set_t cache [0:CACHE_ENTRIES-1];
-    
+    localparam SETS = CACHE_ENTRIES / WAYS;
+
+    // At least one bit, unused for one word, set or way
+    localparam WORD_BITS  = LINE_WORDS > 1 ? $clog2(LINE_WORDS) : 1;
+    localparam INDEX_BITS = SETS > 1 ? $clog2(SETS) : 1;
+    localparam WAY_BITS   = WAYS > 1 ? $clog2(WAYS) : 1;
+
+    localparam OFFSET_WIDTH = 2 + $clog2(LINE_WORDS);
+    localparam INDEX_WIDTH  = $clog2(SETS);
+    localparam TAG_WIDTH    = ADDR_WIDTH - INDEX_WIDTH - OFFSET_WIDTH;
+
+    // Cache memory, line i of set s is at s * WAYS + i
+    logic [CACHE_ENTRIES-1:0] valid;
+    logic [TAG_WIDTH-1:0]     tags [0:CACHE_ENTRIES-1];
+    logic [31:0]              data [0:CACHE_ENTRIES*LINE_WORDS-1];
+
+    // Pseudo-LRU tree of each set, nodes 1 to WAYS-1, 0: left, 1: right
+    logic [WAYS-1:0] plru [0:SETS-1];
+
     // Extract attributes from address
-    logic [1:0]                                     cache_offset;
-    logic [$clog2(CACHE_ENTRIES)-1:0]               cache_index;
-    logic [ADDR_WIDTH-$clog2(CACHE_ENTRIES)-2-1:0]  cache_tag;
-    
-    assign cache_offset = cache_addr[1:0];
-    assign cache_index  = cache_addr[$clog2(CACHE_ENTRIES)+2-1:2];
-    assign cache_tag    = cache_addr[ADDR_WIDTH-1:$clog2(CACHE_ENTRIES)+2];
-    
-    // Currently referenced entry
-    cache_set_t entry;
-    assign mem_addr = cache_addr;
+    logic [WORD_BITS-1:0]   cache_word;
+    logic [INDEX_BITS-1:0]  cache_index;
+    logic [TAG_WIDTH-1:0]   cache_tag;
+
+    assign cache_word  = LINE_WORDS > 1 ? WORD_BITS'(cache_addr[OFFSET_WIDTH-1:2]) : '0;
+    assign cache_index = SETS > 1 ? INDEX_BITS'(cache_addr >> OFFSET_WIDTH) : '0;
+    assign cache_tag   = cache_addr[ADDR_WIDTH-1:ADDR_WIDTH-TAG_WIDTH];
+
+    // The way to follow down the tree
+    function automatic logic [WAY_BITS-1:0] plru_victim(input logic [WAYS-1:0] tree);
+        int node;
+        node = 1;
+        for (int level = 0; level < $clog2(WAYS); level++) begin
+            node = 2 * node + int'(tree[node]);
+        end
+        return WAY_BITS'(unsigned'(node - WAYS));
+    endfunction
+
+    // Point all nodes on the path away from the way
+    function automatic logic [WAYS-1:0] plru_touch(input logic [WAYS-1:0] tree, input logic [WAY_BITS-1:0] way);
+        int node;
+        node = WAYS + int'(way);
+        for (int level = 0; level < $clog2(WAYS); level++) begin
+            tree[node / 2] = !node[0];
+            node = node / 2;
+        end
+        return tree;
+    endfunction
+
+    // First entry of the set
+    int set_entry;
+
+    assign set_entry = int'(cache_index) * WAYS;
+
+    // Compare the tags of all ways of the set
+    logic                hit;
+    logic [WAY_BITS-1:0] hit_way;
+    logic                free;
+    logic [WAY_BITS-1:0] free_way;
+
+    always_comb begin
+        hit      = 1'b0;
+        hit_way  = '0;
+        free     = 1'b0;
+        free_way = '0;
+        for (int way = WAYS - 1; way >= 0; way--) begin
+            if (valid[set_entry + way] && tags[set_entry + way] == cache_tag) begin
+                hit     = 1'b1;
+                hit_way = WAY_BITS'(unsigned'(way));
+            end
+            if (!valid[set_entry + way]) begin
+                free     = 1'b1;
+                free_way = WAY_BITS'(unsigned'(way));
+            end
+        end
+    end
+
+    // Currently referenced line
+    logic                entry_hit;
+    logic [WAY_BITS-1:0] entry_way;
+    logic [31:0]         entry_data;
+
+    // Refill
+    logic [WORD_BITS-1:0] refill_word;
+    logic [31:0]          refill_rdata;   // requested word
+
+    generate
+        if (LINE_WORDS > 1) begin : gen_refill_addr
+            assign mem_addr = {cache_addr[ADDR_WIDTH-1:OFFSET_WIDTH], refill_word, 2'b00};
+        end else begin : gen_cache_addr
+            assign mem_addr = cache_addr;
+        end
+    endgenerate
 
     logic [1:0] state;
-    
+
+    // Lookup of a request and refill from memory, used by the testbenches
+    logic lookup;
+    logic refill;
+    assign lookup = state == 0 && cache_rstrb && !cache_done;
+    assign refill = state == 2;
+
+    assign lookup_hit  = state == 1 &&  entry_hit;
+    assign lookup_miss = state == 1 && !entry_hit;
+
     always_ff @(posedge clk_i, negedge rst_ni) begin
         if (!rst_ni) begin
-            for (int i=0;i<CACHE_ENTRIES;i++) begin
-                cache[i] <= '0;
+            valid <= '0;
+            for (int i=0;i<SETS;i++) begin
+                plru[i] <= '0;
             end
             cache_done <= 1'b0;
             cache_rdata <= '0;
-            entry <= '0;
+            entry_hit <= 1'b0;
+            entry_way <= '0;
+            entry_data <= '0;
+            refill_word <= '0;
+            refill_rdata <= '0;
             state <= 0;
             mem_rstrb <= 1'b0;
         end else begin
             cache_done <= 1'b0;
-        
+
             // Waiting for core
             if (state == 0 && cache_rstrb && !cache_done) begin
-                entry <= cache[cache_index];
+                entry_hit  <= hit;
+                entry_way  <= hit ? hit_way : free ? free_way : plru_victim(plru[cache_index]);
+                entry_data <= data[(set_entry + int'(hit_way)) * LINE_WORDS + int'(cache_word)];
                 state <= 1;
             end
-            
+
             // Check cache
             if (state == 1) begin
                 // Entry is valid and tag matches
-                if (entry.valid && entry.tag == cache_tag) begin
+                if (entry_hit) begin
                     // Send data to core
-                    cache_rdata <= entry.data;
+                    cache_rdata <= entry_data;
                     cache_done <= 1'b1;
-                    
+                    if (WAYS > 1) plru[cache_index] <= plru_touch(plru[cache_index], entry_way);
+
                     // Back to idle
                     state <= 0;
-                // Else need to ask memory
+                // Else need to ask memory, from the first word of the line on
                 end else begin
+                    valid[set_entry + int'(entry_way)] <= 1'b0;
+                    refill_word <= '0;
                     mem_rstrb <= 1'b1;
                     state <= 2;
                 end
             end
-            
+
             // Waiting for memory
             if (state == 2 && mem_done) begin
-                mem_rstrb <= 1'b0;
-
                 // New cache entry
-                cache[cache_index] <= {1'b1, cache_tag, mem_rdata};
+                data[(set_entry + int'(entry_way)) * LINE_WORDS + int'(refill_word)] <= mem_rdata;
+                if (refill_word == cache_word) refill_rdata <= mem_rdata;
+                refill_word <= refill_word + 1'b1;
 
-                // Send to core
-                cache_rdata <= mem_rdata;
-                cache_done <= 1'b1;
+                // Last word of the line
+                if (LINE_WORDS == 1 || refill_word == WORD_BITS'(unsigned'(LINE_WORDS - 1))) begin
+                    mem_rstrb <= 1'b0;
+                    valid[set_entry + int'(entry_way)] <= 1'b1;
+                    tags[set_entry + int'(entry_way)]  <= cache_tag;
+                    if (WAYS > 1) plru[cache_index] <= plru_touch(plru[cache_index], entry_way);
 
-                // Back to idle
-                state <= 0;
+                    // Send to core
+                    cache_rdata <= refill_word == cache_word ? mem_rdata : refill_rdata;
+                    cache_done <= 1'b1;
+
+                    // Back to idle
+                    state <= 0;
+                end
             end
         end
     end
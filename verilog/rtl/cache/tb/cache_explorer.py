@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Explore instruction cache geometries with traces of real firmware
+
+The instruction fetches of a toplevel run are recorded with
+
+    FETCH_TRACE=fetch.npz python3 verilog/dv/toplevel/tb_toplevel.py
+
+and replayed through a cache model for every combination of the number
+of lines (entries), the line size, the associativity and the
+replacement policy. Every hart has its own cache, as in core_wrapper.
+
+Consecutive fetches from the same line hit in every cache and are
+removed first. A direct mapped cache is then evaluated with NumPy
+alone, the LRU caches of all associativities at once from the stack
+distances, FIFO, tree PLRU and random need one pass each.
+
+The average memory access time uses the refill latency measured in the
+toplevel run, separately for the flash and the rest (WRAM). Lines
+larger than one word are refilled word by word, unless --burst gives
+the cycles of every further word of a burst, as direct_mapped_cache.sv
+does from the flash. If the toplevel run had longer lines (--rtl-line),
+the further words of its bursts are taken off the measured latency.
+
+    cache_explorer.py sweep fetch.npz
+    cache_explorer.py sweep fetch.npz --entries 16,32,64 --line 4,16 --ways 1,2 --policy lru,plru
+    cache_explorer.py check fetch.npz --entries 16 --entries 32
+    cache_explorer.py check fetch.npz --entries 16 --line 16 --ways 2
+
+check replays the trace through the RTL direct_mapped_cache with
+tb_direct_mapped_cache.py and compares the misses with the model, with
+more than one way the RTL replaces by tree PLRU.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# Cycles from the request to done on a hit, see direct_mapped_cache.sv
+HIT_CYCLES = 2
+
+FLASH_REGION = 0x02
+
+POLICIES = ['lru', 'fifo', 'plru', 'random']
+
+# Stack distance of a line that is not in the cache
+COLD = np.iinfo(np.int32).max
+
+def load_trace(path):
+    """(list of address arrays per hart, refills per hart)"""
+    with np.load(path) as data:
+        harts = sorted((name for name in data.files if name.startswith('hart')), key=lambda name: int(name[4:]))
+        return [data[name] for name in harts], data['refills']
+
+def log2(value, what):
+    if value <= 0 or value & (value - 1):
+        raise ValueError(f'{what} must be a power of two, not {value}')
+    return value.bit_length() - 1
+
+def distinct_lines(addresses, line_bytes):
+    """Line numbers without the consecutive repeats, which are always hits"""
+    lines = addresses >> np.uint32(log2(line_bytes, 'the line size'))
+    keep = np.ones(len(lines), dtype=bool)
+    keep[1:] = lines[1:] != lines[:-1]
+    return lines[keep]
+
+def direct_mapped_misses(lines, sets):
+    """Miss mask of a direct mapped cache, vectorised
+
+    An access hits if the previous access to its set was to the same line.
+    """
+    index = lines & np.uint32(sets - 1)
+    order = np.argsort(index, kind='stable')
+    sorted_index = index[order]
+    sorted_lines = lines[order]
+
+    hits = np.zeros(len(lines), dtype=bool)
+    hits[1:] = (sorted_index[1:] == sorted_index[:-1]) & (sorted_lines[1:] == sorted_lines[:-1])
+
+    misses = np.empty(len(lines), dtype=bool)
+    misses[order] = ~hits
+    return misses
+
+def lru_distances(lines, sets, max_ways):
+    """Stack distance of every access within its set (Mattson)
+
+    An access hits in an LRU cache with n ways if its distance is below n.
+    Only the max_ways most recent lines of a set are kept.
+    """
+    stacks = [[] for _ in range(sets)]
+    distances = np.full(len(lines), COLD, dtype=np.int32)
+    mask = sets - 1
+    for position, line in enumerate(lines.tolist()):
+        stack = stacks[line & mask]
+        try:
+            distance = stack.index(line)
+        except ValueError:
+            if len(stack) == max_ways:
+                stack.pop()
+        else:
+            distances[position] = distance
+            del stack[distance]
+        stack.insert(0, line)
+    return distances
+
+def policy_misses(lines, sets, ways, policy, seed=0):
+    """Miss mask of a set associative cache with FIFO, tree PLRU or random replacement"""
+    mask = sets - 1
+    content = [[None] * ways for _ in range(sets)]
+    misses = np.zeros(len(lines), dtype=bool)
+
+    if policy == 'fifo':
+        pointer = [0] * sets
+    elif policy == 'plru':
+        levels = log2(ways, 'the number of ways for PLRU')
+        tree = [[0] * ways for _ in range(sets)]  # nodes 1 .. ways-1
+    elif policy == 'random':
+        victims = np.random.default_rng(seed).integers(0, ways, len(lines)).tolist()
+    else:
+        raise ValueError(f'unknown policy {policy}')
+
+    for position, line in enumerate(lines.tolist()):
+        index = line & mask
+        ways_of_set = content[index]
+        try:
+            way = ways_of_set.index(line)
+        except ValueError:
+            misses[position] = True
+            if None in ways_of_set:
+                way = ways_of_set.index(None)
+            elif policy == 'fifo':
+                way = pointer[index]
+                pointer[index] = (way + 1) % ways
+            elif policy == 'plru':
+                # Follow the bits to the pseudo least recently used way
+                node = 1
+                for _ in range(levels):
+                    node = 2 * node + tree[index][node]
+                way = node - ways
+            else:
+                way = victims[position]
+            ways_of_set[way] = line
+
+        if policy == 'plru':
+            # Point all nodes on the path away from this way
+            node = way + ways
+            for _ in range(levels):
+                parent = node // 2
+                tree[index][parent] = 0 if node & 1 else 1
+                node = parent
+    return misses
+
+def rtl_misses(addresses, entries, line_bytes=4, ways=1):
+    """Misses of direct_mapped_cache.sv, direct mapped or with tree PLRU"""
+    lines = distinct_lines(addresses, line_bytes)
+    if ways == 1:
+        return int(direct_mapped_misses(lines, entries).sum())
+    return int(policy_misses(lines, entries // ways, ways, 'plru').sum())
+
+class Latency:
+    """Refill cycles of one word, measured in the toplevel run
+
+    The run refilled lines of line_bytes, its further words took burst
+    cycles each, or as long as the first without burst.
+    """
+
+    def __init__(self, refills, flash=None, other=None, line_bytes=4, burst=None):
+        refills = np.asarray(refills, dtype=np.float64).sum(axis=0)
+        flash_misses, flash_cycles, other_misses, other_cycles = refills
+        words = line_bytes // 4
+
+        def first(cycles):
+            return cycles / words if burst is None else cycles - (words - 1) * burst
+
+        self.flash = flash if flash is not None else first(flash_cycles / flash_misses) if flash_misses else 0.0
+        self.other = other if other is not None else first(other_cycles / other_misses) if other_misses else 0.0
+
+    def refill(self, lines, line_bytes, burst):
+        """Cycles to refill each of the lines"""
+        words = line_bytes // 4
+        flash = (lines << np.uint32(log2(line_bytes, 'the line size'))) >> np.uint32(24) == FLASH_REGION
+        first = np.where(flash, self.flash, self.other)
+        further = first if burst is None else burst
+        return first + (words - 1) * further
+
+class Result:
+
+    def __init__(self, entries, line_bytes, ways, policy, fetches, misses, cycles):
+        self.entries = entries
+        self.line_bytes = line_bytes
+        self.ways = ways
+        self.policy = policy
+        self.fetches = fetches
+        self.misses = misses
+        self.cycles = cycles
+
+    @property
+    def size(self):
+        return self.entries * self.line_bytes
+
+    @property
+    def hit_rate(self):
+        return 1 - self.misses / self.fetches if self.fetches else 0.0
+
+    @property
+    def amat(self):
+        return self.cycles / self.fetches if self.fetches else 0.0
+
+def explore(traces, latency, entries_list, line_list, ways_list, policies, burst=None, seed=0):
+    """Results of all geometries, summed over the harts"""
+    results = {}
+
+    def add(key, fetches, misses, refill_cycles):
+        previous = results.get(key)
+        fetches_sum = fetches + (previous.fetches if previous else 0)
+        misses_sum = misses + (previous.misses if previous else 0)
+        cycles_sum = fetches * HIT_CYCLES + refill_cycles + (previous.cycles if previous else 0)
+        results[key] = Result(*key, fetches_sum, misses_sum, cycles_sum)
+
+    for trace in traces:
+        for line_bytes in line_list:
+            lines = distinct_lines(trace, line_bytes)
+            refill = latency.refill(lines, line_bytes, burst)
+
+            # The stack distances depend on the number of sets only, one pass
+            # covers all geometries with the same sets
+            distances = {}
+            for entries in entries_list:
+                for ways in ways_list:
+                    if 1 < ways <= entries:
+                        sets = entries // ways
+                        distances[sets] = max(distances.get(sets, 0), ways)
+            if 'lru' in policies:
+                distances = {sets: lru_distances(lines, sets, ways) for sets, ways in distances.items()}
+
+            for entries in entries_list:
+                # A direct mapped cache has nothing to replace
+                geometries = [(1, '-')] if 1 in ways_list else []
+                geometries += [(ways, policy) for policy in policies for ways in ways_list if 1 < ways <= entries]
+                for ways, policy in geometries:
+                    sets = entries // ways
+                    if ways == 1:
+                        misses = direct_mapped_misses(lines, sets)
+                    elif policy == 'lru':
+                        misses = distances[sets] >= ways
+                    else:
+                        misses = policy_misses(lines, sets, ways, policy, seed)
+                    add((entries, line_bytes, ways, policy), len(trace), int(misses.sum()),
+                        float(refill[misses].sum()))
+    return sorted(results.values(), key=lambda result: (result.amat, result.size, result.ways))
+
+def numbers(value):
+    return [int(item, 0) for item in value.split(',')]
+
+def sweep(args):
+    traces, refills = load_trace(args.trace)
+    latency = Latency(refills, args.flash_latency, args.other_latency, args.rtl_line, args.burst)
+
+    fetches = sum(len(trace) for trace in traces)
+    print(f'{fetches} fetches of {len(traces)} harts, refill of a word: '
+          f'flash {latency.flash:.1f} cycles, other {latency.other:.1f} cycles')
+
+    # The geometry of the toplevel run, a check of the trace against the cache that produced it
+    measured = int(np.asarray(refills)[:, [0, 2]].sum())
+    model = sum(rtl_misses(trace, args.rtl_entries, args.rtl_line, args.rtl_ways) for trace in traces)
+    print(f'RTL cache ({args.rtl_entries} entries, {args.rtl_line} byte lines, {args.rtl_ways} ways): '
+          f'{measured} misses, model: {model}')
+
+    results = explore(traces, latency, args.entries, args.line, args.ways, args.policy, args.burst, args.seed)
+
+    print(f'{"entries":>8}{"line":>6}{"ways":>6}  {"policy":<8}{"bytes":>8}{"hit rate":>10}{"AMAT":>9}')
+    for result in results[:args.count]:
+        print(f'{result.entries:8d}{result.line_bytes:6d}{result.ways:6d}  {result.policy:<8}{result.size:8d}'
+              f'{result.hit_rate * 100:9.2f}%{result.amat:9.2f}')
+
+    if args.csv:
+        with open(args.csv, 'w') as writer:
+            writer.write('entries,line_bytes,ways,policy,bytes,fetches,misses,hit_rate,amat\n')
+            for result in results:
+                writer.write(f'{result.entries},{result.line_bytes},{result.ways},{result.policy},{result.size},'
+                             f'{result.fetches},{result.misses},{result.hit_rate:.6f},{result.amat:.4f}\n')
+
+def check(args):
+    """Replay the trace through the RTL, the testbench compares the misses with the model"""
+    import tb_direct_mapped_cache
+    from cocotb.runner import get_results
+
+    log2(args.line, 'the line size')
+    failed = []
+    for entries in args.entries:
+        build_dir = os.path.join(args.build_dir, f'entries{entries}-line{args.line}-ways{args.ways}')
+        results = tb_direct_mapped_cache.test_runner(
+            entries=entries, line_words=args.line // 4, ways=args.ways, build_dir=build_dir,
+            extra_env={'TRACE': os.path.abspath(args.trace), 'TRACE_HART': str(args.hart),
+                       'TRACE_LIMIT': str(args.limit)})
+        _, failures = get_results(results)
+        print(f'{entries} entries: {"passed" if not failures else "FAILED"}')
+        if failures:
+            failed.append(entries)
+    if failed:
+        sys.exit(f'Error: the RTL does not match the model for {", ".join(map(str, failed))} entries')
+
+def main():
+    parser = argparse.ArgumentParser(description='Explore instruction cache geometries with fetch traces.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_sweep = commands.add_parser('sweep', help='hit rate and AMAT of many geometries')
+    parser_sweep.add_argument('trace', help='.npz of FETCH_TRACE')
+    parser_sweep.add_argument('--entries', type=numbers, default=[8, 16, 32, 64, 128, 256],
+                              help='numbers of lines, comma-separated')
+    parser_sweep.add_argument('--line', type=numbers, default=[4, 8, 16, 32], help='line sizes in bytes')
+    parser_sweep.add_argument('--ways', type=numbers, default=[1, 2, 4, 8], help='associativities')
+    parser_sweep.add_argument('--policy', type=lambda value: value.split(','), default=['lru'],
+                              help=f'replacement policies: {",".join(POLICIES)}')
+    parser_sweep.add_argument('--burst', type=float, help='cycles of every further word of a line refill')
+    parser_sweep.add_argument('--flash-latency', type=float, help='refill cycles of a word from the flash')
+    parser_sweep.add_argument('--other-latency', type=float, help='refill cycles of a word from the WRAM')
+    parser_sweep.add_argument('--rtl-entries', type=int, default=32, help='INSTR_CACHE_SIZE of the toplevel run')
+    parser_sweep.add_argument('--rtl-line', type=int, default=4, help='line size in bytes of the toplevel run')
+    parser_sweep.add_argument('--rtl-ways', type=int, default=1, help='INSTR_CACHE_WAYS of the toplevel run')
+    parser_sweep.add_argument('--seed', type=int, default=0, help='seed of the random replacement')
+    parser_sweep.add_argument('-n', '--count', type=int, default=30, help='number of geometries to print')
+    parser_sweep.add_argument('--csv', help='write all results to this file')
+
+    parser_check = commands.add_parser('check', help='compare the model with the RTL direct_mapped_cache')
+    parser_check.add_argument('trace', help='.npz of FETCH_TRACE')
+    parser_check.add_argument('--entries', type=int, action='append', required=True,
+                              help='CACHE_ENTRIES, can be repeated')
+    parser_check.add_argument('--line', type=int, default=4, help='line size in bytes')
+    parser_check.add_argument('--ways', type=int, default=1, help='WAYS of the cache')
+    parser_check.add_argument('--hart', type=int, default=0, help='trace of this hart')
+    parser_check.add_argument('--limit', type=int, default=20000, help='number of fetches to replay')
+    parser_check.add_argument('--build-dir', default='sim_build', help='build directory')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'sweep':
+            unknown = set(args.policy) - set(POLICIES)
+            if unknown:
+                raise ValueError(f'unknown policies {", ".join(sorted(unknown))}')
+            sweep(args)
+        else:
+            check(args)
+    except ValueError as error:
+        sys.exit(f'Error: {error}')
+
+if __name__ == '__main__':
+    main()
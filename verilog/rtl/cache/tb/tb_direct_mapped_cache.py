@@ -13,6 +13,27 @@ from cocotb.types import LogicArray
 
 from random import randint
 
+from cache_explorer import load_trace, rtl_misses
+
+# Build and test directory, the regression gives every job its own
+ENV_SIM_BUILD = os.getenv("SIM_BUILD", "sim_build")
+
+# Replay a fetch trace of cache_explorer.py instead of random addresses
+ENV_TRACE = os.getenv("TRACE")
+ENV_TRACE_HART = int(os.getenv("TRACE_HART", "0"))
+ENV_TRACE_LIMIT = int(os.getenv("TRACE_LIMIT", "20000"))
+ENV_CACHE_ENTRIES = int(os.getenv("CACHE_ENTRIES", "32"))
+ENV_LINE_WORDS = int(os.getenv("LINE_WORDS", "1"))
+ENV_WAYS = int(os.getenv("WAYS", "1"))
+
+# Variants run by ../../../dv/regression.py, name -> environment
+REGRESSION = {
+    "direct": {},
+    "line4": {"LINE_WORDS": "4"},
+    "line4-ways2": {"LINE_WORDS": "4", "WAYS": "2"},
+    "line8-ways4": {"CACHE_ENTRIES": "16", "LINE_WORDS": "8", "WAYS": "4"},
+}
+
 MEMORY_SIZE_BITS = 8
 ITERATIONS = 1000
 
@@ -25,24 +46,44 @@ async def reset_dut(rst, duration_ns):
     rst.value = 1
     rst._log.info("Reset complete")
 
+# Data of the trace replay, any address can be fetched
+def trace_data(addr):
+    return (addr * 2654435761) & 0xFFFFFFFF
+
 # Memory coroutine
-async def memory(dut):
+# A miss refills a line in one burst, the read strobe is held until the
+# last word and a word is returned every other cycle
+async def memory(dut, data=lambda addr: mem_data[addr>>2], misses=None, log=True):
     cache_misses = 0
+    line_bytes = ENV_LINE_WORDS * 4
     while 1:
         await RisingEdge(dut.mem_rstrb)
-        
-        assert (dut.mem_addr.value % 4 == 0)
-        
-        dut.mem_rdata.value = mem_data[dut.mem_addr.value>>2]
-        dut.mem_done.value = 1
-        
-        await RisingEdge(dut.clk_i)
-        dut.mem_done.value = 0
+
+        # From the first word of the line on
+        assert (dut.mem_addr.value % line_bytes == 0)
+        start = addr = dut.mem_addr.value.integer
+
+        while dut.mem_rstrb.value:
+            assert (dut.mem_addr.value == addr)
+
+            dut.mem_rdata.value = data(addr)
+            dut.mem_done.value = 1
+
+            await RisingEdge(dut.clk_i)
+            dut.mem_done.value = 0
+
+            await FallingEdge(dut.clk_i)
+            addr += 4
+
+        assert (addr - start == line_bytes)
         
         cache_misses += 1
-        dut._log.info(f"Cache misses: {cache_misses} / {ITERATIONS}")
+        if misses is not None:
+            misses[0] = cache_misses
+        if log:
+            dut._log.info(f"Cache misses: {cache_misses} / {ITERATIONS}")
 
-@cocotb.test()
+@cocotb.test(skip=ENV_TRACE is not None)
 async def simple_test(dut):
     """ Simple test for """
 
@@ -76,7 +117,44 @@ async def simple_test(dut):
     
     dut._log.info("Simulation done")
 
-def test_runner():
+@cocotb.test(skip=ENV_TRACE is None)
+async def trace_test(dut):
+    """ Replay a fetch trace and compare the misses with cache_explorer.py """
+
+    traces, _ = load_trace(ENV_TRACE)
+    trace = traces[ENV_TRACE_HART][:ENV_TRACE_LIMIT]
+    expected = rtl_misses(trace, ENV_CACHE_ENTRIES, ENV_LINE_WORDS * 4, ENV_WAYS)
+
+    # Start the clock
+    c = Clock(dut.clk_i, 25, 'ns')
+    await cocotb.start(c.start())
+
+    # Reset values
+    dut.cache_addr.value = 0
+    dut.cache_rstrb.value = 0
+
+    await reset_dut(dut.rst_ni, 50)
+
+    misses = [0]
+    await cocotb.start(memory(dut, trace_data, misses, log=False))
+
+    for addr in trace.tolist():
+        dut.cache_addr.value = addr
+        dut.cache_rstrb.value = 1
+
+        await RisingEdge(dut.cache_done)
+        dut.cache_rstrb.value = 0
+
+        assert(trace_data(addr) == dut.cache_rdata.value.integer)
+
+        await RisingEdge(dut.clk_i)
+
+    dut._log.info(f"{len(trace)} fetches, cache misses: {misses[0]}, model: {expected}")
+    assert misses[0] == expected, "the RTL and cache_explorer.py disagree"
+
+def test_runner(entries=ENV_CACHE_ENTRIES, line_words=ENV_LINE_WORDS, ways=ENV_WAYS, build_dir=ENV_SIM_BUILD,
+                extra_env=None):
+    extra_env = extra_env or {}
 
     sim = "verilator"
     proj_path = Path(__file__).resolve().parent
@@ -95,12 +173,16 @@ def test_runner():
         defines=defines,
         build_args=build_args,
         hdl_toplevel=hdl_toplevel,
+        parameters={"CACHE_ENTRIES": entries, "LINE_WORDS": line_words, "WAYS": ways},
+        build_dir=build_dir,
         always=True,
     )
 
-    runner.test(
+    return runner.test(
         hdl_toplevel=hdl_toplevel,
-        test_module="tb_direct_mapped_cache,"
+        test_module="tb_direct_mapped_cache,",
+        build_dir=build_dir,
+        extra_env=dict(extra_env, CACHE_ENTRIES=str(entries), LINE_WORDS=str(line_words), WAYS=str(ways))
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Connects the bus of every master to the target of its address,
+// different targets are accessed by different masters in the same cycle
+//
+// Target t < NUM_TARGETS-1 is selected by (mem_addr & TARGET_MASKS[32*t+:32])
+// == TARGET_BASES[32*t+:32], the last target takes all other addresses,
+// e.g. the peripherals, its entries are not used. The masks may select
+// low address bits too, e.g. the banks of an interleaved memory. Every
+// target has its own arbiter (ALGORITHM, WEIGHTS), with SHARED a single
+// arbiter grants one master at a time as a plain shared bus would.
+//
+// The bus is that of leorv32: a strobe is held until done, done may
+// come in the same cycle, the read data of a target is valid from done
+// until the next access of the master.
+module crossbar #(
+    parameter int NUM_MASTERS = 2,
+    parameter int NUM_TARGETS = 3,
+    parameter logic [32*NUM_TARGETS-1:0] TARGET_BASES = '0,
+    parameter logic [32*NUM_TARGETS-1:0] TARGET_MASKS = '0,
+    parameter bit SHARED = 1'b0,
+    parameter ALGORITHM = "ROUNDROB",
+    parameter logic [4*NUM_MASTERS-1:0] WEIGHTS = {NUM_MASTERS{4'd1}}
+) (
+    input  logic clk,
+    input  logic reset,
+
+    // Masters
+    input  logic [32 * NUM_MASTERS - 1:0] master_addr,   // address
+    input  logic [32 * NUM_MASTERS - 1:0] master_wdata,  // write data
+    input  logic [ 4 * NUM_MASTERS - 1:0] master_wmask,  // write mask
+    input  logic [     NUM_MASTERS - 1:0] master_wstrb,  // write strobe
+    output logic [32 * NUM_MASTERS - 1:0] master_rdata,  // read data
+    input  logic [     NUM_MASTERS - 1:0] master_rstrb,  // read strobe
+    output logic [     NUM_MASTERS - 1:0] master_done,   // done
+    output logic [     NUM_MASTERS - 1:0] master_granted, // has the bus of its target
+
+    // Targets
+    output logic [32 * NUM_TARGETS - 1:0] target_addr,   // address
+    output logic [32 * NUM_TARGETS - 1:0] target_wdata,  // write data
+    output logic [ 4 * NUM_TARGETS - 1:0] target_wmask,  // write mask
+    output logic [     NUM_TARGETS - 1:0] target_wstrb,  // write strobe
+    input  logic [32 * NUM_TARGETS - 1:0] target_rdata,  // read data
+    output logic [     NUM_TARGETS - 1:0] target_rstrb,  // read strobe
+    input  logic [     NUM_TARGETS - 1:0] target_done,   // done
+    output logic [     NUM_TARGETS - 1:0] target_conflict // more than one master requests it
+);
+
+    localparam TARGET_BITS = NUM_TARGETS > 1 ? $clog2(NUM_TARGETS) : 1;
+
+    // Target of every master
+    logic [TARGET_BITS-1:0] master_target [NUM_MASTERS];
+    logic [NUM_MASTERS-1:0] master_request;
+
+    always_comb begin
+        for (int m=0; m<NUM_MASTERS; m++) begin
+            master_target[m] = TARGET_BITS'(NUM_TARGETS - 1);
+            for (int t=NUM_TARGETS-2; t>=0; t--) begin
+                if ((master_addr[32*m+:32] & TARGET_MASKS[32*t+:32]) == TARGET_BASES[32*t+:32]) begin
+                    master_target[m] = TARGET_BITS'(unsigned'(t));
+                end
+            end
+            master_request[m] = master_rstrb[m] || master_wstrb[m];
+        end
+    end
+
+    // Conflicts, more than one master requests the target and all but one wait
+    logic [NUM_TARGETS-1:0] target_requested;
+
+    always_comb begin
+        for (int t=0; t<NUM_TARGETS; t++) begin
+            target_requested[t] = 1'b0;
+            target_conflict[t]  = 1'b0;
+            for (int m=0; m<NUM_MASTERS; m++) begin
+                if (master_request[m] && master_target[m] == TARGET_BITS'(unsigned'(t))) begin
+                    target_conflict[t]  = target_conflict[t] || target_requested[t];
+                    target_requested[t] = 1'b1;
+                end
+            end
+        end
+    end
+
+    // Grants of every target, one-hot over the masters
+    logic [NUM_MASTERS-1:0] granted [NUM_TARGETS];
+
+    if (SHARED) begin : shared
+
+        logic [NUM_MASTERS-1:0] granted_signals;
+
+        arbiter #(
+            .NUM_PORTS  (NUM_MASTERS),
+            .ALGORITHM  (ALGORITHM),
+            .WEIGHTS    (WEIGHTS)
+        ) arbiter_inst (
+            .clk    (clk),
+            .reset  (reset),
+
+            .claim_signals   (master_request),
+            .granted_signals (granted_signals)
+        );
+
+        always_comb begin
+            for (int t=0; t<NUM_TARGETS; t++) begin
+                for (int m=0; m<NUM_MASTERS; m++) begin
+                    granted[t][m] = granted_signals[m] && master_target[m] == TARGET_BITS'(unsigned'(t));
+                end
+            end
+        end
+
+    end else begin : targets
+
+        for (genvar t=0; t<NUM_TARGETS; t++) begin : target
+
+            logic [NUM_MASTERS-1:0] claim_signals;
+
+            always_comb begin
+                for (int m=0; m<NUM_MASTERS; m++) begin
+                    claim_signals[m] = master_request[m] && master_target[m] == TARGET_BITS'(unsigned'(t));
+                end
+            end
+
+            arbiter #(
+                .NUM_PORTS  (NUM_MASTERS),
+                .ALGORITHM  (ALGORITHM),
+                .WEIGHTS    (WEIGHTS)
+            ) arbiter_inst (
+                .clk    (clk),
+                .reset  (reset),
+
+                .claim_signals   (claim_signals),
+                .granted_signals (granted[t])
+            );
+        end
+
+    end
+
+    // Bus of every target from its granted master
+    always_comb begin
+        target_addr  = '0;
+        target_wdata = '0;
+        target_wmask = '0;
+        target_wstrb = '0;
+        target_rstrb = '0;
+
+        for (int t=0; t<NUM_TARGETS; t++) begin
+            for (int m=0; m<NUM_MASTERS; m++) begin
+                if (granted[t][m]) begin
+                    target_addr [32*t+:32] = master_addr [32*m+:32];
+                    target_wdata[32*t+:32] = master_wdata[32*m+:32];
+                    target_wmask[ 4*t+: 4] = master_wmask[ 4*m+: 4];
+                    target_wstrb[t]        = master_wstrb[m];
+                    target_rstrb[t]        = master_rstrb[m];
+                end
+            end
+        end
+    end
+
+    // Target of the last granted access of every master, for the read data
+    logic [TARGET_BITS-1:0] rdata_target [NUM_MASTERS];
+
+    always_ff @(posedge clk, posedge reset) begin
+        if (reset) begin
+            for (int m=0; m<NUM_MASTERS; m++) begin
+                rdata_target[m] <= '0;
+            end
+        end else begin
+            for (int m=0; m<NUM_MASTERS; m++) begin
+                if (master_granted[m]) begin
+                    rdata_target[m] <= master_target[m];
+                end
+            end
+        end
+    end
+
+    always_comb begin
+        for (int m=0; m<NUM_MASTERS; m++) begin
+            master_granted[m] = 1'b0;
+            master_done[m]    = 1'b0;
+            for (int t=0; t<NUM_TARGETS; t++) begin
+                if (granted[t][m]) begin
+                    master_granted[m] = 1'b1;
+                    master_done[m]    = target_done[t];
+                end
+            end
+
+            // The target of this access when done, of the last one after
+            master_rdata[32*m+:32] = target_rdata[32*int'(rdata_target[m])+:32];
+            if (master_granted[m]) begin
+                master_rdata[32*m+:32] = target_rdata[32*int'(master_target[m])+:32];
+            end
+        end
+    end
+
+endmodule
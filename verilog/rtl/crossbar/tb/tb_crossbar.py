@@ -0,0 +1,363 @@
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import random
+from pathlib import Path
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.runner import get_runner
+from cocotb.triggers import Timer, FallingEdge
+
+# Build and test directory, the regression gives every job its own
+ENV_SIM_BUILD = os.getenv("SIM_BUILD", "sim_build")
+
+ENV_NUM_MASTERS = int(os.getenv("NUM_MASTERS", "2"))
+ENV_SHARED = int(os.getenv("SHARED", "0"))
+ENV_ALGORITHM = os.getenv("ALGORITHM", "ROUNDROB")
+ENV_WEIGHTS = os.getenv("WEIGHTS", None) # e.g. 3,1,1,1 for master 0, 1, ...
+
+# Variants run by ../../../dv/regression.py, name -> environment
+REGRESSION = {
+    "2": {},
+    "4": {"NUM_MASTERS": "4"},
+    "4-shared": {"NUM_MASTERS": "4", "SHARED": "1"},
+    "4-weighted": {"NUM_MASTERS": "4", "ALGORITHM": "WEIGHTED", "WEIGHTS": "3,1,1,1"},
+    "2-priority": {"ALGORITHM": "PRIORITY"},
+}
+
+ITERATIONS = 2000 # accesses per master
+
+# The targets of leosoc.sv: base, mask, cycles until done, writable
+WRAM0, WRAM1, FLASH, PERIPHERALS = range(4)
+TARGETS = [
+    (0x00000000, 0xFF000004, 0, True),  # WRAM bank 0, even words: done in the request cycle, data in the next
+    (0x00000004, 0xFF000004, 0, True),  # WRAM bank 1, odd words
+    (0x02000000, 0xFF000000, 3, False), # done after some cycles, data at done
+    (None, None, 0, True),              # all other addresses, like WRAM
+]
+TARGET_NAMES = ["wram0", "wram1", "flash", "peripherals"]
+TARGET_BASES = sum(base << (32 * index) for index, (base, _, _, _) in enumerate(TARGETS[:-1]))
+TARGET_MASKS = sum(mask << (32 * index) for index, (_, mask, _, _) in enumerate(TARGETS[:-1]))
+
+def weights():
+    values = [int(value) for value in ENV_WEIGHTS.split(",")] if ENV_WEIGHTS else []
+    return (values + [1] * ENV_NUM_MASTERS)[:ENV_NUM_MASTERS]
+
+def target_of(addr):
+    for index, (base, mask, _, _) in enumerate(TARGETS[:-1]):
+        if addr & mask == base:
+            return index
+    return len(TARGETS) - 1
+
+def initial_data(addr):
+    return (addr * 2654435761) & 0xFFFFFFFF
+
+def field(value, index, width=32):
+    return (value >> (width * index)) & ((1 << width) - 1)
+
+# Reset coroutine
+async def reset_dut(rst, duration_ns):
+    rst.value = 1
+    await Timer(duration_ns, units="ns")
+    rst.value = 0
+    rst._log.info("Reset complete")
+
+class Master:
+    """Accesses of leorv32: the strobe is held until done, the read data
+    is sampled in the cycle after, before the next access"""
+
+    def __init__(self, index, pick):
+        self.index = index
+        self.pick = pick        # target of the next access
+        self.state = "idle"
+        self.wait = 0
+        self.addr = 0
+        self.wdata = 0
+        self.wmask = 0
+        self.write = False
+        self.expected = None
+        self.start = 0
+        self.granted = None
+        self.accesses = 0
+        self.waiting = 0        # cycles claimed, but not granted
+        self.latencies = [[] for _ in TARGETS]
+
+    def next_access(self, cycle):
+        target = self.pick(self.index)
+        base, mask = TARGETS[target][:2]
+        if base is None:
+            # Any region of the peripherals, also unmapped ones
+            base = random.choice([r for r in range(0x03, 0x10) if target_of(r << 24) == target]) << 24
+            mask = 0xFF000000
+        self.addr = base | (random.randint(0, 15) << 2) & ~mask
+        self.write = TARGETS[target][3] and random.random() < 0.3
+        self.wdata = random.randint(0, 2**32-1) if self.write else 0
+        self.wmask = random.randint(1, 15) if self.write else 0
+        self.start = cycle
+        self.granted = None
+        self.state = "request"
+
+class Targets:
+    """The targets, a word memory each, read data as in leosoc.sv"""
+
+    def __init__(self):
+        self.memory = {}
+        self.count = [0] * len(TARGETS)
+        self.rdata = [0] * len(TARGETS)
+        self.rdata_next = [0] * len(TARGETS)
+
+    def read(self, addr):
+        return self.memory.get(addr, initial_data(addr))
+
+    def write(self, addr, wdata, wmask):
+        mask = sum(0xFF << (8 * lane) for lane in range(4) if wmask >> lane & 1)
+        self.memory[addr] = (self.read(addr) & ~mask) | (wdata & mask)
+
+def set_masters(dut, masters):
+    addr = wdata = wmask = wstrb = rstrb = 0
+    for master in masters:
+        if master.state == "request":
+            addr  |= master.addr  << (32 * master.index)
+            wdata |= master.wdata << (32 * master.index)
+            wmask |= master.wmask << (4 * master.index)
+            wstrb |= master.write << master.index
+            rstrb |= (not master.write) << master.index
+    dut.master_addr.value = addr
+    dut.master_wdata.value = wdata
+    dut.master_wmask.value = wmask
+    dut.master_wstrb.value = wstrb
+    dut.master_rstrb.value = rstrb
+
+async def run(dut, pick, name):
+    """Every master makes ITERATIONS accesses to the targets of pick(),
+    checks the data and records the latency of the grants"""
+
+    c = Clock(dut.clk, 25, 'ns')
+    await cocotb.start(c.start())
+
+    dut.master_addr.value = 0
+    dut.master_wdata.value = 0
+    dut.master_wmask.value = 0
+    dut.master_wstrb.value = 0
+    dut.master_rstrb.value = 0
+    dut.target_rdata.value = 0
+    dut.target_done.value = 0
+
+    await reset_dut(dut.reset, 50)
+
+    masters = [Master(index, pick) for index in range(ENV_NUM_MASTERS)]
+    targets = Targets()
+    reference = Targets()   # memory as the masters see it
+    cycle = 0
+    last_done = 0
+
+    while any(master.accesses < ITERATIONS or master.state != "idle" for master in masters):
+        await FallingEdge(dut.clk)
+        cycle += 1
+        assert cycle < ITERATIONS * ENV_NUM_MASTERS * 20, "the masters hang"
+
+        # Read data registered by WRAM and the peripherals
+        for target in range(len(TARGETS)):
+            if TARGETS[target][2] == 0:
+                targets.rdata[target] = targets.rdata_next[target]
+        dut.target_rdata.value = sum(value << (32 * target) for target, value in enumerate(targets.rdata))
+        await Timer(1, units="ns")
+
+        # Read data of the last access
+        rdata = dut.master_rdata.value.integer
+        for master in masters:
+            if master.state == "gap":
+                if master.expected is not None:
+                    assert field(rdata, master.index) == master.expected, \
+                        f"master {master.index} read 0x{field(rdata, master.index):08X} from 0x{master.addr:08X}, " \
+                        f"expected 0x{master.expected:08X}"
+                master.state = "idle"
+                master.wait = random.randint(0, 2)
+                continue
+
+            if master.state == "idle" and master.accesses < ITERATIONS:
+                if master.wait == 0:
+                    master.next_access(cycle)
+                else:
+                    master.wait -= 1
+
+        set_masters(dut, masters)
+        await Timer(1, units="ns")
+
+        # Targets, the bus of each is driven by its granted master
+        granted = dut.master_granted.value.integer
+        target_addr = dut.target_addr.value.integer
+        target_wdata = dut.target_wdata.value.integer
+        target_wmask = dut.target_wmask.value.integer
+        target_wstrb = dut.target_wstrb.value.integer
+        target_rstrb = dut.target_rstrb.value.integer
+        target_conflict = dut.target_conflict.value.integer
+
+        owners = [[master for master in masters if master.state == "request" and granted >> master.index & 1
+                   and target_of(master.addr) == target] for target in range(len(TARGETS))]
+
+        done = 0
+        for target, (_, _, latency, _) in enumerate(TARGETS):
+            assert len(owners[target]) <= 1, f"target {target} granted to {len(owners[target])} masters"
+            requests = [master for master in masters if master.state == "request" and target_of(master.addr) == target]
+            assert (target_conflict >> target & 1) == (len(requests) > 1), \
+                f"target {target} conflict {target_conflict >> target & 1} with {len(requests)} requests"
+            if ENV_SHARED:
+                assert sum(len(owner) for owner in owners) <= 1, "shared bus granted to several masters"
+
+            addr = field(target_addr, target)
+            strobe = (target_wstrb | target_rstrb) >> target & 1
+            if owners[target]:
+                assert strobe and addr == owners[target][0].addr, f"target {target} does not see its master"
+            else:
+                assert not strobe, f"target {target} is accessed without a grant"
+
+            targets.rdata_next[target] = 0
+            if strobe:
+                if targets.count[target] == latency:
+                    targets.count[target] = 0
+                    done |= 1 << target
+                    if target_wstrb >> target & 1:
+                        targets.write(addr, field(target_wdata, target), field(target_wmask, target, 4))
+                    elif latency:
+                        targets.rdata[target] = targets.read(addr)
+                    else:
+                        targets.rdata_next[target] = targets.read(addr)
+                else:
+                    targets.count[target] += 1
+
+        dut.target_done.value = done
+        dut.target_rdata.value = sum(value << (32 * target) for target, value in enumerate(targets.rdata))
+        await Timer(1, units="ns")
+
+        # Done in this cycle, the transfer happens at the next edge
+        master_done = dut.master_done.value.integer
+        for master in masters:
+            if master.state != "request":
+                continue
+            if granted >> master.index & 1:
+                if master.granted is None:
+                    master.granted = cycle
+                    master.latencies[target_of(master.addr)].append(cycle - master.start)
+            else:
+                master.waiting += 1
+                assert not master_done >> master.index & 1, f"master {master.index} done without a grant"
+
+            if master_done >> master.index & 1:
+                if master.write:
+                    reference.write(master.addr, master.wdata, master.wmask)
+                    master.expected = None
+                else:
+                    master.expected = reference.read(master.addr)
+                master.accesses += 1
+                master.state = "gap"
+                last_done = cycle
+
+    # Report
+    accesses = sum(master.accesses for master in masters)
+    interconnect = "shared bus" if ENV_SHARED else "crossbar"
+    dut._log.info(f"{name}: {ENV_NUM_MASTERS} masters, {interconnect}, {ENV_ALGORITHM}")
+    dut._log.info(f"  throughput {accesses / last_done:.3f} accesses per cycle ({accesses} in {last_done} cycles)")
+    worst = {}
+    for target, target_name in enumerate(TARGET_NAMES):
+        latencies = [latency for master in masters for latency in master.latencies[target]]
+        if latencies:
+            worst[target] = [max(master.latencies[target], default=0) for master in masters]
+            dut._log.info(f"  {target_name:<12} grant latency mean {sum(latencies) / len(latencies):5.2f}, "
+                          f"worst {max(latencies):3} cycles, per master {worst[target]}")
+    for master in masters:
+        latencies = [latency for target in master.latencies for latency in target]
+        dut._log.info(f"  master {master.index}: waited {master.waiting} cycles for the grant, "
+                      f"{sum(latencies) / len(latencies):.2f} per access")
+
+    # Round robin: a waiting master is granted after at most one access
+    # of every other master. WEIGHTED: every grant on the credit of the
+    # others can start the round robin of the rest again.
+    if ENV_ALGORITHM != "PRIORITY":
+        for target, per_master in worst.items():
+            # With a shared bus any target can be ahead, the slowest bounds it
+            access = max(latency for _, _, latency, _ in TARGETS) + 1 if ENV_SHARED else TARGETS[target][2] + 1
+            for master in masters:
+                others = ENV_NUM_MASTERS - 1
+                if ENV_ALGORITHM == "WEIGHTED":
+                    credit = sum(weight for index, weight in enumerate(weights()) if index != master.index)
+                    others = credit + (credit + 1) * others
+                bound = others * access
+                assert per_master[master.index] <= bound, \
+                    f"master {master.index} waited {per_master[master.index]} cycles for target {target}, bound {bound}"
+
+    # WEIGHTED: the master with the highest weight waits the least for
+    # the flash while all want it
+    if ENV_ALGORITHM == "WEIGHTED" and name == "contention" and weights().count(max(weights())) == 1:
+        mean = [sum(master.latencies[FLASH]) / len(master.latencies[FLASH]) for master in masters]
+        first = max(range(ENV_NUM_MASTERS), key=lambda index: weights()[index])
+        assert all(mean[first] < latency for index, latency in enumerate(mean) if index != first), \
+            f"the highest weight does not wait the least: {[round(latency, 2) for latency in mean]}"
+
+@cocotb.test()
+async def random_test(dut):
+    """All masters access all targets at random"""
+
+    await run(dut, lambda index: random.choices([WRAM0, WRAM1, FLASH, PERIPHERALS], [3, 3, 3, 2])[0], "random")
+
+@cocotb.test()
+async def contention_test(dut):
+    """All masters read the flash, the worst case of the grant latency"""
+
+    await run(dut, lambda index: FLASH, "contention")
+
+@cocotb.test()
+async def parallel_test(dut):
+    """Every master has a target of its own, a crossbar serves all at once"""
+
+    await run(dut, lambda index: index % len(TARGETS), "parallel")
+
+@cocotb.test()
+async def banks_test(dut):
+    """All masters load and store in the banks of the WRAM, a crossbar
+    serves different banks at once"""
+
+    await run(dut, lambda index: random.choice([WRAM0, WRAM1]), "banks")
+
+def test_runner(num_masters=ENV_NUM_MASTERS, shared=ENV_SHARED, algorithm=ENV_ALGORITHM, build_dir=ENV_SIM_BUILD):
+
+    sim = "verilator"
+    proj_path = Path(__file__).resolve().parent
+
+    verilog_sources = [
+        proj_path / "../../arbiter/rtl/arbiter.sv",
+        proj_path / "../rtl/crossbar.sv"
+    ]
+    defines = []
+    hdl_toplevel = "crossbar"
+    build_args=["--trace-fst", "--trace-structs"]
+
+    # Weights in 4 bit, master 0 in the lowest
+    packed_weights = sum(weight << (4 * index) for index, weight in enumerate(weights()))
+
+    runner = get_runner(sim)
+
+    runner.build(
+        verilog_sources=verilog_sources,
+        defines=defines,
+        build_args=build_args,
+        hdl_toplevel=hdl_toplevel,
+        parameters={"NUM_MASTERS": num_masters, "NUM_TARGETS": len(TARGETS),
+                    "TARGET_BASES": TARGET_BASES, "TARGET_MASKS": TARGET_MASKS,
+                    "SHARED": shared, "ALGORITHM": f'"{algorithm}"', "WEIGHTS": packed_weights},
+        build_dir=build_dir,
+        always=True,
+    )
+
+    return runner.test(
+        hdl_toplevel=hdl_toplevel,
+        test_module="tb_crossbar,",
+        build_dir=build_dir,
+        extra_env={"NUM_MASTERS": str(num_masters), "SHARED": str(shared), "ALGORITHM": algorithm,
+                   **({"WEIGHTS": ENV_WEIGHTS} if ENV_WEIGHTS else {})}
+    )
+
+if __name__ == "__main__":
+    test_runner()
@@ -629,6 +629,11 @@ module leorv32 #(
         endcase
     end
     
+    // The instruction retires in this cycle, PC and cur_instr
+    // still belong to it, see pc_sampler.sv of the testbench
+    logic retire;
+    assign retire = cur_state == ST_WRITEBACK;
+
     // TODO set control signals
     always_ff @(posedge clk, posedge reset) begin
         if (reset) begin
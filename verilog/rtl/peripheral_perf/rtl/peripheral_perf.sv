@@ -0,0 +1,157 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Performance counters of the SoC, one 32 bit counter per event,
+// counting every cycle in which the event is set, wrapping around
+module peripheral_perf #(
+    parameter ADDRESS_BASE = 32'hFF000000,
+    parameter NUM_HARTS    = 2
+) (
+    input  logic         clk_i,
+    input  logic         rst_ni,
+    input  logic [31: 0] mem_addr,
+    input  logic [31: 0] mem_wdata,
+    input  logic [ 3: 0] mem_wmask,
+    input  logic         mem_wstrb,
+    output logic [31: 0] mem_rdata,
+    input  logic         mem_rstrb,
+    output logic         mem_done,
+    output logic         select,
+
+    // Events of the harts
+    input  logic [NUM_HARTS-1:0] icache_hit,      // pulse, lookup hit
+    input  logic [NUM_HARTS-1:0] icache_miss,     // pulse, lookup missed
+    input  logic [NUM_HARTS-1:0] fetch_stall,     // waiting for the instruction
+    input  logic [NUM_HARTS-1:0] execute_stall,   // waiting for a load or store
+    input  logic [NUM_HARTS-1:0] grant_wait,      // claimed, but not granted
+
+    // Events of the SoC
+    input  logic         flash_read,     // pulse, word read from the flash
+    input  logic         flash_busy,     // waiting for the flash
+    input  logic         wram_conflict,  // more than one hart requests a bank of the WRAM
+    input  logic         uart0_tx,       // pulse, byte sent
+    input  logic         uart1_tx        // pulse, byte sent
+);
+    localparam ADDRESS_LENGTH = 32'h00000100; // Multiple of 2
+    localparam ADDRESS_MASK_UPPER = ~(ADDRESS_LENGTH - 1);
+    localparam ADDRESS_MASK_LOWER =  (ADDRESS_LENGTH - 1);
+
+    assign select = (mem_addr & ADDRESS_MASK_UPPER) == ADDRESS_BASE;
+
+    logic [31:0] address;
+    assign address = mem_addr & ADDRESS_MASK_LOWER;
+
+    localparam SOC_COUNTERS  = 6;
+    localparam HART_COUNTERS = 5;
+    localparam NUM_COUNTERS  = SOC_COUNTERS + HART_COUNTERS * NUM_HARTS;
+
+    /*
+        Register Map
+
+        0x00: control  |snapshot|clear|freeze|
+                       freeze:   1 = the counters stop
+                       clear:    write 1 = set all counters to 0
+                       snapshot: write 1 = copy all counters to the snapshot,
+                                 before a clear in the same write
+        0x04: info     |counters per hart|counters of the SoC|harts| 8 bit each
+        0x10: snapshot of counter 0, ...
+
+        Counters of the SoC
+
+        0: cycles
+        1: words read from the flash
+        2: cycles waiting for the flash
+        3: bytes sent by UART0
+        4: bytes sent by UART1
+        5: cycles with a conflict for a bank of the WRAM
+
+        Counters of hart h from 6 + 5 * h on
+
+        0: instruction cache hits
+        1: instruction cache misses
+        2: cycles stalled in fetch
+        3: cycles stalled in execute (load/store)
+        4: cycles waiting for the grant of the arbiter
+    */
+
+    logic freeze;
+    logic [31:0] counters [NUM_COUNTERS];
+    logic [31:0] snapshot [NUM_COUNTERS];
+
+    logic [NUM_COUNTERS-1:0] events;
+
+    always_comb begin
+        events[0] = 1'b1;
+        events[1] = flash_read;
+        events[2] = flash_busy;
+        events[3] = uart0_tx;
+        events[4] = uart1_tx;
+        events[5] = wram_conflict;
+        for (int hart=0; hart<NUM_HARTS; hart++) begin
+            events[SOC_COUNTERS + HART_COUNTERS * hart + 0] = icache_hit[hart];
+            events[SOC_COUNTERS + HART_COUNTERS * hart + 1] = icache_miss[hart];
+            events[SOC_COUNTERS + HART_COUNTERS * hart + 2] = fetch_stall[hart];
+            events[SOC_COUNTERS + HART_COUNTERS * hart + 3] = execute_stall[hart];
+            events[SOC_COUNTERS + HART_COUNTERS * hart + 4] = grant_wait[hart];
+        end
+    end
+
+    logic control_write;
+    assign control_write = select && mem_wstrb && address == 32'h00 && mem_wmask[0];
+
+    logic [7:0] counter_index;
+    assign counter_index = 8'((address - 32'h10) >> 2);
+
+    // Read logic
+    always_ff @(posedge clk_i) begin
+        mem_rdata <= '0;
+        if (select && mem_rstrb) begin
+            case (address)
+                32'h00: mem_rdata <= {{31{1'b0}}, freeze};
+                32'h04: mem_rdata <= {8'b0, 8'(HART_COUNTERS), 8'(SOC_COUNTERS), 8'(NUM_HARTS)};
+                32'h08: ;
+                32'h0C: ;
+                default: if (counter_index < 8'(NUM_COUNTERS)) mem_rdata <= snapshot[counter_index];
+            endcase
+        end
+    end
+
+    // Write logic
+    always_ff @(posedge clk_i, negedge rst_ni) begin
+        if (!rst_ni) begin
+            freeze <= 1'b0;
+        end else begin
+            if (control_write) begin
+                freeze <= mem_wdata[0];
+            end
+        end
+    end
+
+    // Counters
+    always_ff @(posedge clk_i, negedge rst_ni) begin
+        if (!rst_ni) begin
+            for (int i=0; i<NUM_COUNTERS; i++) begin
+                counters[i] <= '0;
+                snapshot[i] <= '0;
+            end
+        end else begin
+            for (int i=0; i<NUM_COUNTERS; i++) begin
+                if (control_write && mem_wdata[1]) begin
+                    counters[i] <= '0;
+                end else if (!freeze && events[i]) begin
+                    counters[i] <= counters[i] + 1;
+                end
+
+                if (control_write && mem_wdata[2]) begin
+                    snapshot[i] <= counters[i];
+                end
+            end
+        end
+    end
+
+    assign mem_done = select && (mem_rstrb || mem_wstrb);
+
+endmodule
@@ -9,58 +9,79 @@ module core_wrapper #(
     parameter int RESET_ADDR = 32'h00000000,
     parameter int ADDR_WIDTH = 32,
     parameter int INSTR_CACHE = 1,
-    parameter int INSTR_CACHE_SIZE = 32
+    parameter int INSTR_CACHE_SIZE = 32,        // lines
+    parameter int INSTR_CACHE_LINE_WORDS = 1,
+    parameter int INSTR_CACHE_WAYS = 1,
+    parameter INTERCONNECT = "CROSSBAR",        // or SHARED, see crossbar.sv
+    parameter int NUM_TARGETS = 1,
+    parameter logic [32*NUM_TARGETS-1:0] TARGET_BASES = '0,
+    parameter logic [32*NUM_TARGETS-1:0] TARGET_MASKS = '0,
+    parameter ARBITER = "ROUNDROB",             // PRIORITY, ROUNDROB or WEIGHTED
+    parameter logic [4*NUM_CORES-1:0] ARBITER_WEIGHTS = {NUM_CORES{4'd1}}
 ) (
     input  logic clk,
     input  logic reset,
 
-    output logic [31:0] mem_addr,   // address
-    output logic [31:0] mem_wdata,  // write data
-    output logic [ 3:0] mem_wmask,  // write mask
-    output logic        mem_wstrb,  // write strobe
-    input  logic [31:0] mem_rdata,  // read data
-    output logic        mem_rstrb,  // read strobe
-    input  logic        mem_done    // done
+    // Bus of every target
+    output logic [32 * NUM_TARGETS - 1:0] mem_addr,   // address
+    output logic [32 * NUM_TARGETS - 1:0] mem_wdata,  // write data
+    output logic [ 4 * NUM_TARGETS - 1:0] mem_wmask,  // write mask
+    output logic [     NUM_TARGETS - 1:0] mem_wstrb,  // write strobe
+    input  logic [32 * NUM_TARGETS - 1:0] mem_rdata,  // read data
+    output logic [     NUM_TARGETS - 1:0] mem_rstrb,  // read strobe
+    input  logic [     NUM_TARGETS - 1:0] mem_done,   // done
+    output logic [     NUM_TARGETS - 1:0] mem_conflict, // more than one core requests the target
+
+    // Events of each core for the performance counters
+    output logic [NUM_CORES-1:0] icache_hit,     // pulse, lookup hit
+    output logic [NUM_CORES-1:0] icache_miss,    // pulse, lookup missed
+    output logic [NUM_CORES-1:0] fetch_stall,    // waiting for the instruction
+    output logic [NUM_CORES-1:0] execute_stall,  // waiting for a load or store
+    output logic [NUM_CORES-1:0] grant_wait      // claimed, but not granted
 );
 
     logic [NUM_CORES-1:0] claim_signals;
     logic [NUM_CORES-1:0] granted_signals;
 
-    arbiter  #(
-        .NUM_PORTS(NUM_CORES)
-    ) arbiter_inst (
-        .clk    (clk),
-        .reset  (reset),
-
-        .claim_signals   (claim_signals),
-        .granted_signals (granted_signals)
-    );
-    
-    
     // Memory interface all cores
     logic [32 * NUM_CORES - 1:0] mem_addr_all_cores;   // address
     logic [32 * NUM_CORES - 1:0] mem_wdata_all_cores;  // write data
     logic [ 4 * NUM_CORES - 1:0] mem_wmask_all_cores;  // write mask
     logic [     NUM_CORES - 1:0] mem_wstrb_all_cores;  // write strobe
+    logic [32 * NUM_CORES - 1:0] mem_rdata_all_cores;  // read data
     logic [     NUM_CORES - 1:0] mem_rstrb_all_cores;  // read strobe
-    
-    always_comb begin
-        mem_addr  = '0;
-        mem_rstrb = '0;
-        mem_wdata = '0;
-        mem_wmask = '0;
-        mem_wstrb = '0;
-    
-        for (int i=0; i<NUM_CORES; i++) begin
-            if (granted_signals[i]) begin
-                mem_addr  = mem_addr_all_cores[32*i+:32];
-                mem_rstrb = mem_rstrb_all_cores[i];
-                mem_wdata = mem_wdata_all_cores[32*i+:32];
-                mem_wmask = mem_wmask_all_cores[4*i+:4];
-                mem_wstrb = mem_wstrb_all_cores[i];
-            end
-        end
-    end
+    logic [     NUM_CORES - 1:0] mem_done_all_cores;   // done
+
+    crossbar #(
+        .NUM_MASTERS    (NUM_CORES),
+        .NUM_TARGETS    (NUM_TARGETS),
+        .TARGET_BASES   (TARGET_BASES),
+        .TARGET_MASKS   (TARGET_MASKS),
+        .SHARED         (INTERCONNECT == "SHARED"),
+        .ALGORITHM      (ARBITER),
+        .WEIGHTS        (ARBITER_WEIGHTS)
+    ) crossbar_inst (
+        .clk    (clk),
+        .reset  (reset),
+
+        .master_addr    (mem_addr_all_cores),
+        .master_wdata   (mem_wdata_all_cores),
+        .master_wmask   (mem_wmask_all_cores),
+        .master_wstrb   (mem_wstrb_all_cores),
+        .master_rdata   (mem_rdata_all_cores),
+        .master_rstrb   (mem_rstrb_all_cores),
+        .master_done    (mem_done_all_cores),
+        .master_granted (granted_signals),
+
+        .target_addr    (mem_addr),
+        .target_wdata   (mem_wdata),
+        .target_wmask   (mem_wmask),
+        .target_wstrb   (mem_wstrb),
+        .target_rdata   (mem_rdata),
+        .target_rstrb   (mem_rstrb),
+        .target_done    (mem_done),
+        .target_conflict(mem_conflict)
+    );
     
     genvar gen_core;
     
@@ -74,6 +95,8 @@ module core_wrapper #(
         logic [ 3:0] mem_wmask_gen_core;  // write mask
         logic        mem_wstrb_gen_core;  // write strobe
         logic        mem_rstrb_gen_core;  // read strobe
+        logic [31:0] mem_rdata_gen_core;  // read data
+        logic        mem_done_gen_core;   // done
 
         // Instruction Port
         logic [31: 0] instr_addr_gen_core;   // address
@@ -92,10 +115,12 @@ module core_wrapper #(
 
         // Merge instruction and data bus to memory bus
         
-        if (INSTR_CACHE) begin
+        if (INSTR_CACHE) begin : icache
 
             direct_mapped_cache #(
                 .CACHE_ENTRIES(INSTR_CACHE_SIZE),
+                .LINE_WORDS(INSTR_CACHE_LINE_WORDS),
+                .WAYS(INSTR_CACHE_WAYS),
                 .ADDR_WIDTH(32)
             ) direct_mapped_cache_i (
                 .clk_i      (clk),
@@ -109,9 +134,13 @@ module core_wrapper #(
                 
                 // Connected to memory
                 .mem_addr       (cache2mem_addr),
-                .mem_rdata      (mem_rdata),
+                .mem_rdata      (mem_rdata_gen_core),
                 .mem_rstrb      (cache2mem_rstrb),
-                .mem_done       (mem_done && granted_signals[gen_core])
+                .mem_done       (mem_done_gen_core),
+
+                // Performance counters
+                .lookup_hit     (icache_hit[gen_core]),
+                .lookup_miss    (icache_miss[gen_core])
             );
             
             logic [31: 0] cache2mem_addr;
@@ -123,7 +152,7 @@ module core_wrapper #(
                               '0;
             assign mem_rstrb_gen_core = cache2mem_rstrb || data_rstrb_gen_core;
 
-        end else begin
+        end else begin : no_icache
         
             // Shared lines
             assign mem_addr_gen_core = instr_fetch_gen_core ? instr_addr_gen_core :
@@ -132,8 +161,12 @@ module core_wrapper #(
             assign mem_rstrb_gen_core = instr_fetch_gen_core || data_rstrb_gen_core;
         
             // Fetch
-            assign instr_rdata_gen_core = mem_rdata;
-            assign instr_done_gen_core = mem_done && granted_signals[gen_core];
+            assign instr_rdata_gen_core = mem_rdata_gen_core;
+            assign instr_done_gen_core = mem_done_gen_core;
+
+            // Every fetch goes to memory
+            assign icache_hit[gen_core]  = 1'b0;
+            assign icache_miss[gen_core] = instr_fetch_gen_core && instr_done_gen_core;
         
         end
         
@@ -141,8 +174,8 @@ module core_wrapper #(
         assign mem_wdata_gen_core = data_wdata_gen_core;
         assign mem_wmask_gen_core = data_wmask_gen_core;
         assign mem_wstrb_gen_core = data_wstrb_gen_core;
-        assign data_rdata_gen_core = mem_rdata;
-        assign data_done_gen_core = mem_done && granted_signals[gen_core];
+        assign data_rdata_gen_core = mem_rdata_gen_core;
+        assign data_done_gen_core = mem_done_gen_core;
         
         // ====================================================================================================================
         
@@ -152,6 +185,8 @@ module core_wrapper #(
         assign mem_wdata_all_cores[(32 * (gen_core+1)) - 1: 32 * gen_core] = mem_wdata_gen_core;
         assign mem_wmask_all_cores[(4  * (gen_core+1)) - 1: 4 *  gen_core] = mem_wmask_gen_core;
         assign mem_wstrb_all_cores[gen_core] = mem_wstrb_gen_core;
+        assign mem_rdata_gen_core = mem_rdata_all_cores[32*gen_core+:32];
+        assign mem_done_gen_core = mem_done_all_cores[gen_core];
         
         leorv32 #(
             .RESET_ADDR(RESET_ADDR),
@@ -180,6 +215,11 @@ module core_wrapper #(
         );
 
         assign claim_signals[gen_core] = mem_rstrb_gen_core || mem_wstrb_gen_core;
+
+        // The strobes are only set in ST_FETCH and ST_EXECUTE of leorv32
+        assign fetch_stall[gen_core]   = instr_fetch_gen_core && !instr_done_gen_core;
+        assign execute_stall[gen_core] = (data_rstrb_gen_core || data_wstrb_gen_core) && !data_done_gen_core;
+        assign grant_wait[gen_core]    = claim_signals[gen_core] && !granted_signals[gen_core];
     end
     
     endgenerate
@@ -9,7 +9,22 @@ module leosoc #(
     parameter int BAUDRATE  = 9600,
     parameter int NUM_CORES = 2,
     parameter int INSTR_CACHE = 1,
-    parameter int INSTR_CACHE_SIZE = 32
+    parameter int INSTR_CACHE_SIZE = 32,
+    parameter int INSTR_CACHE_LINE_WORDS = 1,
+    parameter int INSTR_CACHE_WAYS = 1,
+    parameter SPI_FLASH_READ_MODE = "SINGLE",
+    parameter int SPI_FLASH_DUMMY_CYCLES = 8,
+    parameter bit SPI_FLASH_CONTINUOUS_READ = 1'b1,
+    parameter bit PERF_COUNTERS = 1'b0,     // peripheral_perf at PERF0_BASE_ADDRESS
+`ifdef WRAM_BANKED
+    parameter int WRAM_BANKS = 2,           // power of 2, see wram_banked.sv
+`else
+    parameter int WRAM_BANKS = 1,           // more than one needs WRAM_BANKED
+`endif
+    parameter int WRAM_INTERLEAVE = 1,      // words, power of 2
+    parameter INTERCONNECT = "CROSSBAR",    // or SHARED, see crossbar.sv
+    parameter ARBITER = "ROUNDROB",         // PRIORITY, ROUNDROB or WEIGHTED
+    parameter logic [4*NUM_CORES-1:0] ARBITER_WEIGHTS = {NUM_CORES{4'd1}}
 ) (
 `ifdef USE_POWER_PINS
     inout vdd,
@@ -32,32 +47,84 @@ module leosoc #(
     
     // SPI signals
     output sck,
+`ifdef SPI_FLASH_MULTI_IO
+    // Bidirectional io0 and io1 for the dual and quad reads, io2 and io3
+    // of the flash are on gpio0[23:22] in the quad modes
+    output cs,
+    output [1:0] flash_io_out,
+    output [1:0] flash_io_oe,
+    input  [1:0] flash_io_in
+`else
+    // The ports of the taped-out leosoc, SINGLE reads only
     output sdo,
     input  sdi,
     output cs
+`endif
 );
 
     // Configuration
 
     localparam SOC_ADDRW = 32;
 
-    localparam NUM_WMASKS = 4;
     localparam DATA_WIDTH = 32;
     localparam WRAM_ADDR_WIDTH = 10;
 
     localparam WRAM_MASK        = 8'h00;
     localparam SPI_FLASH_MASK   = 8'h02;
+    localparam SPI_FLASH_CONFIG_MASK = 8'h08;
     localparam BLINK_MASK       = 8'h0F;
     
     localparam UART0_BASE_ADDRESS = 32'h03000000;
     localparam UART1_BASE_ADDRESS = 32'h04000000;
     localparam GPIO0_BASE_ADDRESS = 32'h05000000;
     localparam TRNG0_BASE_ADDRESS = 32'h06000000;
+    localparam PERF0_BASE_ADDRESS = 32'h07000000;
+
+    // Targets of the crossbar: the banks of the WRAM, the flash and
+    // the peripherals, which take all other addresses
+    localparam NUM_TARGETS          = WRAM_BANKS + 2;
+    localparam TARGET_WRAM          = 0; // first bank
+    localparam TARGET_SPI_FLASH     = WRAM_BANKS;
+    localparam TARGET_PERIPHERALS   = WRAM_BANKS + 1;
+
+    // Bank bits of a WRAM address, see wram_banked.sv
+    localparam WRAM_BANK_SHIFT = 2 + $clog2(WRAM_INTERLEAVE);
+    localparam logic [31:0] WRAM_BANK_MASK = (WRAM_BANKS - 1) << WRAM_BANK_SHIFT;
+
+    function automatic logic [32*NUM_TARGETS-1:0] target_bases();
+        target_bases = '0;
+        for (int bank=0; bank<WRAM_BANKS; bank++) begin
+            target_bases[32*(TARGET_WRAM+bank)+:32] = {WRAM_MASK, 24'h0} | (bank << WRAM_BANK_SHIFT);
+        end
+        target_bases[32*TARGET_SPI_FLASH+:32] = {SPI_FLASH_MASK, 24'h0};
+    endfunction
+
+    function automatic logic [32*NUM_TARGETS-1:0] target_masks();
+        target_masks = '0;
+        for (int bank=0; bank<WRAM_BANKS; bank++) begin
+            target_masks[32*(TARGET_WRAM+bank)+:32] = 32'hFF000000 | WRAM_BANK_MASK;
+        end
+        target_masks[32*TARGET_SPI_FLASH+:32] = 32'hFF000000;
+    endfunction
+
+    localparam logic [32*NUM_TARGETS-1:0] TARGET_BASES = target_bases();
+    localparam logic [32*NUM_TARGETS-1:0] TARGET_MASKS = target_masks();
 
     // ----------------------------------
     //           LeoRV32 Core
     // ----------------------------------
 
+    // Bus of every target
+    logic [32 * NUM_TARGETS - 1:0] bus_addr;
+    logic [32 * NUM_TARGETS - 1:0] bus_wdata;
+    logic [ 4 * NUM_TARGETS - 1:0] bus_wmask;
+    logic [     NUM_TARGETS - 1:0] bus_wstrb;
+    logic [32 * NUM_TARGETS - 1:0] bus_rdata;
+    logic [     NUM_TARGETS - 1:0] bus_rstrb;
+    logic [     NUM_TARGETS - 1:0] bus_done;
+    logic [     NUM_TARGETS - 1:0] bus_conflict;
+
+    // Bus of the peripherals
     logic [31: 0] mem_addr;
     logic [31: 0] mem_wdata;
     logic [ 3: 0] mem_wmask;
@@ -65,61 +132,120 @@ module leosoc #(
     logic [31: 0] mem_rdata;
     logic         mem_rstrb;
     logic         mem_done;
-    
-    // Peripherals have no latency (except SPI Flash)
-    assign mem_done = soc_spi_flash_sel ? spi_flash_done && mem_rstrb : mem_rstrb || mem_wstrb;
+
+    assign mem_addr  = bus_addr [32*TARGET_PERIPHERALS+:32];
+    assign mem_wdata = bus_wdata[32*TARGET_PERIPHERALS+:32];
+    assign mem_wmask = bus_wmask[ 4*TARGET_PERIPHERALS+: 4];
+    assign mem_wstrb = bus_wstrb[TARGET_PERIPHERALS];
+    assign mem_rstrb = bus_rstrb[TARGET_PERIPHERALS];
+    assign bus_rdata[32*TARGET_PERIPHERALS+:32] = mem_rdata;
+    assign bus_done[TARGET_PERIPHERALS] = mem_done;
+
+    // Peripherals have no latency
+    assign mem_done = mem_rstrb || mem_wstrb;
+
+    // Bus of the SPI Flash, writes are never done
+    logic [31: 0] flash_bus_addr;
+    logic         flash_bus_rstrb;
+
+    assign flash_bus_addr  = bus_addr [32*TARGET_SPI_FLASH+:32];
+    assign flash_bus_rstrb = bus_rstrb[TARGET_SPI_FLASH];
+    assign bus_rdata[32*TARGET_SPI_FLASH+:32] = spi_flash_rdata;
+    assign bus_done[TARGET_SPI_FLASH] = spi_flash_done && flash_bus_rstrb;
 
     core_wrapper #(
         .NUM_CORES          (NUM_CORES),
         .RESET_ADDR         (32'h02000000 + 32'h00200000),
         .ADDR_WIDTH         (SOC_ADDRW),
         .INSTR_CACHE        (INSTR_CACHE),
-        .INSTR_CACHE_SIZE   (INSTR_CACHE_SIZE)
+        .INSTR_CACHE_SIZE   (INSTR_CACHE_SIZE),
+        .INSTR_CACHE_LINE_WORDS (INSTR_CACHE_LINE_WORDS),
+        .INSTR_CACHE_WAYS   (INSTR_CACHE_WAYS),
+        .INTERCONNECT       (INTERCONNECT),
+        .NUM_TARGETS        (NUM_TARGETS),
+        .TARGET_BASES       (TARGET_BASES),
+        .TARGET_MASKS       (TARGET_MASKS),
+        .ARBITER            (ARBITER),
+        .ARBITER_WEIGHTS    (ARBITER_WEIGHTS)
     ) core_wrapper (
         .clk    (clk),
         .reset  (reset),
         
-        .mem_addr (mem_addr),
-        .mem_wdata(mem_wdata),
-        .mem_wmask(mem_wmask),
-        .mem_wstrb(mem_wstrb),
-        .mem_rdata(mem_rdata),
-        .mem_rstrb(mem_rstrb),
-        .mem_done (mem_done)
+        .mem_addr (bus_addr),
+        .mem_wdata(bus_wdata),
+        .mem_wmask(bus_wmask),
+        .mem_wstrb(bus_wstrb),
+        .mem_rdata(bus_rdata),
+        .mem_rstrb(bus_rstrb),
+        .mem_done (bus_done),
+        .mem_conflict(bus_conflict),
+
+        .icache_hit     (perf_icache_hit),
+        .icache_miss    (perf_icache_miss),
+        .fetch_stall    (perf_fetch_stall),
+        .execute_stall  (perf_execute_stall),
+        .grant_wait     (perf_grant_wait)
     );
+
+    // Events for the performance counters
+    logic [NUM_CORES-1:0] perf_icache_hit;
+    logic [NUM_CORES-1:0] perf_icache_miss;
+    logic [NUM_CORES-1:0] perf_fetch_stall;
+    logic [NUM_CORES-1:0] perf_execute_stall;
+    logic [NUM_CORES-1:0] perf_grant_wait;
+    logic perf_uart0_tx;
+    logic perf_uart1_tx;
     
-    logic soc_wram_sel;
-    logic soc_spi_flash_sel;
+    logic soc_spi_flash_config_sel;
     logic soc_blink_sel;
     
-    assign soc_wram_sel         = mem_addr[31:24] == WRAM_MASK;
-    assign soc_spi_flash_sel    = mem_addr[31:24] == SPI_FLASH_MASK;
+    assign soc_spi_flash_config_sel = mem_addr[31:24] == SPI_FLASH_CONFIG_MASK;
     assign soc_blink_sel        = mem_addr[31:24] == BLINK_MASK;
     
-    logic soc_wram_sel_del;
-    logic soc_spi_flash_sel_del;
+    logic soc_spi_flash_config_sel_del;
     logic soc_blink_sel_del;
     
     always_ff @(posedge clk) begin
         if (reset) begin
-            soc_wram_sel_del        <= 1'b0;
-            soc_spi_flash_sel_del   <= 1'b0;
+            soc_spi_flash_config_sel_del <= 1'b0;
             soc_blink_sel_del       <= 1'b0;
         end else begin
-            soc_wram_sel_del        <= soc_wram_sel;
-            soc_spi_flash_sel_del   <= soc_spi_flash_sel;
+            soc_spi_flash_config_sel_del <= soc_spi_flash_config_sel;
             soc_blink_sel_del       <= soc_blink_sel;
         end
     end
 
-    // WRAM Memory
-    
-    // Memory Port 1 - R/W
-    logic wram_web0;
-    logic [NUM_WMASKS-1:0] wram_wmask0;
-    logic [WRAM_ADDR_WIDTH-1:0] wram_addr0;
-    logic [DATA_WIDTH-1:0] wram_din0;
-    logic [DATA_WIDTH-1:0] wram_dout0;
+    // WRAM, one target per bank
+
+`ifdef WRAM_BANKED
+    wram_banked #(
+        .ADDR_WIDTH (WRAM_ADDR_WIDTH),
+        .NUM_BANKS  (WRAM_BANKS),
+        .INTERLEAVE (WRAM_INTERLEAVE)
+    ) wram (
+    `ifdef USE_POWER_PINS
+        .vdd    (vdd),
+        .vss    (vss),
+    `endif
+        .clk    (clk),
+        .reset  (reset),
+
+        .bank_addr  (bus_addr [32*TARGET_WRAM+:32*WRAM_BANKS]),
+        .bank_wdata (bus_wdata[32*TARGET_WRAM+:32*WRAM_BANKS]),
+        .bank_wmask (bus_wmask[ 4*TARGET_WRAM+: 4*WRAM_BANKS]),
+        .bank_wstrb (bus_wstrb[TARGET_WRAM+:WRAM_BANKS]),
+        .bank_rdata (bus_rdata[32*TARGET_WRAM+:32*WRAM_BANKS]),
+        .bank_rstrb (bus_rstrb[TARGET_WRAM+:WRAM_BANKS]),
+        .bank_done  (bus_done [TARGET_WRAM+:WRAM_BANKS])
+    );
+`else
+    // A single gf180_ram_32_wrapper as in the taped-out leosoc
+
+    initial begin
+        if (WRAM_BANKS != 1) begin
+            $fatal(1, "WRAM_BANKS > 1 needs WRAM_BANKED!");
+        end
+    end
 
     gf180_ram_32_wrapper
     #(
@@ -134,27 +260,21 @@ module leosoc #(
     `endif
         .clk    (clk),
         .cen    (reset),
-        .gwen   (wram_web0),
-        .wmask  (wram_wmask0),
-        .addr   (wram_addr0),
-        .din    (wram_din0),
-        .dout   (wram_dout0)
+        .gwen   (!bus_wstrb[TARGET_WRAM]),
+        .wmask  (bus_wmask[4*TARGET_WRAM+:4]),
+        .addr   (bus_addr[32*TARGET_WRAM+2+:WRAM_ADDR_WIDTH]),
+        .din    (bus_wdata[32*TARGET_WRAM+:32]),
+        .dout   (bus_rdata[32*TARGET_WRAM+:32])
     );
-    
-    // SoC read data
-    logic [DATA_WIDTH-1:0] mem_rdata_memory;
-    
-    // Connect WRAM
-    assign wram_web0        = !(mem_wstrb && soc_wram_sel);
-    assign wram_wmask0      = mem_wmask;
-    assign wram_addr0       = mem_addr >> 2;
-    assign wram_din0        = mem_wdata;
-    assign mem_rdata_memory = wram_dout0;
+
+    // No latency
+    assign bus_done[TARGET_WRAM] = bus_rstrb[TARGET_WRAM] || bus_wstrb[TARGET_WRAM];
+`endif
 
     always_comb begin
-        // SPI Flash
-        if (soc_spi_flash_sel_del) begin
-            mem_rdata = spi_flash_rdata;
+        // SPI Flash configuration
+        if (soc_spi_flash_config_sel_del) begin
+            mem_rdata = spi_flash_config_rdata;
         // Blink
         end else if (soc_blink_sel_del) begin
             mem_rdata = {32{blink}};
@@ -170,9 +290,12 @@ module leosoc #(
         // TRNG0
         end else if (trng0_select_del) begin
             mem_rdata = trng0_rdata;
-        // WRAM
+        // PERF0
+        end else if (perf0_select_del) begin
+            mem_rdata = perf0_rdata;
+        // Nothing selected
         end else begin
-            mem_rdata = mem_rdata_memory;
+            mem_rdata = '0;
         end
     end
 
@@ -218,7 +341,9 @@ module leosoc #(
         .select     (uart0_select),
         
         .uart_rx    (uart0_rx),
-        .uart_tx    (uart0_tx)
+        .uart_tx    (uart0_tx),
+
+        .tx_start   (perf_uart0_tx)
     );
     
     // UART1 Peripheral
@@ -253,7 +378,9 @@ module leosoc #(
         .select     (uart1_select),
         
         .uart_rx    (uart1_rx),
-        .uart_tx    (uart1_tx)
+        .uart_tx    (uart1_tx),
+
+        .tx_start   (perf_uart1_tx)
     );
 
     // GPIO0 Peripheral
@@ -261,6 +388,8 @@ module leosoc #(
     logic [31:0] gpio0_rdata;
     logic gpio0_done; // Not used
     logic gpio0_select;
+    logic [31:0] gpio0_out_peripheral;
+    logic [31:0] gpio0_oe_peripheral;
     
     logic gpio0_select_del;
     always_ff @(posedge clk, posedge reset) begin
@@ -286,9 +415,19 @@ module leosoc #(
         .select     (gpio0_select),
         
         .gpio_in    (gpio0_in),
-        .gpio_out   (gpio0_out),
-        .gpio_oe    (gpio0_oe)
+        .gpio_out   (gpio0_out_peripheral),
+        .gpio_oe    (gpio0_oe_peripheral)
     );
+
+    // The quad modes of the flash take over gpio0[23:22] for io2 and io3
+    always_comb begin
+        gpio0_out = gpio0_out_peripheral;
+        gpio0_oe  = gpio0_oe_peripheral;
+        if (spi_flash_quad) begin
+            gpio0_out[23:22] = spi_flash_io_out[3:2];
+            gpio0_oe[23:22]  = spi_flash_io_oe[3:2];
+        end
+    end
     
     // TRNG0 Peripheral
     
@@ -324,27 +463,119 @@ module leosoc #(
         .select     (trng0_select)
     );
 
+    // PERF0 Peripheral, only with PERF_COUNTERS
+    
+    logic [31:0] perf0_rdata;
+    logic perf0_done; // Not used
+    logic perf0_select;
+    
+    logic perf0_select_del;
+    always_ff @(posedge clk, posedge reset) begin
+        if (reset) begin
+            perf0_select_del <= 1'b0;
+        end else begin
+            perf0_select_del <= perf0_select;
+        end
+    end
+
+    generate
+        if (PERF_COUNTERS) begin : perf0
+            peripheral_perf #(
+                .ADDRESS_BASE   (PERF0_BASE_ADDRESS),
+                .NUM_HARTS      (NUM_CORES)
+            ) peripheral_perf_i (
+                .clk_i      (clk),
+                .rst_ni     (!reset),
+                .mem_addr   (mem_addr),
+                .mem_wdata  (mem_wdata),
+                .mem_wmask  (mem_wmask),
+                .mem_wstrb  (mem_wstrb),
+                .mem_rdata  (perf0_rdata),
+                .mem_rstrb  (mem_rstrb),
+                .mem_done   (perf0_done),
+                .select     (perf0_select),
+        
+                .icache_hit     (perf_icache_hit),
+                .icache_miss    (perf_icache_miss),
+                .fetch_stall    (perf_fetch_stall),
+                .execute_stall  (perf_execute_stall),
+                .grant_wait     (perf_grant_wait),
+        
+                .flash_read     (flash_bus_rstrb && spi_flash_done),
+                .flash_busy     (flash_bus_rstrb && !spi_flash_done),
+                .wram_conflict  (|bus_conflict[TARGET_WRAM+:WRAM_BANKS]),
+                .uart0_tx       (perf_uart0_tx),
+                .uart1_tx       (perf_uart1_tx)
+            );
+        end else begin
+            assign perf0_rdata  = '0;
+            assign perf0_done   = 1'b0;
+            assign perf0_select = 1'b0;
+        end
+    endgenerate
+
     // SPI Flash
     
     logic [DATA_WIDTH-1:0] spi_flash_rdata;
     logic spi_flash_done;
     logic spi_flash_initialized;
+    logic [31:0] spi_flash_config_rdata;
+    logic spi_flash_quad;
+    logic [3:0] spi_flash_io_out;
+    logic [3:0] spi_flash_io_oe;
+    logic [3:0] spi_flash_io_in;
+    logic spi_flash_config_wstrb;
 
-    spi_flash spi_flash_inst (
+`ifdef SPI_FLASH_MULTI_IO
+    assign flash_io_out = spi_flash_io_out[1:0];
+    assign flash_io_oe  = spi_flash_io_oe[1:0];
+    assign spi_flash_io_in = {gpio0_in[23:22], flash_io_in};
+    assign spi_flash_config_wstrb = soc_spi_flash_config_sel && mem_wstrb;
+`else
+    // io0 is always an output and io1 an input, the read mode stays SINGLE
+    assign sdo = spi_flash_io_out[0];
+    assign spi_flash_io_in = {2'b00, sdi, 1'b0};
+    assign spi_flash_config_wstrb = 1'b0;
+
+    initial begin
+        if (SPI_FLASH_READ_MODE != "SINGLE") begin
+            $fatal(1, "The fast reads of the flash need SPI_FLASH_MULTI_IO!");
+        end
+    end
+`endif
+
+    // FAST_FLASH replaces the controller with a behavioural
+    // flash port without SPI transactions, simulation only
+`ifdef FAST_FLASH
+    spi_flash_fast spi_flash_inst (
+`else
+    spi_flash #(
+        .READ_MODE      (SPI_FLASH_READ_MODE),
+        .DUMMY_CYCLES   (SPI_FLASH_DUMMY_CYCLES),
+        .CONTINUOUS_READ(SPI_FLASH_CONTINUOUS_READ)
+    ) spi_flash_inst (
+`endif
         .clk,
         .reset,
 
-        .addr_in    (mem_addr[23:0]),      // address of word
+        .addr_in    (flash_bus_addr[23:0]),         // address of word
         .data_out   (spi_flash_rdata),              // received word
-        .strobe     (soc_spi_flash_sel && mem_rstrb),    // start transmission
+        .strobe     (flash_bus_rstrb),              // start transmission
         .done       (spi_flash_done),               // pulse, transmission done
         .initialized(spi_flash_initialized),        // initial cmds sent
 
+        // Configuration register
+        .config_wdata (mem_wdata),
+        .config_wstrb (spi_flash_config_wstrb),
+        .config_rdata (spi_flash_config_rdata),
+        .quad         (spi_flash_quad),
+
         // SPI signals
         .sck,
-        .sdo,
-        .sdi,
-        .cs
+        .cs,
+        .io_out     (spi_flash_io_out),
+        .io_oe      (spi_flash_io_oe),
+        .io_in      (spi_flash_io_in)
     );
 
 endmodule
@@ -5,7 +5,31 @@
 `timescale 1ns / 1ps
 
 // TODO rename spi_flash_controller
-module spi_flash (
+//
+// Reads words from the flash with one of the read commands:
+//
+//   SINGLE       03h  command, address and data on io0/io1
+//   DUAL_OUTPUT  3Bh  command and address on io0, dummy cycles, data on io0-1
+//   QUAD_OUTPUT  6Bh  command and address on io0, dummy cycles, data on io0-3
+//   DUAL_IO      BBh  command on io0, address, mode bits, dummy cycles and data on io0-1
+//   QUAD_IO      EBh  command on io0, address, mode bits, dummy cycles and data on io0-3
+//
+// With CONTINUOUS_READ, DUAL_IO and QUAD_IO send the mode bits A5h, the
+// flash then expects the address right after CS (XIP) and the command
+// byte is skipped for all further reads. A continuous read is ended by
+// mode bits 00h, or by a cycle of all ones when the configuration changes.
+//
+// READ_MODE, DUMMY_CYCLES and CONTINUOUS_READ are the reset values of the
+// configuration register, which is applied from the next read command on:
+//
+//   [2:0] read mode, 0: SINGLE, 1: DUAL_OUTPUT, 2: QUAD_OUTPUT, 3: DUAL_IO, 4: QUAD_IO
+//   [3]   continuous read
+//   [7:4] dummy cycles
+module spi_flash #(
+    parameter READ_MODE = "SINGLE",
+    parameter int DUMMY_CYCLES = 8,     // SCK cycles before the data of the fast reads
+    parameter bit CONTINUOUS_READ = 1'b1
+) (
     input clk,
     input reset,
 
@@ -15,18 +39,112 @@ module spi_flash (
     output logic        done,     // pulse, transmission done
     output logic        initialized, // initial cmds sent
 
+    // Configuration register
+    input  [31:0]       config_wdata,
+    input               config_wstrb,
+    output logic [31:0] config_rdata,
+    output logic        quad,       // io2 and io3 are in use
+
     // SPI signals
     output sck,
-    output sdo,
-    input  sdi,
-    output cs
+    output cs,
+    output [3:0] io_out,
+    output [3:0] io_oe,
+    input  [3:0] io_in
 );
 
     localparam bit [7:0] CMD_MODE_BIT_RESET = 8'hFF;
     localparam bit [7:0] CMD_WAKEUP         = 8'hAB;
     localparam bit [7:0] CMD_READ           = 8'h03;
+    localparam bit [7:0] CMD_READ_DUAL_OUT  = 8'h3B;
+    localparam bit [7:0] CMD_READ_QUAD_OUT  = 8'h6B;
+    localparam bit [7:0] CMD_READ_DUAL_IO   = 8'hBB;
+    localparam bit [7:0] CMD_READ_QUAD_IO   = 8'hEB;
+
+    localparam bit [7:0] MODE_BITS_CONTINUE = 8'hA5;
+    localparam bit [7:0] MODE_BITS_END      = 8'h00;
+
+    localparam bit [2:0] MODE_SINGLE        = 3'd0;
+    localparam bit [2:0] MODE_DUAL_OUTPUT   = 3'd1;
+    localparam bit [2:0] MODE_QUAD_OUTPUT   = 3'd2;
+    localparam bit [2:0] MODE_DUAL_IO       = 3'd3;
+    localparam bit [2:0] MODE_QUAD_IO       = 3'd4;
+
+    // Bits per SCK cycle of the shifter
+    localparam bit [1:0] WIDTH_SINGLE   = 2'd0;
+    localparam bit [1:0] WIDTH_DUAL     = 2'd1;
+    localparam bit [1:0] WIDTH_QUAD     = 2'd2;
+
+    localparam bit [2:0] RESET_MODE =
+        READ_MODE == "DUAL_OUTPUT"  ? MODE_DUAL_OUTPUT :
+        READ_MODE == "QUAD_OUTPUT"  ? MODE_QUAD_OUTPUT :
+        READ_MODE == "DUAL_IO"      ? MODE_DUAL_IO :
+        READ_MODE == "QUAD_IO"      ? MODE_QUAD_IO : MODE_SINGLE;
+
+    // Configuration register
+    logic [2:0] config_mode;
+    logic       config_continuous;
+    logic [3:0] config_dummy;
+
+    assign config_rdata = {24'b0, config_dummy, config_continuous, config_mode};
+
+    // Configuration of the current read command
+    logic [2:0] active_mode;
+    logic       active_continuous;
+    logic [3:0] active_dummy;
+
+    // The flash is in a continuous read and expects an address after CS
+    logic continuous;
+
+    // Only the reads with mode bits can be continuous
+    logic config_xip;
+    assign config_xip = config_continuous && (config_mode == MODE_DUAL_IO || config_mode == MODE_QUAD_IO);
+
+    // The next read needs the current configuration
+    logic reconfigure;
+    assign reconfigure = {config_mode, config_xip, config_dummy}
+                      != {active_mode, active_continuous, active_dummy};
+
+    assign quad = config_mode == MODE_QUAD_OUTPUT || config_mode == MODE_QUAD_IO
+               || active_mode == MODE_QUAD_OUTPUT || active_mode == MODE_QUAD_IO;
+
+    // Phases of the active read command
+    logic [7:0] command;
+    logic [1:0] address_width;
+    logic [1:0] data_width;
+    logic       mode_bits;
+
+    always_comb begin
+        case (active_mode)
+            MODE_DUAL_OUTPUT: begin
+                command = CMD_READ_DUAL_OUT;
+                address_width = WIDTH_SINGLE;
+                data_width = WIDTH_DUAL;
+            end
+            MODE_QUAD_OUTPUT: begin
+                command = CMD_READ_QUAD_OUT;
+                address_width = WIDTH_SINGLE;
+                data_width = WIDTH_QUAD;
+            end
+            MODE_DUAL_IO: begin
+                command = CMD_READ_DUAL_IO;
+                address_width = WIDTH_DUAL;
+                data_width = WIDTH_DUAL;
+            end
+            MODE_QUAD_IO: begin
+                command = CMD_READ_QUAD_IO;
+                address_width = WIDTH_QUAD;
+                data_width = WIDTH_QUAD;
+            end
+            default: begin
+                command = CMD_READ;
+                address_width = WIDTH_SINGLE;
+                data_width = WIDTH_SINGLE;
+            end
+        endcase
+    end
 
-    logic [23:0] current_address;
+    assign mode_bits = active_mode == MODE_DUAL_IO || active_mode == MODE_QUAD_IO;
 
     typedef enum {
         ST_MODE_BIT_RESET,
@@ -34,20 +152,28 @@ module spi_flash (
         ST_WAKEUP,
         ST_WAKEUP_2,
         ST_READ,
-        ST_ADDR_0,
-        ST_ADDR_1,
-        ST_ADDR_2,
-        ST_DATA_0,
-        ST_DATA_1,
-        ST_DATA_2,
-        ST_DATA_3,
-        ST_CONTINUE
+        ST_ADDR,
+        ST_MODE,
+        ST_DUMMY,
+        ST_DATA,
+        ST_CONTINUE,
+        ST_END_CONTINUOUS,
+        ST_END_CONTINUOUS_2
     } spi_flash_states_t;
-    
+
     spi_flash_states_t current_state;
-    
-    logic [7:0] spi_shifter_data_in;
-    logic [7:0] spi_shifter_data_out;
+
+    // A continuous read skips the command, unless it has to end first
+    spi_flash_states_t start_state;
+    assign start_state = !continuous ? ST_READ : reconfigure ? ST_END_CONTINUOUS : ST_ADDR;
+
+    logic [23:0] current_address;
+
+    logic [31:0] spi_shifter_data_in;
+    logic [31:0] spi_shifter_data_out;
+    logic [1:0]  spi_shifter_width;
+    logic        spi_shifter_drive;
+    logic [5:0]  spi_shifter_cycles;
     logic spi_shifter_strobe;
     logic spi_shifter_busy;
     logic spi_shifter_done;
@@ -59,17 +185,33 @@ module spi_flash (
 
         .data_in    (spi_shifter_data_in),
         .data_out   (spi_shifter_data_out),
+        .width      (spi_shifter_width),
+        .drive      (spi_shifter_drive),
+        .cycles     (spi_shifter_cycles),
         .strobe     (spi_shifter_strobe),
         .busy       (spi_shifter_busy),
         .done       (spi_shifter_done),
         .deassert_cs(spi_shifter_deassert_cs),
 
         .sck,
-        .sdo,
-        .sdi,
-        .cs
+        .cs,
+        .io_out,
+        .io_oe,
+        .io_in
     );
-    
+
+    always_ff @(posedge clk, posedge reset) begin
+        if (reset) begin
+            config_mode       <= RESET_MODE;
+            config_continuous <= CONTINUOUS_READ;
+            config_dummy      <= 4'(DUMMY_CYCLES);
+        end else if (config_wstrb) begin
+            config_mode       <= config_wdata[2:0] > MODE_QUAD_IO ? MODE_SINGLE : config_wdata[2:0];
+            config_continuous <= config_wdata[3];
+            config_dummy      <= config_wdata[7:4];
+        end
+    end
+
     always_ff @(posedge clk, posedge reset) begin
         if (reset) begin
             data_out    <= '0;
@@ -77,7 +219,14 @@ module spi_flash (
             initialized <= 1'b0;
             current_address         <= '0;
             current_state           <= ST_MODE_BIT_RESET;
+            active_mode             <= MODE_SINGLE;
+            active_continuous       <= 1'b0;
+            active_dummy            <= '0;
+            continuous              <= 1'b0;
             spi_shifter_data_in     <= '0;
+            spi_shifter_width       <= WIDTH_SINGLE;
+            spi_shifter_drive       <= 1'b1;
+            spi_shifter_cycles      <= '0;
             spi_shifter_strobe      <= 1'b0;
             spi_shifter_deassert_cs <= 1'b0;
         end else begin
@@ -87,7 +236,10 @@ module spi_flash (
 
             case (current_state)
                 ST_MODE_BIT_RESET: begin
-                    spi_shifter_data_in <= CMD_MODE_BIT_RESET;
+                    spi_shifter_data_in <= {CMD_MODE_BIT_RESET, 24'b0};
+                    spi_shifter_width   <= WIDTH_SINGLE;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd8;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
@@ -99,7 +251,10 @@ module spi_flash (
                     current_state <= ST_WAKEUP;
                 end
                 ST_WAKEUP: begin
-                    spi_shifter_data_in <= CMD_WAKEUP;
+                    spi_shifter_data_in <= {CMD_WAKEUP, 24'b0};
+                    spi_shifter_width   <= WIDTH_SINGLE;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd8;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
@@ -110,75 +265,73 @@ module spi_flash (
                     spi_shifter_deassert_cs <= 1'b1;
                     initialized <= 1'b1;
                     if (strobe) begin
-                        current_state <= ST_READ;
+                        current_state <= start_state;
                         current_address <= {addr_in[23:2], 2'b00}; // align to word address
+                        if (start_state == ST_READ) begin
+                            active_mode       <= config_mode;
+                            active_continuous <= config_xip;
+                            active_dummy      <= config_dummy;
+                        end
                     end
                 end
                 ST_READ: begin
-                    spi_shifter_data_in <= CMD_READ;
-                    if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
-
-                    if (spi_shifter_done) begin
-                        current_state <= ST_ADDR_0;
-                    end
-                end
-                ST_ADDR_0: begin
-                    spi_shifter_data_in <= current_address[23:16];
-                    if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
-
-                    if (spi_shifter_done) begin
-                        current_state <= ST_ADDR_1;
-                    end
-                end
-                ST_ADDR_1: begin
-                    spi_shifter_data_in <= current_address[15:8];
+                    spi_shifter_data_in <= {command, 24'b0};
+                    spi_shifter_width   <= WIDTH_SINGLE;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd8;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
-                        current_state <= ST_ADDR_2;
+                        current_state <= ST_ADDR;
                     end
                 end
-                ST_ADDR_2: begin
-                    spi_shifter_data_in <= current_address[7:0];
+                ST_ADDR: begin
+                    spi_shifter_data_in <= {current_address, 8'b0};
+                    spi_shifter_width   <= address_width;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd24 >> address_width;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
-                        current_state <= ST_DATA_0;
+                        current_state <= mode_bits ? ST_MODE :
+                                         active_mode != MODE_SINGLE && active_dummy != 0 ? ST_DUMMY : ST_DATA;
                     end
                 end
-                ST_DATA_0: begin
-                    spi_shifter_data_in <= 8'b00; // dummy data
+                ST_MODE: begin
+                    spi_shifter_data_in <= {active_continuous ? MODE_BITS_CONTINUE : MODE_BITS_END, 24'b0};
+                    spi_shifter_width   <= address_width;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd8 >> address_width;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
-                        data_out[7:0] <= spi_shifter_data_out;
-                        current_state <= ST_DATA_1;
+                        continuous <= active_continuous;
+                        current_state <= active_dummy != 0 ? ST_DUMMY : ST_DATA;
                     end
                 end
-                ST_DATA_1: begin
-                    spi_shifter_data_in <= 8'b00; // dummy data
+                ST_DUMMY: begin
+                    // The flash takes over the data lines
+                    spi_shifter_data_in <= '0;
+                    spi_shifter_width   <= data_width;
+                    spi_shifter_drive   <= 1'b0;
+                    spi_shifter_cycles  <= 6'(active_dummy);
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
-                        data_out[15:8] <= spi_shifter_data_out;
-                        current_state <= ST_DATA_2;
+                        current_state <= ST_DATA;
                     end
                 end
-                ST_DATA_2: begin
-                    spi_shifter_data_in <= 8'b00; // dummy data
+                ST_DATA: begin
+                    spi_shifter_data_in <= '0;
+                    spi_shifter_width   <= data_width;
+                    spi_shifter_drive   <= 1'b0;
+                    spi_shifter_cycles  <= 6'd32 >> data_width;
                     if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
 
                     if (spi_shifter_done) begin
-                        data_out[23:16] <= spi_shifter_data_out;
-                        current_state <= ST_DATA_3;
-                    end
-                end
-                ST_DATA_3: begin
-                    spi_shifter_data_in <= 8'b00; // dummy data
-                    if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
-
-                    if (spi_shifter_done) begin
-                        data_out[31:24] <= spi_shifter_data_out;
+                        // First byte received is the lowest
+                        data_out <= {spi_shifter_data_out[7:0], spi_shifter_data_out[15:8],
+                                     spi_shifter_data_out[23:16], spi_shifter_data_out[31:24]};
                         current_state <= ST_CONTINUE;
                         done <= 1'b1;
                     end
@@ -186,17 +339,42 @@ module spi_flash (
                 ST_CONTINUE: begin
                     if (strobe && !done) begin
                         // If the next read is continuous, just read the data
-                        if (addr_in == current_address + 4) begin
-                            current_state <= ST_DATA_0;
+                        if (addr_in == current_address + 4 && !reconfigure) begin
+                            current_state <= ST_DATA;
                         // Else terminate current cmd and start anew
                         end else begin
                             spi_shifter_deassert_cs <= 1'b1;
-                            current_state <= ST_READ;
+                            current_state <= start_state;
+                            if (start_state == ST_READ) begin
+                                active_mode       <= config_mode;
+                                active_continuous <= config_xip;
+                                active_dummy      <= config_dummy;
+                            end
                         end
                         // Set new address
                         current_address <= {addr_in[23:2], 2'b00}; // align to word address
                     end
                 end
+                ST_END_CONTINUOUS: begin
+                    // Address and mode bits of all ones end the continuous read
+                    spi_shifter_data_in <= '1;
+                    spi_shifter_width   <= address_width;
+                    spi_shifter_drive   <= 1'b1;
+                    spi_shifter_cycles  <= 6'd32 >> address_width;
+                    if (!spi_shifter_busy) spi_shifter_strobe <= 1'b1;
+
+                    if (spi_shifter_done) begin
+                        current_state <= ST_END_CONTINUOUS_2;
+                    end
+                end
+                ST_END_CONTINUOUS_2: begin
+                    spi_shifter_deassert_cs <= 1'b1;
+                    continuous <= 1'b0;
+                    current_state <= ST_READ;
+                    active_mode       <= config_mode;
+                    active_continuous <= config_xip;
+                    active_dummy      <= config_dummy;
+                end
                 default: begin
                     data_out <= 'x;
                     done     <= 'x;
@@ -210,73 +388,100 @@ module spi_shifter (
     input clk,
     input reset,
 
-    input  [7:0]        data_in,     // data to send
-    output logic [7:0]  data_out,    // data received
+    input  [31:0]       data_in,     // data to send, MSB first
+    output logic [31:0] data_out,    // data received, last bits in the LSBs
+    input  [1:0]        width,       // 0: single, 1: dual, 2: quad
+    input               drive,       // send on the data lines, else receive
+    input  [5:0]        cycles,      // SCK cycles of the transmission
     input               strobe,      // start transmission
     output logic        busy,        // transmission in progress
     output logic        done,        // pulse, transmission done
     input               deassert_cs, // deassert CS
 
     // SPI signals
-    output logic    sck,
-    output          sdo,
-    input           sdi,
-    output logic    cs
+    output logic        sck,
+    output logic        cs,
+    output logic [3:0]  io_out,
+    output logic [3:0]  io_oe,
+    input  [3:0]        io_in
 );
 
     localparam bit CS_ASSERT = 1'b0;
     localparam bit CS_DEASSERT = 1'b1;
 
-    logic [3:0] remaining_bits;
-    logic [7:0] data_shift;
-    
+    logic [5:0]  remaining_cycles;
+    logic [31:0] data_shift;
+    logic [1:0]  current_width;
+    logic        current_drive;
+
     /*
     SCK: low when inactive
-    SDO: MSB first, write on falling edge
-    SDI: MSB first, read on falling edge
+    IO: MSB first, write on falling edge
+    IO: MSB first, read on falling edge
     CS: active low
+
+    Single: io0 is MOSI, io1 MISO
+    Dual:   io1 carries the higher bit
+    Quad:   io3 carries the highest bit
+    io2 (WP#) and io3 (HOLD#) are high unless they carry quad data
     */
 
     always_ff @(posedge clk, posedge reset) begin
         if (reset) begin
-            data_out        <= '0;
-            busy            <= 1'b0;
-            done            <= 1'b0;
-            sck             <= 1'b0;
-            cs              <= CS_DEASSERT;
-            remaining_bits  <= '0;
-            data_shift      <= '0;
+            data_out         <= '0;
+            busy             <= 1'b0;
+            done             <= 1'b0;
+            sck              <= 1'b0;
+            cs               <= CS_DEASSERT;
+            remaining_cycles <= '0;
+            data_shift       <= '0;
+            current_width    <= '0;
+            current_drive    <= 1'b1;
         end else begin
             done <= 1'b0;
             busy <= 1'b0;
             sck  <= 1'b0;
 
             // New command -> deassert CS
-            if (deassert_cs && remaining_bits == 0) begin
+            if (deassert_cs && remaining_cycles == 0) begin
                 cs <= CS_DEASSERT;
             end
 
             // Start transmission
-            if (strobe && remaining_bits == 0) begin
-                data_out        <= '0;
-                busy            <= 1'b1;
-                cs              <= CS_ASSERT;
-                remaining_bits  <= 8;
-                data_shift      <= data_in;
+            if (strobe && remaining_cycles == 0) begin
+                data_out         <= '0;
+                busy             <= 1'b1;
+                cs               <= CS_ASSERT;
+                remaining_cycles <= cycles;
+                data_shift       <= data_in;
+                current_width    <= width;
+                current_drive    <= drive;
             end
 
             // Toggle sck, shift bits
-            if (remaining_bits) begin
+            if (remaining_cycles) begin
                 sck <= !sck;
                 busy <= 1'b1;
 
                 if (sck) begin
-                    data_shift      <= {data_shift[6:0], 1'b0};
-                    data_out        <= {data_out[6:0], sdi};
-                    remaining_bits  <= remaining_bits - 1'b1;
-                    
+                    case (current_width)
+                        2'd0: begin
+                            data_shift <= {data_shift[30:0], 1'b0};
+                            data_out   <= {data_out[30:0], io_in[1]};
+                        end
+                        2'd1: begin
+                            data_shift <= {data_shift[29:0], 2'b0};
+                            data_out   <= {data_out[29:0], io_in[1:0]};
+                        end
+                        default: begin
+                            data_shift <= {data_shift[27:0], 4'b0};
+                            data_out   <= {data_out[27:0], io_in[3:0]};
+                        end
+                    endcase
+                    remaining_cycles <= remaining_cycles - 1'b1;
+
                     // Pulse done
-                    if (remaining_bits == 'd1) begin
+                    if (remaining_cycles == 'd1) begin
                         done <= 1'b1;
                     end
                 end
@@ -285,6 +490,21 @@ module spi_shifter (
     end
 
     // Shift MSB first
-    assign sdo = data_shift[7];
+    always_comb begin
+        case (current_width)
+            2'd0: begin
+                io_out = {2'b11, 1'b0, data_shift[31]};
+                io_oe  = 4'b1101;
+            end
+            2'd1: begin
+                io_out = {2'b11, data_shift[31:30]};
+                io_oe  = {2'b11, current_drive, current_drive};
+            end
+            default: begin
+                io_out = data_shift[31:28];
+                io_oe  = {4{current_drive}};
+            end
+        endcase
+    end
 
 endmodule
@@ -0,0 +1,83 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// Behavioural replacement of spi_flash for simulation only
+// Same ports, but a word is returned one cycle after the strobe
+// instead of sending a CMD_READ over SPI, see FAST_FLASH in leosoc
+module spi_flash_fast #(
+    parameter INIT_F = "../firmware/firmware.hex",
+    parameter OFFSET = 24'h200000
+) (
+    input clk,
+    input reset,
+
+    input  [23:0]       addr_in,  // address of word
+    output logic [31:0] data_out, // received word
+    input               strobe,   // start transmission
+    output logic        done,     // pulse, transmission done
+    output logic        initialized, // initial cmds sent
+
+    // Configuration register, kept but without effect
+    input  [31:0]       config_wdata,
+    input               config_wstrb,
+    output logic [31:0] config_rdata,
+    output logic        quad,
+
+    // SPI signals
+    output sck,
+    output cs,
+    output [3:0] io_out,
+    output [3:0] io_oe,
+    input  [3:0] io_in
+);
+
+    // Same size and content as the spiflash model,
+    // can be written from cocotb, see backdoor.py
+    logic [7:0] memory [0:16*1024*1024-1];
+
+    reg [1023:0] firmware_file;
+    initial begin
+        if (!$value$plusargs("firmware=%s", firmware_file))
+            firmware_file = INIT_F;
+        $readmemh(firmware_file, memory, OFFSET);
+    end
+
+    logic [23:0] word_address;
+    assign word_address = {addr_in[23:2], 2'b00};
+
+    always_ff @(posedge clk, posedge reset) begin
+        if (reset) begin
+            config_rdata <= 32'h88; // SINGLE, continuous, 8 dummy cycles
+        end else if (config_wstrb) begin
+            config_rdata <= {24'b0, config_wdata[7:3], config_wdata[2:0] > 3'd4 ? 3'd0 : config_wdata[2:0]};
+        end
+    end
+
+    always_ff @(posedge clk, posedge reset) begin
+        if (reset) begin
+            data_out    <= '0;
+            done        <= 1'b0;
+            initialized <= 1'b0;
+        end else begin
+            done        <= 1'b0;
+            initialized <= 1'b1;
+
+            if (strobe && !done) begin
+                data_out <= {memory[word_address + 3], memory[word_address + 2],
+                             memory[word_address + 1], memory[word_address]};
+                done     <= 1'b1;
+            end
+        end
+    end
+
+    // The SPI bus stays idle
+    assign sck    = 1'b0;
+    assign cs     = 1'b1;
+    assign io_out = 4'b1100;
+    assign io_oe  = 4'b1101;
+    assign quad   = 1'b0;
+
+endmodule
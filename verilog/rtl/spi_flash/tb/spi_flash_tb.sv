@@ -3,7 +3,9 @@
 
 `timescale 1ns/1ps
 
-module spi_flash_tb;
+module spi_flash_tb #(
+    parameter READ_MODE = "SINGLE"
+);
     
     logic reset = 1;
     
@@ -46,11 +48,19 @@ module spi_flash_tb;
     logic done;
     
     logic sck;
-    logic sdo;
-    logic sdi;
     logic cs;
-    
-    spi_flash spi_flash_inst (
+    logic [3:0] io_out;
+    logic [3:0] io_oe;
+    wire  [3:0] io;
+
+    // Bidirectional flash pins
+    for (genvar i = 0; i < 4; i++) begin : flash_io
+        assign io[i] = io_oe[i] ? io_out[i] : 1'bz;
+    end
+
+    spi_flash #(
+        .READ_MODE(READ_MODE)
+    ) spi_flash_inst (
         .reset,
         .clk,
 
@@ -58,11 +68,18 @@ module spi_flash_tb;
         .data_out,
         .strobe,
         .done,
-        
+        .initialized (),
+
+        .config_wdata (32'b0),
+        .config_wstrb (1'b0),
+        .config_rdata (),
+        .quad         (),
+
         .sck,
-        .sdo,
-        .sdi,
-        .cs
+        .cs,
+        .io_out,
+        .io_oe,
+        .io_in  (io)
     );
     
     spiflash #(
@@ -70,10 +87,10 @@ module spi_flash_tb;
     ) spiflash_inst (
         .csb    (cs),
         .clk    (sck),
-        .io0    (sdo), // MOSI
-        .io1    (sdi), // MISO
-        .io2    (),
-        .io3    ()
+        .io0    (io[0]), // MOSI
+        .io1    (io[1]), // MISO
+        .io2    (io[2]),
+        .io3    (io[3])
     );
 
 endmodule
@@ -26,7 +26,11 @@
 // updates output signals 1ns after the SPI clock edge.
 //
 // Supported commands:
-//    AB, B9, FF, 03, BB, EB, ED
+//    AB, B9, FF, 03, 3B, 6B, BB, EB, ED
+//
+// The fast reads (3B, 6B, BB, EB, ED) wait LATENCY dummy cycles before
+// the data, BB, EB and ED after the mode bits. Mode bits A5 start a
+// continuous read, the next command after CS is implied.
 //
 // Well written SPI flash data sheets:
 //    Cypress S25FL064L http://www.cypress.com/file/316661/download
@@ -38,7 +42,8 @@
 
 module spiflash #(
     parameter INIT_F="firmware.hex",
-    parameter OFFSET=0
+    parameter OFFSET=0,
+    parameter integer LATENCY=8
 )(
 	input csb,
 	input clk,
@@ -48,7 +53,7 @@ module spiflash #(
 	inout io3
 );
 	localparam verbose = 0;
-	localparam integer latency = 8;
+	localparam integer latency = LATENCY;
 
 	reg [7:0] buffer;
 	integer bitcount = 0;
@@ -144,6 +149,44 @@ module spiflash #(
 				end
 			end
 
+			if (powered_up && spi_cmd == 'h 3b) begin
+				if (bytecount == 2)
+					spi_addr[23:16] = buffer;
+
+				if (bytecount == 3)
+					spi_addr[15:8] = buffer;
+
+				if (bytecount == 4) begin
+					spi_addr[7:0] = buffer;
+					mode = mode_dspi_wr;
+					dummycount = latency;
+				end
+
+				if (bytecount >= 4) begin
+					buffer = memory[spi_addr];
+					spi_addr = spi_addr + 1;
+				end
+			end
+
+			if (powered_up && spi_cmd == 'h 6b) begin
+				if (bytecount == 2)
+					spi_addr[23:16] = buffer;
+
+				if (bytecount == 3)
+					spi_addr[15:8] = buffer;
+
+				if (bytecount == 4) begin
+					spi_addr[7:0] = buffer;
+					mode = mode_qspi_wr;
+					dummycount = latency;
+				end
+
+				if (bytecount >= 4) begin
+					buffer = memory[spi_addr];
+					spi_addr = spi_addr + 1;
+				end
+			end
+
 			if (powered_up && spi_cmd == 'h bb) begin
 				if (bytecount == 1)
 					mode = mode_dspi_rd;
@@ -233,7 +276,7 @@ module spiflash #(
 
 	task ddr_rd_edge;
 		begin
-			buffer = {buffer, io3_delayed, io2_delayed, io1_delayed, io0_delayed};
+			buffer = {buffer[3:0], io3_delayed, io2_delayed, io1_delayed, io0_delayed};
 			bitcount = bitcount + 4;
 			if (bitcount == 8) begin
 				bitcount = 0;
@@ -255,7 +298,7 @@ module spiflash #(
 			io2_dout = buffer[6];
 			io3_dout = buffer[7];
 
-			buffer = {buffer, 4'h 0};
+			buffer = {buffer[3:0], 4'h 0};
 			bitcount = bitcount + 4;
 			if (bitcount == 8) begin
 				bitcount = 0;
@@ -374,7 +417,7 @@ module spiflash #(
 			end else
 			case (mode)
 				mode_spi: begin
-					buffer = {buffer, io0};
+					buffer = {buffer[6:0], io0};
 					bitcount = bitcount + 1;
 					if (bitcount == 8) begin
 						bitcount = 0;
@@ -383,7 +426,7 @@ module spiflash #(
 					end
 				end
 				mode_dspi_rd, mode_dspi_wr: begin
-					buffer = {buffer, io1, io0};
+					buffer = {buffer[5:0], io1, io0};
 					bitcount = bitcount + 2;
 					if (bitcount == 8) begin
 						bitcount = 0;
@@ -392,7 +435,7 @@ module spiflash #(
 					end
 				end
 				mode_qspi_rd, mode_qspi_wr: begin
-					buffer = {buffer, io3, io2, io1, io0};
+					buffer = {buffer[3:0], io3, io2, io1, io0};
 					bitcount = bitcount + 4;
 					if (bitcount == 8) begin
 						bitcount = 0;
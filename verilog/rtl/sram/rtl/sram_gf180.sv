@@ -111,7 +111,7 @@ module gf180_ram_32_wrapper
         $display("NUM_INSTANCES %d", NUM_INSTANCES);
         
         if (ADDR_WIDTH < DEFAULT_ADDR_WIDTH) begin
-            $fatal("ADDR_WIDTH must not be smaller than DEFAULT_ADDR_WIDTH!");
+            $fatal(1, "ADDR_WIDTH must not be smaller than DEFAULT_ADDR_WIDTH!");
         end
     end
 
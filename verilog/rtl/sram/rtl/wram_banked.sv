@@ -0,0 +1,95 @@
+// SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+// SPDX-License-Identifier: GPL-3.0-or-later
+
+`default_nettype none
+`timescale 1ns / 1ps
+
+// WRAM of NUM_BANKS banks, each with its own port, so that accesses to
+// different banks are served in the same cycle
+//
+// The words are interleaved over the banks in blocks of INTERLEAVE
+// words: word w is in bank (w / INTERLEAVE) % NUM_BANKS. The bank of a
+// byte address is addr[BANK_SHIFT+:BANK_BITS], the crossbar decodes it
+// into one target per bank. There the arbiter of the bank queues the
+// requests to it: every hart holds its strobe until done and waits for
+// the grant when another hart has the bank.
+//
+// Each port is done in the cycle of its strobe, the read data follows
+// in the next cycle, as for a single gf180_ram_32_wrapper.
+module wram_banked #(
+    parameter int ADDR_WIDTH = 10,  // words of all banks
+    parameter int NUM_BANKS  = 2,
+    parameter int INTERLEAVE = 1    // words
+) (
+`ifdef USE_POWER_PINS
+    inout vdd,
+    inout vss,
+`endif
+    input  logic clk,
+    input  logic reset,
+
+    // Port of every bank
+    input  logic [32 * NUM_BANKS - 1:0] bank_addr,   // byte address
+    input  logic [32 * NUM_BANKS - 1:0] bank_wdata,  // write data
+    input  logic [ 4 * NUM_BANKS - 1:0] bank_wmask,  // write mask
+    input  logic [     NUM_BANKS - 1:0] bank_wstrb,  // write strobe
+    output logic [32 * NUM_BANKS - 1:0] bank_rdata,  // read data
+    input  logic [     NUM_BANKS - 1:0] bank_rstrb,  // read strobe
+    output logic [     NUM_BANKS - 1:0] bank_done    // done
+);
+
+    localparam BANK_BITS   = $clog2(NUM_BANKS);
+    localparam OFFSET_BITS = $clog2(INTERLEAVE);
+    localparam BANK_ADDR_WIDTH = ADDR_WIDTH - BANK_BITS;
+    localparam logic [ADDR_WIDTH-1:0] OFFSET_MASK = ADDR_WIDTH'(INTERLEAVE - 1);
+
+    initial begin
+        if (NUM_BANKS != 2**BANK_BITS) begin
+            $fatal(1, "NUM_BANKS must be a power of 2!");
+        end
+        if (INTERLEAVE != 2**OFFSET_BITS) begin
+            $fatal(1, "INTERLEAVE must be a power of 2!");
+        end
+        if (OFFSET_BITS + BANK_BITS > ADDR_WIDTH) begin
+            $fatal(1, "NUM_BANKS * INTERLEAVE must not exceed the words of the WRAM!");
+        end
+    end
+
+    generate
+        genvar b;
+        for (b = 0; b < NUM_BANKS; b++) begin : banks
+
+            // Word of the WRAM and its index in this bank, without the bank bits
+            logic [ADDR_WIDTH-1:0] word;
+            logic [BANK_ADDR_WIDTH-1:0] index;
+
+            assign word  = bank_addr[32*b+2+:ADDR_WIDTH];
+            assign index = BANK_ADDR_WIDTH'(((word >> (OFFSET_BITS + BANK_BITS)) << OFFSET_BITS)
+                                            | (word & OFFSET_MASK));
+
+            gf180_ram_32_wrapper
+            #(
+                .ADDR_WIDTH (BANK_ADDR_WIDTH),
+                .INIT_F     ("")
+            )
+            bank
+            (
+            `ifdef USE_POWER_PINS
+                .vdd    (vdd),
+                .vss    (vss),
+            `endif
+                .clk    (clk),
+                .cen    (reset),
+                .gwen   (!bank_wstrb[b]),
+                .wmask  (bank_wmask[4*b+:4]),
+                .addr   (index),
+                .din    (bank_wdata[32*b+:32]),
+                .dout   (bank_rdata[32*b+:32])
+            );
+
+            // No latency
+            assign bank_done[b] = bank_rstrb[b] || bank_wstrb[b];
+        end
+    endgenerate
+
+endmodule
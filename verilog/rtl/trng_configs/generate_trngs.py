@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import json
+import hashlib
+import argparse
 
 configs = [
     {'num_ringos': 1, 'num_inverter': 3, 'size': 70},
@@ -58,6 +62,10 @@ source_code_model = """
 `default_nettype none
 
 module trng_{}x{} (
+`ifdef USE_POWER_PINS
+    inout  vdd,     // Power pins of the netlist, so that the model can be mixed with it
+    inout  vss,
+`endif
     input  clk,     // Sampling clock
     input  trng_en, // Enable all ring oscillators
     output trng_out // Output of the trng
@@ -66,11 +74,26 @@ module trng_{}x{} (
     localparam NUM_OSCILLATORS = {};
     localparam NUM_INVERTER = {};
 
+    // Xorshift32 instead of $random, synthesizable and
+    // identical for every simulator, seeded per configuration
+    localparam logic [31:0] SEED = 32'h2545F491 ^ (NUM_OSCILLATORS << 8) ^ NUM_INVERTER;
+
+    logic [31:0] state = SEED;
+    logic [31:0] state_next;
+
+    always_comb begin
+        state_next = state ^ (state << 13);
+        state_next = state_next ^ (state_next >> 17);
+        state_next = state_next ^ (state_next << 5);
+    end
+
     reg trng_out_d;
 
     always_ff @(posedge clk) begin
-        if (trng_en) trng_out_d <= $random;
-        else trng_out_d <= 1'b0;
+        if (trng_en) begin
+            state <= state_next;
+            trng_out_d <= state_next[31];
+        end else trng_out_d <= 1'b0;
     end
     
     assign trng_out = trng_out_d;
@@ -78,40 +101,6 @@ module trng_{}x{} (
 endmodule
 """
 
-max_width = 2800
-current_x = 300
-current_y = 72
-current_size = 0
-
-margin = 20
-
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    with open(f'trng_{num_ringos}x{num_inverter}.sv', 'w') as writer:
-        writer.write(source_code.format(num_ringos, num_inverter, num_ringos, num_inverter))
-    
-    with open(f'trng_{num_ringos}x{num_inverter}_model.sv', 'w') as writer:
-        writer.write(source_code_model.format(num_ringos, num_inverter, num_ringos, num_inverter))
-    
-    # Fits in current line
-    if current_x + config['size'] + 2*margin <= max_width:
-        print(f'leosoc_i.peripheral_trng_i.trng_{num_ringos}x{num_inverter}_i {current_x + margin} {current_y + margin} N')
-        current_x += config['size'] + 2*margin
-        
-        if current_size < config["size"]:
-            current_size = config["size"]
-    
-    else:
-        current_x = 0
-        current_y += current_size + 2*margin
-        
-        print(f'leosoc_i.peripheral_trng_i.trng_{num_ringos}x{num_inverter}_i {current_x + margin} {current_y + margin} N')
-        current_x += config['size'] + 2*margin
-
 instantiation = """
     trng_{}x{} trng_{}x{}_i (
     `ifdef USE_POWER_PINS
@@ -124,114 +113,8 @@ instantiation = """
     );
 """
 
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(instantiation.format(num_ringos, num_inverter, num_ringos, num_inverter, index, index))
-    index += 1
-
-print('	"VERILOG_FILES": [')
-directory = '		"dir::../../verilog/rtl/trng_configs/trng_{}x{}.sv",'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('	"VERILOG_FILES_BLACKBOX": [')
-directory = '		"dir::../../verilog/gl/trng_{}x{}.v",'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('	"EXTRA_LEFS": [')
-directory = '	    "dir::../../lef/trng_{}x{}.lef",'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('	"EXTRA_GDS_FILES": [')
-directory = '    	"dir::../../gds/trng_{}x{}.gds",'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('	"EXTRA_LIBS": [')
-directory = '	    "dir::../../lib/trng_{}x{}.lib",'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('	"EXTRA_SPEFS": [')
-directory = """		"trng_{}x{}",
-		"dir::../../spef/multicorner/trng_{}x{}.min.spef",
-		"dir::../../spef/multicorner/trng_{}x{}.nom.spef",
-		"dir::../../spef/multicorner/trng_{}x{}.max.spef","""
-
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter, num_ringos, num_inverter, num_ringos, num_inverter, num_ringos, num_inverter))
-    index += 1
-print('	],')
-
-print('Make:')
-directory = 'make trng_{}x{} && \\'
-index = 0
-for config in configs:
-    num_inverter = config['num_inverter']
-    num_ringos   = config['num_ringos']
-
-    assert (num_inverter % 2 != 0)
-    
-    print(directory.format(num_ringos, num_inverter))
-    index += 1
-
-
 # Create Openlane configs
 
-
 config_json = """{{
 	"PDK": "gf180mcuD",
 	"STD_CELL_LIBRARY": "gf180mcu_fd_sc_mcu7t5v0",
@@ -277,17 +160,207 @@ trng_out
 #W
 """
 
-for config in configs:
+# Hashes of the files written by the last run
+MANIFEST = 'manifest.json'
+
+def trng_name(config):
+    return f'trng_{config["num_ringos"]}x{config["num_inverter"]}'
+
+def auto_size(configs, resize_all=False, target_util=None):
+    """Predict the die size of all configs without a size
+
+    The model is fitted on the metrics of previous runs,
+    see size_predictor.py.
+    """
+    if not resize_all and all('size' in config for config in configs):
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import size_predictor
+
+    try:
+        model = size_predictor.SizeModel(size_predictor.load_runs())
+    except ValueError as error:
+        sys.exit(f'Error: can not predict the die size: {error}')
+
+    for config in configs:
+        if resize_all or 'size' not in config:
+            config['size'] = model.size(config['num_ringos'], config['num_inverter'], target_util)
+
+def render_artifacts(config):
+    """Render all generated files of one TRNG in memory
+
+    Returns a dict of path -> (content, hardening), where hardening
+    tells whether the file is an input of the macro hardening.
+    """
     num_inverter = config['num_inverter']
     num_ringos   = config['num_ringos']
     size   = config['size']
 
     assert (num_inverter % 2 != 0)
-    
-    os.makedirs(f'trng_{num_ringos}x{num_inverter}', exist_ok=True)
-    
-    with open(f'trng_{num_ringos}x{num_inverter}/config.json', 'w') as writer:
-        writer.write(config_json.format(num_ringos, num_inverter, num_ringos, num_inverter, size, size))
-    
-    with open(f'trng_{num_ringos}x{num_inverter}/pin_order.cfg', 'w') as writer:
-        writer.write(pin_order)
+
+    name = trng_name(config)
+
+    return {
+        f'{name}.sv': (source_code.format(num_ringos, num_inverter, num_ringos, num_inverter), True),
+        f'{name}_model.sv': (source_code_model.format(num_ringos, num_inverter, num_ringos, num_inverter), False),
+        f'{name}/config.json': (config_json.format(num_ringos, num_inverter, num_ringos, num_inverter, size, size), True),
+        f'{name}/pin_order.cfg': (pin_order, True),
+    }
+
+def file_hash(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as reader:
+        return hashlib.sha256(reader.read()).hexdigest()
+
+def load_manifest():
+    if not os.path.isfile(MANIFEST):
+        return {}
+    with open(MANIFEST, 'r') as reader:
+        return json.load(reader)
+
+def save_manifest(manifest):
+    with open(MANIFEST, 'w') as writer:
+        json.dump(manifest, writer, indent=4, sort_keys=True)
+        writer.write('\n')
+
+def write_artifacts(artifacts, manifest, incremental):
+    """Write the rendered artifacts to disk
+
+    In incremental mode only files whose content changed are written,
+    so the mtime of unchanged files is preserved.
+    Returns True if an input of the macro hardening was written.
+    """
+    dirty = False
+
+    for path, (content, hardening) in artifacts.items():
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        
+        if incremental:
+            on_disk = file_hash(path)
+            
+            if on_disk == digest:
+                manifest[path] = digest
+                continue
+            
+            # The file was changed since we last wrote it
+            if on_disk and path in manifest and manifest[path] != on_disk:
+                print(f'Warning: overwriting manually modified file {path}')
+        
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        with open(path, 'wb') as writer:
+            writer.write(data)
+        
+        manifest[path] = digest
+        
+        if hardening:
+            dirty = True
+
+    return dirty
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the TRNG macros and their OpenLane configs.')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='only write files whose content changed and list the dirty macros')
+    parser.add_argument('--macro-cfg',
+                        help='macro placement file (default: openlane/user_project_wrapper/macro.cfg)')
+    parser.add_argument('--write-macro-cfg', action='store_true',
+                        help='write the placement of the TRNG macros to the macro placement file')
+    parser.add_argument('--auto-size', action='store_true',
+                        help='predict the die size of all macros, not only of the ones without a size')
+    parser.add_argument('--target-util', type=float,
+                        help='target utilisation for predicted die sizes (default: PL_TARGET_DENSITY)')
+    args = parser.parse_args()
+
+    auto_size(configs, args.auto_size, args.target_util)
+
+    manifest = load_manifest()
+    dirty_macros = []
+
+    for config in configs:
+        if write_artifacts(render_artifacts(config), manifest, args.incremental):
+            dirty_macros.append(trng_name(config))
+
+    save_manifest(manifest)
+
+    # Place the macros into the user_project_wrapper
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import macro_placer
+
+    macro_cfg = args.macro_cfg or macro_placer.MACRO_CFG
+    lines, obstacles = macro_placer.read_macro_cfg(macro_cfg)
+    macros = [(trng_name(config), config['size'], config['size']) for config in configs]
+    placement = macro_placer.place(macros, obstacles=obstacles)['placement']
+
+    for name, x, y in placement:
+        print(f'{macro_placer.TRNG_PREFIX}{name}_i {x} {y} N')
+
+    if args.write_macro_cfg:
+        macro_placer.write_macro_cfg(macro_cfg, lines, placement)
+
+    index = 0
+    for config in configs:
+        num_inverter = config['num_inverter']
+        num_ringos   = config['num_ringos']
+
+        print(instantiation.format(num_ringos, num_inverter, num_ringos, num_inverter, index, index))
+        index += 1
+
+    print('	"VERILOG_FILES": [')
+    directory = '		"dir::../../verilog/rtl/trng_configs/trng_{}x{}.sv",'
+    for config in configs:
+        print(directory.format(config['num_ringos'], config['num_inverter']))
+    print('	],')
+
+    print('	"VERILOG_FILES_BLACKBOX": [')
+    directory = '		"dir::../../verilog/gl/trng_{}x{}.v",'
+    for config in configs:
+        print(directory.format(config['num_ringos'], config['num_inverter']))
+    print('	],')
+
+    print('	"EXTRA_LEFS": [')
+    directory = '	    "dir::../../lef/trng_{}x{}.lef",'
+    for config in configs:
+        print(directory.format(config['num_ringos'], config['num_inverter']))
+    print('	],')
+
+    print('	"EXTRA_GDS_FILES": [')
+    directory = '    	"dir::../../gds/trng_{}x{}.gds",'
+    for config in configs:
+        print(directory.format(config['num_ringos'], config['num_inverter']))
+    print('	],')
+
+    print('	"EXTRA_LIBS": [')
+    directory = '	    "dir::../../lib/trng_{}x{}.lib",'
+    for config in configs:
+        print(directory.format(config['num_ringos'], config['num_inverter']))
+    print('	],')
+
+    print('	"EXTRA_SPEFS": [')
+    directory = """		"trng_{}x{}",
+		"dir::../../spef/multicorner/trng_{}x{}.min.spef",
+		"dir::../../spef/multicorner/trng_{}x{}.nom.spef",
+		"dir::../../spef/multicorner/trng_{}x{}.max.spef","""
+    for config in configs:
+        num_inverter = config['num_inverter']
+        num_ringos   = config['num_ringos']
+        print(directory.format(num_ringos, num_inverter, num_ringos, num_inverter, num_ringos, num_inverter, num_ringos, num_inverter))
+    print('	],')
+
+    # In incremental mode only the macros with changed inputs need to be hardened again
+    print('Make:')
+    directory = 'make {} && \\'
+    for config in configs:
+        if args.incremental and trng_name(config) not in dirty_macros:
+            continue
+        print(directory.format(trng_name(config)))
+
+    if args.incremental:
+        print(f'Dirty: {len(dirty_macros)} / {len(configs)}')
+
+if __name__ == '__main__':
+    main()
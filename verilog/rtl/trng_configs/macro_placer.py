@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Place the TRNG macros as compact as possible
+
+Several packing strategies (skyline, MaxRects and guillotine) are tried
+with different macro orders and strip widths. The layout with the
+smallest bounding box wins. Macros that are already placed in macro.cfg
+(e.g. the SRAMs) are treated as obstacles and are never overlapped.
+
+All coordinates are in µm and rounded to integers. The macros are
+packed with the footprint of their orientation, E and W (also flipped)
+swap width and height.
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OPENLANE_DIR = os.path.join(SCRIPT_DIR, '../../../openlane')
+MACRO_CFG = os.path.join(OPENLANE_DIR, 'user_project_wrapper/macro.cfg')
+
+# Prefix of the TRNG instances in macro.cfg
+TRNG_PREFIX = 'leosoc_i.peripheral_trng_i.'
+
+# Block of the fixed macros, needed to get their size
+FIXED_MACROS = {
+    r'sram512x8_i\d$': 'gf180_ram_512x8_wrapper'
+}
+
+# Placement region, same as the previous shelf packer
+REGION = (0, 72, 2800, 2968)
+
+# Keep out around each macro
+HALO = 20
+
+# Orientations of macro.cfg, these are rotated by 90°
+ORIENTATIONS = ['N', 'S', 'E', 'W', 'FN', 'FS', 'FE', 'FW']
+ROTATED = {'E', 'W', 'FE', 'FW'}
+
+def footprint(w, h, orientation):
+    """Width and height of a macro placed with this orientation"""
+    return (h, w) if orientation in ROTATED else (w, h)
+
+class Rect:
+
+    def __init__(self, x, y, w, h):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+
+    @property
+    def right(self):
+        return self.x + self.w
+
+    @property
+    def top(self):
+        return self.y + self.h
+
+    def overlaps(self, other):
+        return (self.x < other.right and other.x < self.right and
+                self.y < other.top and other.y < self.top)
+
+    def contains(self, other):
+        return (self.x <= other.x and other.right <= self.right and
+                self.y <= other.y and other.top <= self.top)
+
+    def __repr__(self):
+        return f'Rect({self.x}, {self.y}, {self.w}, {self.h})'
+
+def block_size(block):
+    """Width and height of a hardened block from its DIE_AREA"""
+    with open(os.path.join(OPENLANE_DIR, block, 'config.json')) as reader:
+        config = json.load(reader)
+    x0, y0, x1, y1 = (float(value) for value in config['DIE_AREA'].split())
+    return x1 - x0, y1 - y0
+
+def read_macro_cfg(path):
+    """Return all lines and the obstacles of the fixed macros"""
+    with open(path) as reader:
+        lines = reader.read().splitlines()
+
+    obstacles = []
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith(TRNG_PREFIX):
+            continue
+
+        instance, x, y, orientation = fields
+        for pattern, block in FIXED_MACROS.items():
+            if re.search(pattern, instance):
+                w, h = block_size(block)
+                break
+        else:
+            sys.exit(f'Error: unknown macro {instance} in {path}')
+
+        w, h = footprint(w, h, orientation)
+
+        obstacles.append(Rect(math.floor(float(x)), math.floor(float(y)),
+                              math.ceil(float(x) + w) - math.floor(float(x)),
+                              math.ceil(float(y) + h) - math.floor(float(y))))
+
+    return lines, obstacles
+
+def write_macro_cfg(path, lines, placement, orientation='N'):
+    """Replace the TRNG placements in macro.cfg"""
+    lines = [line for line in lines if not line.startswith(TRNG_PREFIX)]
+    while lines and not lines[-1].strip():
+        lines.pop()
+    lines.append('')
+
+    for name, x, y in placement:
+        lines.append(f'{TRNG_PREFIX}{name}_i {x} {y} {orientation}')
+
+    with open(path, 'w') as writer:
+        writer.write('\n'.join(lines) + '\n')
+
+def inflate(rect, halo):
+    return Rect(rect.x - halo, rect.y - halo, rect.w + 2*halo, rect.h + 2*halo)
+
+def subtract(free, used):
+    """Split a free rectangle into the maximal rectangles around used"""
+    if not free.overlaps(used):
+        return [free]
+
+    result = []
+    if used.x > free.x:
+        result.append(Rect(free.x, free.y, used.x - free.x, free.h))
+    if used.right < free.right:
+        result.append(Rect(used.right, free.y, free.right - used.right, free.h))
+    if used.y > free.y:
+        result.append(Rect(free.x, free.y, free.w, used.y - free.y))
+    if used.top < free.top:
+        result.append(Rect(free.x, used.top, free.w, free.top - used.top))
+    return result
+
+def prune(rects):
+    """Remove rectangles that are contained in another one"""
+    result = []
+    for i, rect in enumerate(rects):
+        if not any(j != i and other.contains(rect) and (not rect.contains(other) or j < i)
+                   for j, other in enumerate(rects)):
+            result.append(rect)
+    return result
+
+def skyline(items, bin, obstacles):
+    """Bottom-left skyline packing"""
+    # Segments of the skyline as [x, y, width]
+    segments = [[bin.x, bin.y, bin.w]]
+    placed = []
+
+    for name, w, h in items:
+        best = None
+        for segment in segments:
+            x = segment[0]
+            if x + w > bin.right:
+                break
+
+            y = max(s[1] for s in segments if s[0] < x + w and s[0] + s[2] > x)
+
+            # Move up until no obstacle is hit
+            candidate = Rect(x, y, w, h)
+            hits = [o for o in obstacles if candidate.overlaps(o)]
+            while hits:
+                candidate.y = max(o.top for o in hits)
+                hits = [o for o in obstacles if candidate.overlaps(o)]
+
+            if candidate.top <= bin.top and (best is None or (candidate.top, x) < (best.top, best.x)):
+                best = candidate
+
+        if best is None:
+            return None
+        placed.append((name, best))
+
+        # Raise the skyline below the new macro
+        new_segments = []
+        for x, y, width in segments:
+            if x < best.x:
+                new_segments.append([x, y, min(width, best.x - x)])
+            if x + width > best.right:
+                start = max(x, best.right)
+                new_segments.append([start, y, x + width - start])
+        new_segments.append([best.x, best.top, best.w])
+        new_segments.sort()
+
+        # Merge segments of the same height
+        segments = []
+        for segment in new_segments:
+            if segments and segments[-1][1] == segment[1] and segments[-1][0] + segments[-1][2] == segment[0]:
+                segments[-1][2] += segment[2]
+            else:
+                segments.append(segment)
+
+    return placed
+
+def maxrects(items, bin, obstacles):
+    """MaxRects packing with the bottom-left rule"""
+    free = [bin]
+    for obstacle in obstacles:
+        free = prune([part for rect in free for part in subtract(rect, obstacle)])
+    placed = []
+
+    for name, w, h in items:
+        best = None
+        for rect in free:
+            if w <= rect.w and h <= rect.h:
+                candidate = Rect(rect.x, rect.y, w, h)
+                if best is None or (candidate.top, candidate.x) < (best.top, best.x):
+                    best = candidate
+
+        if best is None:
+            return None
+        placed.append((name, best))
+        free = prune([part for rect in free for part in subtract(rect, best)])
+
+    return placed
+
+def guillotine(items, bin, obstacles):
+    """Guillotine packing, best area fit, split along the shorter leftover axis"""
+    # The free rectangles of a guillotine packer must be disjoint,
+    # so cut the bin into horizontal bands at the obstacle edges
+    edges = sorted({bin.y, bin.top} | {min(max(y, bin.y), bin.top) for o in obstacles for y in (o.y, o.top)})
+    free = []
+    for y0, y1 in zip(edges, edges[1:]):
+        band = Rect(bin.x, y0, bin.w, y1 - y0)
+        blocked = sorted((o.x, o.right) for o in obstacles if o.overlaps(band))
+        x = bin.x
+        for start, end in blocked + [(bin.right, bin.right)]:
+            if start > x:
+                free.append(Rect(x, y0, start - x, y1 - y0))
+            x = max(x, end)
+    placed = []
+
+    for name, w, h in items:
+        best = None
+        for rect in free:
+            if w <= rect.w and h <= rect.h:
+                score = (rect.w * rect.h - w * h, rect.y, rect.x)
+                if best is None or score < best[0]:
+                    best = (score, rect)
+
+        if best is None:
+            return None
+        rect = best[1]
+        used = Rect(rect.x, rect.y, w, h)
+        placed.append((name, used))
+        free.remove(rect)
+
+        leftover_w = rect.w - w
+        leftover_h = rect.h - h
+        if leftover_w < leftover_h:
+            # Split horizontally
+            right = Rect(used.right, rect.y, leftover_w, h)
+            above = Rect(rect.x, used.top, rect.w, leftover_h)
+        else:
+            # Split vertically
+            right = Rect(used.right, rect.y, leftover_w, rect.h)
+            above = Rect(rect.x, used.top, w, leftover_h)
+        free.extend(r for r in (right, above) if r.w > 0 and r.h > 0)
+
+    return placed
+
+def shelf(items, bin, obstacles):
+    """The previous shelf packer of generate_trngs.py, for comparison"""
+    current_x = 300
+    current_y = bin.y
+    current_size = 0
+    placed = []
+
+    for name, w, h in items:
+        if current_x + w > bin.right:
+            current_x = bin.x
+            current_y += current_size
+        placed.append((name, Rect(current_x, current_y, w, h)))
+        current_x += w
+        current_size = max(current_size, h)
+
+    return placed
+
+STRATEGIES = {
+    'skyline': skyline,
+    'maxrects': maxrects,
+    'guillotine': guillotine
+}
+
+ORDERS = {
+    'height': lambda item: (-item[2], -item[1]),
+    'width': lambda item: (-item[1], -item[2]),
+    'area': lambda item: -item[1] * item[2],
+    'perimeter': lambda item: -(item[1] + item[2])
+}
+
+def bounding_box(placed):
+    x0 = min(rect.x for _, rect in placed)
+    y0 = min(rect.y for _, rect in placed)
+    x1 = max(rect.right for _, rect in placed)
+    y1 = max(rect.top for _, rect in placed)
+    return Rect(x0, y0, x1 - x0, y1 - y0)
+
+def is_legal(placed, region, obstacles):
+    rects = [rect for _, rect in placed]
+    for i, rect in enumerate(rects):
+        if not region.contains(rect):
+            return False
+        if any(rect.overlaps(o) for o in obstacles):
+            return False
+        if any(rect.overlaps(other) for other in rects[i+1:]):
+            return False
+    return True
+
+def place_strategy(strategy, macros, region=REGION, obstacles=(), halo=HALO, orientation='N'):
+    """Best legal layout of one strategy
+
+    macros is a list of (name, width, height) as drawn (N), the result a
+    dict with the placement as (name, x, y) of the lower left corner of
+    the macros placed with the orientation.
+    """
+    region = Rect(region[0], region[1], region[2] - region[0], region[3] - region[1])
+    # The footprint of a macro includes the halo on all sides, obstacles
+    # are inflated too so the halos of neighbouring macros do not overlap
+    items = [(name, *(math.ceil(side) + 2*halo for side in footprint(w, h, orientation)))
+             for name, w, h in macros]
+    obstacles = [inflate(o, halo) for o in obstacles]
+
+    if strategy == 'shelf':
+        candidates = [(None, None, shelf(items, region, obstacles))]
+    else:
+        # Try strip widths between the widest macro and the full region
+        total_area = sum(w * h for _, w, h in items)
+        widest = max(w for _, w, _ in items)
+        widths = {region.w}
+        for factor in range(6, 31):
+            widths.add(min(region.w, max(widest, int(math.sqrt(total_area) * factor / 10))))
+
+        candidates = []
+        for order_name, order in ORDERS.items():
+            ordered = sorted(items, key=order)
+            for width in sorted(widths):
+                bin = Rect(region.x, region.y, width, region.h)
+                candidates.append((order_name, width, STRATEGIES[strategy](ordered, bin, obstacles)))
+
+    best = None
+    for order_name, width, placed in candidates:
+        if placed is None or not is_legal(placed, region, obstacles):
+            continue
+        box = bounding_box(placed)
+        area = box.w * box.h
+        if best is None or area < best['bbox_area']:
+            best = {
+                'strategy': strategy,
+                'order': order_name,
+                'width': width,
+                'bbox': box,
+                'bbox_area': area,
+                'placement': [(name, rect.x + halo, rect.y + halo) for name, rect in placed]
+            }
+
+    if best is None:
+        return None
+
+    # Order the placement like the macros
+    position = {name: index for index, (name, _, _) in enumerate(macros)}
+    best['placement'].sort(key=lambda entry: position[entry[0]])
+    best['utilisation'] = sum(w * h for _, w, h in macros) / best['bbox_area']
+    return best
+
+def place(macros, region=REGION, obstacles=(), halo=HALO, orientation='N', verbose=False):
+    """Try all strategies and return the most compact legal layout"""
+    best = None
+    for strategy in STRATEGIES:
+        result = place_strategy(strategy, macros, region, obstacles, halo, orientation)
+        if verbose:
+            if result:
+                print(f'{strategy}: {result["bbox"].w} x {result["bbox"].h} µm, '
+                      f'utilisation {result["utilisation"]*100:.1f}%')
+            else:
+                print(f'{strategy}: no legal layout')
+        if result and (best is None or result['bbox_area'] < best['bbox_area']):
+            best = result
+
+    if best is None:
+        sys.exit('Error: the macros do not fit into the region')
+    return best
+
+def trng_macros():
+    sys.path.insert(0, SCRIPT_DIR)
+    import generate_trngs
+    generate_trngs.auto_size(generate_trngs.configs)
+    return [(generate_trngs.trng_name(config), config['size'], config['size'])
+            for config in generate_trngs.configs]
+
+def benchmark(macros, obstacles, halo, orientation='N'):
+    print(f'{"strategy":<12}{"bbox [µm]":>16}{"area [mm²]":>12}{"util":>8}{"legal":>7}{"time [ms]":>11}')
+    for strategy in ['shelf'] + list(STRATEGIES):
+        start = time.perf_counter()
+        result = place_strategy(strategy, macros, obstacles=obstacles, halo=halo, orientation=orientation)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if result is None:
+            # The shelf packer does not check for obstacles
+            region = Rect(REGION[0], REGION[1], REGION[2] - REGION[0], REGION[3] - REGION[1])
+            items = [(name, *(math.ceil(side) + 2*halo for side in footprint(w, h, orientation)))
+                     for name, w, h in macros]
+            placed = shelf(items, region, [])
+            box = bounding_box(placed)
+            util = sum(w * h for _, w, h in macros) / (box.w * box.h)
+            print(f'{strategy:<12}{f"{box.w} x {box.h}":>16}{box.w*box.h/1e6:>12.3f}{util*100:>7.1f}%{"no":>7}{elapsed:>11.1f}')
+            continue
+
+        box = result['bbox']
+        print(f'{strategy:<12}{f"{box.w} x {box.h}":>16}{result["bbox_area"]/1e6:>12.3f}'
+              f'{result["utilisation"]*100:>7.1f}%{"yes":>7}{elapsed:>11.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Place the TRNG macros into macro.cfg.')
+    parser.add_argument('--macro-cfg', default=MACRO_CFG, help='macro placement file')
+    parser.add_argument('--halo', type=int, default=HALO, help='keep out around each macro in µm')
+    parser.add_argument('--orientation', default='N', choices=ORIENTATIONS, help='orientation of the TRNG macros')
+    parser.add_argument('--write', action='store_true', help='write the placement to macro.cfg')
+    parser.add_argument('--benchmark', action='store_true', help='compare against the previous shelf packer')
+    args = parser.parse_args()
+
+    lines, obstacles = read_macro_cfg(args.macro_cfg)
+    macros = trng_macros()
+
+    if args.benchmark:
+        benchmark(macros, obstacles, args.halo, args.orientation)
+        return
+
+    result = place(macros, obstacles=obstacles, halo=args.halo, orientation=args.orientation, verbose=True)
+    print(f'Using {result["strategy"]} ({result["order"]} first, strip width {result["width"]} µm)')
+
+    for name, x, y in result['placement']:
+        print(f'{TRNG_PREFIX}{name}_i {x} {y} {args.orientation}')
+
+    if args.write:
+        write_macro_cfg(args.macro_cfg, lines, result['placement'], args.orientation)
+
+if __name__ == '__main__':
+    main()
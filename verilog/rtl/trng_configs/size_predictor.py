@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2023 Leo Moser <https://codeberg.org/mole99>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Predict the die size of a TRNG macro
+
+The metrics.csv of previous hardening runs are used to fit the number
+of cells and the standard cell area against the number of ring
+oscillators R and the total number of inverters R*I:
+
+    cells     = c0 + c1 * R*I + c2 * R
+    cell_area = a0 + a1 * R*I + a2 * R
+
+The core area needed for a target utilisation is cell_area / target,
+the die additionally includes the margin between die and core that
+was observed in the previous runs.
+"""
+
+import os
+import re
+import csv
+import sys
+import glob
+import math
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(SCRIPT_DIR, '../../..')
+
+METRICS = [
+    os.path.join(PROJECT_DIR, 'signoff/trng_*/metrics.csv'),
+    os.path.join(PROJECT_DIR, 'openlane/trng_*/runs/*/reports/metrics.csv')
+]
+
+# The pins on the north side need some space
+MIN_SIZE = 70
+
+# Sizes are rounded up to this grid
+SIZE_STEP = 5
+
+def load_runs(patterns=METRICS):
+    """Read all successful TRNG runs as a list of dicts"""
+    runs = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, newline='') as reader:
+                for row in csv.DictReader(reader):
+                    match = re.fullmatch(r'trng_(\d+)x(\d+)', row.get('design_name', ''))
+                    if not match or row.get('flow_status') != 'flow completed':
+                        continue
+
+                    # Final_Util is -1 if it was not reported
+                    util = float(row['Final_Util'])
+                    if util <= 0:
+                        util = float(row['OpenDP_Util'])
+
+                    die_area = float(row['DIEAREA_mm^2']) * 1e6
+                    core_area = float(row['CoreArea_um^2'])
+
+                    runs.append({
+                        'path': path,
+                        'num_ringos': int(match.group(1)),
+                        'num_inverter': int(match.group(2)),
+                        'cells': int(row['synth_cell_count']),
+                        'cell_area': util / 100 * core_area,
+                        'die_area': die_area,
+                        'core_area': core_area,
+                        'density': float(row['PL_TARGET_DENSITY'])
+                    })
+    return runs
+
+def least_squares(rows, values):
+    """Solve the normal equations for a small number of parameters"""
+    n = len(rows[0])
+    a = [[sum(row[i] * row[j] for row in rows) for j in range(n)] for i in range(n)]
+    b = [sum(row[i] * value for row, value in zip(rows, values)) for i in range(n)]
+
+    # Gaussian elimination with partial pivoting
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda r: abs(a[r][column]))
+        if abs(a[pivot][column]) < 1e-12:
+            raise ValueError('not enough distinct TRNG configurations to fit the model')
+        a[column], a[pivot] = a[pivot], a[column]
+        b[column], b[pivot] = b[pivot], b[column]
+        for r in range(column + 1, n):
+            factor = a[r][column] / a[column][column]
+            for c in range(column, n):
+                a[r][c] -= factor * a[column][c]
+            b[r] -= factor * b[column]
+
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (b[r] - sum(a[r][c] * x[c] for c in range(r + 1, n))) / a[r][r]
+    return x
+
+def features(num_ringos, num_inverter):
+    return [1.0, num_ringos * num_inverter, num_ringos]
+
+class SizeModel:
+
+    def __init__(self, runs):
+        if len(runs) < 3:
+            raise ValueError(f'need at least 3 previous runs, found {len(runs)}')
+
+        rows = [features(run['num_ringos'], run['num_inverter']) for run in runs]
+        self.cells_coefficients = least_squares(rows, [run['cells'] for run in runs])
+        self.area_coefficients = least_squares(rows, [run['cell_area'] for run in runs])
+
+        # Distance between die and core on each side
+        self.margin = max((math.sqrt(run['die_area']) - math.sqrt(run['core_area'])) / 2 for run in runs)
+
+        # Utilisation reached by the previous runs
+        self.density = min(run['density'] for run in runs)
+
+        self.runs = runs
+
+    def cells(self, num_ringos, num_inverter):
+        return sum(c * f for c, f in zip(self.cells_coefficients, features(num_ringos, num_inverter)))
+
+    def cell_area(self, num_ringos, num_inverter):
+        return sum(c * f for c, f in zip(self.area_coefficients, features(num_ringos, num_inverter)))
+
+    def size(self, num_ringos, num_inverter, target_util=None):
+        """Side length of a square die in µm"""
+        target_util = target_util or self.density
+        core = math.sqrt(max(self.cell_area(num_ringos, num_inverter), 0) / target_util)
+        size = max(core + 2 * self.margin, MIN_SIZE)
+        return int(math.ceil(size / SIZE_STEP) * SIZE_STEP)
+
+    def residuals(self):
+        """Relative error of the fit for each previous run"""
+        return [(run, self.cell_area(run['num_ringos'], run['num_inverter']) / run['cell_area'] - 1)
+                for run in self.runs]
+
+def main():
+    sys.path.insert(0, SCRIPT_DIR)
+    import generate_trngs
+
+    parser = argparse.ArgumentParser(description='Predict the die size of TRNG macros from previous runs.')
+    parser.add_argument('metrics', nargs='*', default=METRICS,
+                        help='metrics.csv files or glob patterns (default: signoff and openlane runs)')
+    parser.add_argument('-u', '--target-util', type=float,
+                        help='target utilisation of the core area (default: PL_TARGET_DENSITY of the runs)')
+    parser.add_argument('-p', '--point', type=int, nargs=2, action='append', metavar=('RINGOS', 'INVERTER'),
+                        help='additionally predict this configuration')
+    args = parser.parse_args()
+
+    try:
+        model = SizeModel(load_runs(args.metrics))
+    except ValueError as error:
+        sys.exit(f'Error: {error}')
+
+    print(f'cells     = {model.cells_coefficients[0]:.1f} + {model.cells_coefficients[1]:.2f} * R*I + {model.cells_coefficients[2]:.2f} * R')
+    print(f'cell_area = {model.area_coefficients[0]:.1f} + {model.area_coefficients[1]:.2f} * R*I + {model.area_coefficients[2]:.2f} * R µm²')
+    print(f'die margin {model.margin:.1f} µm, target utilisation {args.target_util or model.density:.2f}')
+
+    for run, error in model.residuals():
+        print(f'trng_{run["num_ringos"]}x{run["num_inverter"]}: fit error {error*100:+.1f}%')
+
+    points = [(config['num_ringos'], config['num_inverter'], config.get('size')) for config in generate_trngs.configs]
+    points += [(num_ringos, num_inverter, None) for num_ringos, num_inverter in args.point or []]
+
+    print(f'{"macro":<12}{"cells":>8}{"size":>6}{"predicted":>11}')
+    for num_ringos, num_inverter, size in points:
+        print(f'{f"trng_{num_ringos}x{num_inverter}":<12}{model.cells(num_ringos, num_inverter):>8.0f}'
+              f'{size if size else "-":>6}{model.size(num_ringos, num_inverter, args.target_util):>11}')
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,10 @@
 `default_nettype none
 
 module trng_128x7 (
+`ifdef USE_POWER_PINS
+    inout  vdd,     // Power pins of the netlist, so that the model can be mixed with it
+    inout  vss,
+`endif
     input  clk,     // Sampling clock
     input  trng_en, // Enable all ring oscillators
     output trng_out // Output of the trng
@@ -13,11 +17,26 @@ module trng_128x7 (
     localparam NUM_OSCILLATORS = 128;
     localparam NUM_INVERTER = 7;
 
+    // Xorshift32 instead of $random, synthesizable and
+    // identical for every simulator, seeded per configuration
+    localparam logic [31:0] SEED = 32'h2545F491 ^ (NUM_OSCILLATORS << 8) ^ NUM_INVERTER;
+
+    logic [31:0] state = SEED;
+    logic [31:0] state_next;
+
+    always_comb begin
+        state_next = state ^ (state << 13);
+        state_next = state_next ^ (state_next >> 17);
+        state_next = state_next ^ (state_next << 5);
+    end
+
     reg trng_out_d;
 
     always_ff @(posedge clk) begin
-        if (trng_en) trng_out_d <= $random;
-        else trng_out_d <= 1'b0;
+        if (trng_en) begin
+            state <= state_next;
+            trng_out_d <= state_next[31];
+        end else trng_out_d <= 1'b0;
     end
     
     assign trng_out = trng_out_d;
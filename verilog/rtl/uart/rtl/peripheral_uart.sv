@@ -21,7 +21,9 @@ module peripheral_uart #(
     output logic         select,
 
     input  logic         uart_rx,
-    output logic         uart_tx
+    output logic         uart_tx,
+
+    output logic         tx_start   // pulse, a byte is sent
 );
     localparam ADDRESS_LENGTH = 32'h00000010; // Multiple of 2
     localparam ADDRESS_MASK_UPPER = ~(ADDRESS_LENGTH - 1);
@@ -47,7 +49,7 @@ module peripheral_uart #(
         if (select && mem_rstrb) begin
             case (address)
                 32'h00: mem_rdata <= {{30{1'b0}}, tx_busy, rx_flag};
-                32'h04: mem_rdata <= rx_data_d;
+                32'h04: mem_rdata <= {{24{1'b0}}, rx_data_d};
                 32'h08: mem_rdata <= '0;
                 32'h0C: mem_rdata <= {{16{1'b0}}, wait_cycles};
             endcase
@@ -131,6 +133,8 @@ module peripheral_uart #(
 
     logic tx_busy;
 
+    assign tx_start = select && mem_wstrb && address == 32'h08 && !tx_busy;
+
     uart_tx uart_tx_i (
         .clk    (clk_i),
         .rst    (!rst_ni),
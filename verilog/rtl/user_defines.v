@@ -51,8 +51,8 @@
 // the management SoC to run a startup program to configure the GPIOs.
 
 `define USER_CONFIG_GPIO_5_INIT  `GPIO_MODE_USER_STD_OUTPUT
-`define USER_CONFIG_GPIO_6_INIT  `GPIO_MODE_USER_STD_OUTPUT
-`define USER_CONFIG_GPIO_7_INIT  `GPIO_MODE_USER_STD_INPUT_NOPULL
+`define USER_CONFIG_GPIO_6_INIT  `GPIO_MODE_USER_STD_BIDIRECTIONAL  // flash io0 and io1, oe set by leosoc
+`define USER_CONFIG_GPIO_7_INIT  `GPIO_MODE_USER_STD_BIDIRECTIONAL
 `define USER_CONFIG_GPIO_8_INIT  `GPIO_MODE_USER_STD_OUTPUT
 `define USER_CONFIG_GPIO_9_INIT  `GPIO_MODE_USER_STD_INPUT_NOPULL
 `define USER_CONFIG_GPIO_10_INIT `GPIO_MODE_USER_STD_OUTPUT
@@ -86,8 +86,21 @@ assign io_oeb[4:0] = 5'b11111;
 
 // SPI
 
+`ifdef SPI_FLASH_MULTI_IO
+// io0 and io1 of the flash are bidirectional for the dual and quad reads,
+// io2 and io3 are on GPIO 22 and 23 in the quad modes
+
+wire [1:0] flash_io_out;
+wire [1:0] flash_io_oe;
+
+assign io_oeb[5] = 1'b0;
+assign io_oeb[8] = 1'b0;
+assign io_oeb[7:6] = ~flash_io_oe;
+assign io_out[7:6] =  flash_io_out;
+`else
 assign io_oeb[8:5] = 4'b0100;
 assign io_out[7] = 1'b0;
+`endif
 
 // UART0
 
@@ -113,7 +126,26 @@ assign io_oeb[37:14] = ~gpio0_oe[23:0];
 assign io_out[37:14] =  gpio0_out[23:0];
 assign gpio0_in = {8'b00000000, io_in[37:14]};
 
+// Instruction cache geometry of both cores, flash read mode, interconnect,
+// WRAM banks and performance counters, set by tb_toplevel.py; the defaults
+// of leosoc.sv have the ports of the taped-out leosoc macro, not its logic
+`ifdef LEOSOC_PARAMETERS
+leosoc #(
+    .INSTR_CACHE_SIZE       (`INSTR_CACHE_SIZE),
+    .INSTR_CACHE_LINE_WORDS (`INSTR_CACHE_LINE_WORDS),
+    .INSTR_CACHE_WAYS       (`INSTR_CACHE_WAYS),
+    .SPI_FLASH_READ_MODE    (`SPI_FLASH_READ_MODE),
+    .SPI_FLASH_DUMMY_CYCLES (`SPI_FLASH_DUMMY_CYCLES),
+    .SPI_FLASH_CONTINUOUS_READ (`SPI_FLASH_CONTINUOUS_READ),
+    .INTERCONNECT           (`INTERCONNECT),
+    .ARBITER                (`ARBITER),
+    .WRAM_BANKS             (`WRAM_BANKS),
+    .WRAM_INTERLEAVE        (`WRAM_INTERLEAVE),
+    .PERF_COUNTERS          (`PERF_COUNTERS)
+) leosoc_i (
+`else
 leosoc leosoc_i (
+`endif
 `ifdef USE_POWER_PINS
 	.vdd(vdd),	// User area 1 1.8V power
 	.vss(vss),	// User area 1 digital ground
@@ -135,9 +167,16 @@ leosoc leosoc_i (
     
     // SPI signals
     .sck        (io_out[5]),
+`ifdef SPI_FLASH_MULTI_IO
+    .cs         (io_out[8]),
+    .flash_io_out (flash_io_out),
+    .flash_io_oe  (flash_io_oe),
+    .flash_io_in  (io_in[7:6])
+`else
     .sdo        (io_out[6]),
     .sdi        (io_in[7]),
     .cs         (io_out[8])
+`endif
 );
 
 endmodule	// user_project_wrapper